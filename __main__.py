@@ -0,0 +1,13 @@
+"""
+python -m wallow 的入口，参见 utils/cli.py
+"""
+
+import os
+import sys
+
+# 编解码器和滤镜以顶层模块 (formats、filters、core) 导入
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from .utils.cli import main  # noqa: E402
+
+sys.exit(main())
@@ -1,4 +1,6 @@
 from abc import ABC, abstractmethod
+from functools import lru_cache
+from operator import itemgetter
 import struct
 import tkinter as tk
 
@@ -15,21 +17,266 @@ class ImageProcessor(ABC):
 
 
 class WallowImage(ImageProcessor):
+    _source = None  # 延迟解码时的 (编解码器, 文件路径)
+    orientation = 1  # 文件中的EXIF方向标签，auto_orient 据此校正
+    _planes = None  # 平面存储时每个通道一个连续平面，此时 _pixels 为None
+
     def apply_operation(self, operation: str, **params) -> 'WallowImage':
         self._operation_stack.append((operation, params))
         return self
 
     def __init__(self, pixel_data, color_mode, dimensions):
-        self._pixel_data = bytearray(pixel_data)
+        self._pixels = bytearray(pixel_data)
         self.color_mode = color_mode
         self.width, self.height = dimensions
         self._operation_stack = []
+        self._data_version = 0
+        self._stats_cache = {}
+        self._tk_cache = {}
+        self._lent = {}  # id -> 被 get_channel 借出的缓冲区，不能归还缓冲池
+
+    @property
+    def _pixel_data(self):
+        # 平面存储的图像在需要交错数据时才合并；延迟打开的图像在第一次访问像素时才完整解码
+        if self._pixels is None:
+            if self._planes is not None:
+                self._interleave()
+            else:
+                self._load()
+        return self._pixels
+
+    @_pixel_data.setter
+    def _pixel_data(self, buffer):
+        self._release_planes()
+        self._pixels = buffer
+
+    def _load(self):
+        codec, file_path = self._source
+        decoded = codec.decode(file_path)
+        self._pixels = decoded._pixels
+        self.orientation = decoded.orientation
+        self.color_mode = decoded.color_mode
+        self.width, self.height = decoded.width, decoded.height
+
+    def _mark_modified(self):
+        """就地修改像素数据后调用，使基于像素内容的缓存失效"""
+        self._data_version += 1
+        self._stats_cache.clear()
+        self._tk_cache.clear()
 
     @classmethod
-    def open(cls, file_path):
+    def _from_buffer(cls, buffer, color_mode, dimensions):
+        """直接接管bytearray作为像素数据，不复制"""
+        image = cls(b'', color_mode, dimensions)
+        image._pixel_data = buffer
+        return image
+
+    def close(self):
+        """将像素缓冲区归还缓冲池，之后不能再使用该图像"""
+        if self._pixels is not None:
+            self._give_back(self._pixels)
+        self._release_planes()
+        self._pixels = bytearray()
+        self._mark_modified()
+
+    @property
+    def planar(self):
+        """像素是否按通道平面存储"""
+        return self._planes is not None
+
+    def to_planar(self):
+        """
+        将像素转为平面存储：每个通道一个连续平面
+
+        之后的逐通道操作 (get_channel、apply_channel_lut、split_channels) 只访问
+        对应通道的连续内存。编解码和操作栈需要交错数据时，在使用前一次性合并回交错存储。
+        """
+        if self._planes is not None:
+            return self
+        from utils.pool import get_buffer_pool
+        pool = get_buffer_pool()
+        data = self._pixel_data
+        channels = len(self.color_mode)
+        if channels == 1:
+            planes = [data]
+        else:
+            view = memoryview(data)
+            planes = []
+            for c in range(channels):
+                plane = pool.acquire(len(data) // channels)
+                plane[:] = view[c::channels]
+                planes.append(plane)
+            view.release()
+            self._give_back(data)
+        self._planes = planes
+        self._pixels = None
+        return self
+
+    def _interleave(self):
+        from utils.pool import get_buffer_pool
+        planes = self._planes
+        if len(planes) == 1 and isinstance(planes[0], bytearray):
+            data = planes[0]
+        else:
+            channels = len(planes)
+            data = get_buffer_pool().acquire(self.width * self.height * channels)
+            for c, plane in enumerate(planes):
+                data[c::channels] = plane
+            self._release_planes()
+        self._planes = None
+        self._pixels = data
+
+    def _release_planes(self):
+        # 只归还自己持有的平面，借用的视图 (memoryview) 直接丢弃
+        if self._planes is not None:
+            for plane in self._planes:
+                if isinstance(plane, bytearray):
+                    self._give_back(plane)
+            self._planes = None
+
+    def _give_back(self, buffer):
+        """不再使用buffer：归还缓冲池，已借出的缓冲区只丢弃引用，由借用方继续持有"""
+        from utils.pool import get_buffer_pool
+        if self._lent.pop(id(buffer), None) is None:
+            get_buffer_pool().release(buffer)
+
+    def _channel_index(self, channel):
+        if isinstance(channel, int):
+            if not 0 <= channel < len(self.color_mode):
+                raise ValueError(f"No channel {channel} in mode {self.color_mode}")
+            return channel
+        index = self.color_mode.upper().find(channel.upper())
+        if len(channel) != 1 or index < 0:
+            raise ValueError(f"No channel {channel!r} in mode {self.color_mode}")
+        return index
+
+    def get_channel(self, channel):
+        """
+        返回一个通道的只读视图，不复制像素
+
+        视图对应存储的像素，不执行操作栈。平面存储时为连续内存，交错存储时为
+        步长等于通道数的视图。借出的缓冲区不再归还缓冲池，存储布局改变或图像关闭后
+        视图仍保持借出时的内容；之后对图像的逐通道修改不会影响视图。
+
+        参数:
+            channel: 通道名 (如 'A'，不区分大小写) 或序号
+
+        返回:
+            memoryview
+        """
+        index = self._channel_index(channel)
+        if self._planes is not None:
+            buffer = self._planes[index]
+            view = memoryview(buffer)
+        else:
+            buffer = self._pixel_data
+            view = memoryview(buffer)[index::len(self.color_mode)]
+        if isinstance(buffer, bytearray):
+            self._lent[id(buffer)] = buffer
+        return view.toreadonly()
+
+    def apply_channel_lut(self, channel, lut):
+        """
+        对一个通道就地应用256项查找表 (如曲线)，其他通道不变
+
+        参数:
+            channel: 通道名或序号
+            lut: 长度为256的bytes
+        """
+        from utils.pool import get_buffer_pool
+        if len(lut) != 256:
+            raise ValueError("Lookup table must have 256 entries")
+        index = self._channel_index(channel)
+        if self._planes is not None:
+            plane = self._planes[index]
+            if isinstance(plane, bytearray):
+                self._planes[index] = plane.translate(lut)
+                self._give_back(plane)
+            else:
+                # 借用的平面在第一次修改时复制
+                self._planes[index] = bytearray(plane).translate(lut)
+        else:
+            data = self._pixel_data
+            if id(data) in self._lent:
+                # 已借出的交错数据先复制，借出的视图保持不变
+                self._give_back(data)
+                data = self._pixels = get_buffer_pool().copy(data)
+            channels = len(self.color_mode)
+            data[index::channels] = data[index::channels].translate(lut)
+        self._mark_modified()
+        return self
+
+    def split_channels(self):
+        """
+        将各通道拆分为L模式图像 (转为平面存储，结果借用各平面，不复制)
+
+        返回:
+            与 color_mode 各通道对应的WallowImage列表
+        """
+        self.to_planar()
+        return [WallowImage.merge_channels([self.get_channel(c)], 'L', (self.width, self.height))
+                for c in range(len(self.color_mode))]
+
+    @classmethod
+    def merge_channels(cls, channels, color_mode, dimensions):
+        """
+        由各通道的平面组成平面存储的图像，不复制像素
+
+        bytearray 平面由新图像接管；其他支持缓冲区协议的对象 (如 get_channel 返回的视图)
+        被借用，新图像修改该通道时才复制，被借用的内存在新图像使用期间必须保持有效。
+
+        参数:
+            channels: 与 color_mode 各通道对应的平面列表，每个平面 宽*高 字节
+            color_mode: 颜色模式
+            dimensions: (宽, 高)
+        """
+        width, height = dimensions
+        if len(channels) != len(color_mode):
+            raise ValueError(
+                f"Mode {color_mode} needs {len(color_mode)} channels, got {len(channels)}")
+        planes = []
+        for plane in channels:
+            if not isinstance(plane, bytearray):
+                plane = memoryview(plane)
+                if plane.ndim != 1 or plane.itemsize != 1:
+                    plane = plane.cast('B')
+            if len(plane) != width * height:
+                raise ValueError(f"Channel has {len(plane)} bytes, expected {width * height}")
+            planes.append(plane)
+
+        image = cls(b'', color_mode, dimensions)
+        image._pixels = None
+        image._planes = planes
+        return image
+
+    @classmethod
+    def open(cls, file_path, lazy=False, thumbnail=None):
+        """
+        打开图像文件
+
+        参数:
+            file_path: 文件路径
+            lazy: 是否只读取文件头，像素在第一次使用时才解码；
+                  操作栈中有裁剪时，支持的编解码器只解码需要的区域
+            thumbnail: 只需要预览图时指定最长边的最小像素数，JPEG优先解码文件中嵌入的
+                       缩略图，没有合适的缩略图时按比例缩小解码；结果的最长边不小于该值
+                       (原图更小时为原图)，需要时再用 resize 缩放到准确尺寸
+        """
         from formats import get_codec
         codec = get_codec(file_path)
-        return codec.decode(file_path)
+        if thumbnail is not None:
+            return codec.decode_thumbnail(file_path, thumbnail)
+        if not lazy:
+            return codec.decode(file_path)
+        try:
+            width, height, color_mode = codec.probe(file_path)
+        except NotImplementedError:
+            return codec.decode(file_path)
+        image = cls(b'', color_mode, (width, height))
+        image._pixels = None
+        image._source = (codec, file_path)
+        image.orientation = codec.read_orientation(file_path)
+        return image
 
     def resize(self, new_width=None, new_height=None):
         self._operation_stack.append(('resize', {
@@ -38,6 +285,89 @@ class WallowImage(ImageProcessor):
         }))
         return self
 
+    def crop(self, box):
+        """
+        裁剪到 box = (左, 上, 右, 下)，坐标为该操作之前的图像坐标，超出部分被截掉
+
+        执行时裁剪区域会反向传播到前面的操作，只计算 (和解码) 需要的源区域。
+        """
+        self._operation_stack.append(('crop', {
+            'box': tuple(box)
+        }))
+        return self
+
+    def transpose(self, method):
+        """
+        翻转或旋转90度的倍数
+
+        参数:
+            method: 'flip_left_right'、'flip_top_bottom'、'rotate_90'、'rotate_180'、
+                    'rotate_270' (逆时针)、'transpose' 或 'transverse'
+        """
+        if method not in _ORIENTATIONS:
+            raise ValueError(f"Unsupported transpose method: {method}")
+        self._operation_stack.append(('orient', {
+            'element': _ORIENTATIONS[method]
+        }))
+        return self
+
+    def flip(self, direction='horizontal'):
+        """水平 ('horizontal') 或垂直 ('vertical') 翻转"""
+        if direction not in ('horizontal', 'vertical'):
+            raise ValueError(f"Unsupported flip direction: {direction}")
+        return self.transpose('flip_left_right' if direction == 'horizontal' else 'flip_top_bottom')
+
+    def rotate(self, angle):
+        """逆时针旋转，angle必须是90的倍数"""
+        if angle % 90:
+            raise ValueError("Only multiples of 90 degrees are supported")
+        angle %= 360
+        if angle:
+            self.transpose(f'rotate_{angle}')
+        return self
+
+    def auto_orient(self):
+        """按EXIF方向标签把图像校正为正向，执行时才读取图像的方向"""
+        self._operation_stack.append(('auto_orient', {}))
+        return self
+
+    def convert(self, color_mode, background=None):
+        self._operation_stack.append(('convert', {
+            'mode': color_mode,
+            'background': background
+        }))
+        return self
+
+    def adjust_hsv(self, hue=0.0, saturation=1.0, vibrance=0.0, lightness=0.0):
+        self._operation_stack.append(('hsv', {
+            'hue': hue,
+            'saturation': saturation,
+            'vibrance': vibrance,
+            'lightness': lightness
+        }))
+        return self
+
+    def overlay(self, image, position=(0, 0), blend='normal', opacity=1.0):
+        self._operation_stack.append(('overlay', {
+            'image': image,
+            'position': position,
+            'blend': blend,
+            'opacity': opacity
+        }))
+        return self
+
+    def watermark(self, image, relative_width=0.25, anchor='bottom-right', margin=0.02,
+                  blend='normal', opacity=1.0):
+        self._operation_stack.append(('watermark', {
+            'image': image,
+            'relative_width': relative_width,
+            'anchor': anchor,
+            'margin': margin,
+            'blend': blend,
+            'opacity': opacity
+        }))
+        return self
+
     def apply_filter(self, filter_func):
         self._operation_stack.append(('filter', {
             'func': filter_func
@@ -46,54 +376,670 @@ class WallowImage(ImageProcessor):
 
     def save(self, output_path, quality=85):
         from formats import get_codec
-        processed_data = self._process_pipeline()
-        get_codec(output_path).encode(
-            processed_data,
-            self.color_mode,
-            (self.width, self.height),
-            output_path,
-            quality
-        )
+        from utils.pool import get_buffer_pool
+        processed_data, color_mode, dimensions = self._run_pipeline()
+        try:
+            get_codec(output_path).encode(
+                processed_data,
+                color_mode,
+                dimensions,
+                output_path,
+                quality
+            )
+        finally:
+            if processed_data is not self._pixels:
+                get_buffer_pool().release(processed_data)
+
+    def render(self):
+        """执行操作栈，返回结果图像 (操作栈为空的新WallowImage)"""
+        from utils.pool import get_buffer_pool
+        data, color_mode, dimensions = self._run_pipeline()
+        if data is self._pixels:
+            data = get_buffer_pool().copy(data)
+        return WallowImage._from_buffer(data, color_mode, dimensions)
+
+    def render_renditions(self, targets):
+        """
+        按目标尺寸生成多个缩略版本
+
+        操作栈只执行一次；各尺寸从大到小级联生成，每个尺寸从已生成的、
+        最接近的更大版本缩放得到。
+
+        参数:
+            targets: (尺寸, 格式, 质量) 列表，尺寸为最长边像素数或 (宽, 高)，
+                     质量可省略
+
+        返回:
+            与targets顺序对应的WallowImage列表
+        """
+        base = self.render()
+        sizes = [_rendition_size(target[0], base.width, base.height) for target in targets]
+
+        # 从大到小依次生成，同尺寸只生成一次
+        built = {(base.width, base.height): base}
+        for size in sorted(set(sizes), key=lambda s: s[0] * s[1], reverse=True):
+            if size in built:
+                continue
+            source = min((image for image in built.values()
+                          if image.width >= size[0] and image.height >= size[1]),
+                         key=lambda image: image.width * image.height, default=base)
+            data, dimensions = source._resize_impl(source._pixel_data, size[0], size[1])
+            built[size] = WallowImage._from_buffer(data, source.color_mode, dimensions)
+
+        result = [built[size] for size in sizes]
+        if all(image is not base for image in result):
+            base.close()
+        return result
+
+    def save_renditions(self, base_path, targets, workers=4):
+        """
+        生成多个缩略版本并并行编码保存
+
+        参数:
+            base_path: 不含扩展名的输出路径，文件名为 "{base_path}_{尺寸}.{格式}"
+            targets: 同 render_renditions
+            workers: 并行编码的线程数
+
+        返回:
+            与targets顺序对应的输出路径列表
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        images = self.render_renditions(targets)
+        paths = [rendition_path(base_path, target) for target in targets]
+        jobs = [(image, path, target[2] if len(target) > 2 else 85)
+                for image, path, target in zip(images, paths, targets)]
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for future in [executor.submit(image.save, path, quality)
+                               for image, path, quality in jobs]:
+                    future.result()
+        finally:
+            for image in {id(image): image for image in images}.values():
+                image.close()
+        return paths
 
     def _process_pipeline(self):
-        data = self._pixel_data
-        for op_type, params in self._operation_stack:
+        return self._run_pipeline()[0]
+
+    def _run_pipeline(self):
+        """执行操作栈，返回 (像素数据, 颜色模式, (宽, 高))"""
+        from filters.registry import chain_channel_luts, run_filter_chain
+        from utils.pool import get_buffer_pool
+
+        pool = get_buffer_pool()
+        color_mode = self.color_mode
+        size = (self.width, self.height)
+        owned = False  # data是否为管线自己的中间结果，可以就地改写
+        src_luts = None  # 推迟到下一个转换时应用的查找表
+
+        ops = self._operation_stack
+        if any(op_type in ('orient', 'auto_orient') for op_type, _ in ops):
+            # 合并相邻的翻转/旋转，并尽量并入后面的缩放
+            ops = _plan_orientation(ops, self.orientation)
+        source_box = None
+        if any(op_type == 'crop' for op_type, _ in ops):
+            # 裁剪区域反向传播后，前面的操作只处理需要的区域
+            ops, source_box = _plan_region(ops, size)
+
+        if source_box is None:
+            data = self._pixel_data
+        elif self._pixels is None and self._planes is None:
+            # 延迟打开的图像只解码需要的区域
+            codec, file_path = self._source
+            region = codec.decode_region(file_path, source_box)
+            data, color_mode, size = region._pixels, region.color_mode, (region.width, region.height)
+            owned = True
+        else:
+            data = _crop_pixels(self._pixel_data, size, len(color_mode), source_box)
+            size = (source_box[2] - source_box[0], source_box[3] - source_box[1])
+            owned = True
+
+        i = 0
+        while i < len(ops):
+            op_type, params = ops[i]
             if op_type == 'resize':
-                data = self._resize_impl(data, **params)
+                previous = data if owned else None
+                # 区域处理时 source_size 为完整输入尺寸，data 只覆盖其中的 source_box
+                params = dict(params)
+                source_size = params.pop('source_size', size)
+                data, size = self._resize_impl(data, size=source_size, color_mode=color_mode,
+                                               **params)
+                owned = True
+                # 上一步的中间结果已被消费，归还缓冲池供后续步骤作为输出使用 (乒乓缓冲)
+                if previous is not None:
+                    pool.release(previous)
+            elif op_type == 'orient':
+                previous = data if owned else None
+                data, size = _orient_pixels(data, size, len(color_mode), params['element'])
+                owned = True
+                if previous is not None:
+                    pool.release(previous)
+            elif op_type == 'crop':
+                box = _clip_box(params['box'], size)
+                if box != (0, 0) + size:
+                    previous = data if owned else None
+                    data = _crop_pixels(data, size, len(color_mode), box)
+                    size = (box[2] - box[0], box[3] - box[1])
+                    owned = True
+                    if previous is not None:
+                        pool.release(previous)
+            elif op_type == 'convert':
+                from utils.modes import convert_pixels, is_lossless_conversion
+                # 只增加通道的转换与后续转换合并为一次直接转换
+                target = params['mode']
+                background = params.get('background')
+                while (i + 1 < len(ops) and ops[i + 1][0] == 'convert'
+                       and is_lossless_conversion(color_mode, target)):
+                    i += 1
+                    target = ops[i][1]['mode']
+                    background = ops[i][1].get('background')
+                # 紧随其后的查找表滤镜在写入输出时应用，不再单独遍历
+                luts = None
+                if target != color_mode:
+                    following = []
+                    for next_type, next_params in ops[i + 1:]:
+                        if next_type != 'filter':
+                            break
+                        following.append(next_params['func'])
+                    luts, count = chain_channel_luts(following, target)
+                    i += count
+                if target != color_mode or src_luts is not None:
+                    previous = data if owned else None
+                    data = convert_pixels(data, color_mode, target, background,
+                                          src_luts=src_luts, luts=luts)
+                    color_mode = target
+                    owned = True
+                    src_luts = None
+                    if previous is not None:
+                        pool.release(previous)
+            elif op_type == 'hsv':
+                from filters.color import compile_hsv_adjustment
+                # 同一组参数只编译一次，批量处理时所有图像共用
+                lut = compile_hsv_adjustment(**params)
+                data = lut.apply(data, color_mode, in_place=owned)
+                owned = True
+            elif op_type in ('overlay', 'watermark'):
+                from filters.composite import composite_into, prepare_overlay, watermark_placement
+                image = params['image']
+                if op_type == 'overlay':
+                    # size 为可选的叠加尺寸 (预览时按代理分辨率缩放)
+                    prepared = prepare_overlay(image, params['opacity'], params.get('size'))
+                    position = params['position']
+                else:
+                    # 水印按输出尺寸缩放一次后缓存，同尺寸的图像共用
+                    scaled_size, position = watermark_placement(
+                        image, size, params['relative_width'], params['anchor'], params['margin'])
+                    prepared = prepare_overlay(image, params['opacity'], scaled_size)
+                if not prepared.is_empty:
+                    if not owned:
+                        data = pool.copy(data)
+                        owned = True
+                    composite_into(data, color_mode, size, prepared, position, params['blend'])
             elif op_type == 'filter':
-                data = params['func'](data)
-        return data
+                # 相邻的滤镜交给调度器，按声明的能力合并或选择实现
+                funcs = []
+                while i < len(ops) and ops[i][0] == 'filter':
+                    funcs.append(ops[i][1]['func'])
+                    i += 1
+                if i < len(ops) and ops[i][0] == 'convert':
+                    # 紧接转换的查找表滤镜在转换拆分通道时应用
+                    split = len(funcs)
+                    while split > 0 and chain_channel_luts(funcs[split - 1:split], color_mode)[1]:
+                        split -= 1
+                    src_luts = chain_channel_luts(funcs[split:], color_mode)[0]
+                    funcs = funcs[:split]
+                if funcs:
+                    data, owned = run_filter_chain(funcs, data, color_mode, size, owned)
+                continue
+            i += 1
+        return data, color_mode, size
+
+    def _resize_impl(self, data, width, height, size=None, color_mode=None,
+                     source_box=None, box=None, flip=(False, False)):
+        """
+        参数:
+            size: 完整输入尺寸，决定缩放比例
+            source_box: data 覆盖的输入区域，默认为整幅输入
+            box: 只生成输出图像中的这一区域，默认为整幅输出
+            flip: (水平, 垂直) 翻转，在采样时完成，不需要单独的一遍
+
+        返回:
+            (像素数据, (宽, 高))，尺寸为 box 的尺寸
+        """
+        from utils.pool import get_buffer_pool
 
-    def _resize_impl(self, data, width, height):
         # Nearest-neighbor缩放算法
-        scale_x = width / self.width if width else 1.0
-        scale_y = height / self.height if height else 1.0
-        new_width = int(self.width * scale_x)
-        new_height = int(self.height * scale_y)
-
-        resized = bytearray(new_width * new_height * len(self.color_mode))
-        for y in range(new_height):
-            src_y = int(y / scale_y)
-            for x in range(new_width):
-                src_x = int(x / scale_x)
-                src_pos = (src_y * self.width + src_x) * len(self.color_mode)
-                dst_pos = (y * new_width + x) * len(self.color_mode)
-                resized[dst_pos:dst_pos + 3] = data[src_pos:src_pos + 3]
-        return resized
-
-    def to_tkinter_image(self):
-        if self.color_mode not in ('RGB', 'RGBA'):
-            raise ValueError("Only RGB and RGBA color modes are supported for tkinter conversion")
-
-        image = tk.PhotoImage(width=self.width, height=self.height)
-
-        pixels = []
-        bytes_per_pixel = len(self.color_mode)
-        for i in range(0, len(self._pixel_data), bytes_per_pixel):
-            r, g, b = self._pixel_data[i:i+3]
-            hex_color = f'#{r:02x}{g:02x}{b:02x}'
-            pixels.append(hex_color)
-
-        image.put('{' + ' '.join(pixels) + '}', to=(0, 0, self.width, self.height))
-
-        return image
\ No newline at end of file
+        src_width, src_height = size or (self.width, self.height)
+        bytes_per_pixel = len(color_mode or self.color_mode)
+        scale_x = width / src_width if width else 1.0
+        scale_y = height / src_height if height else 1.0
+        new_width = int(width) if width else src_width
+        new_height = int(height) if height else src_height
+        x0, y0, x1, y1 = box or (0, 0, new_width, new_height)
+        sx0, sy0, sx1, _ = source_box or (0, 0, src_width, src_height)
+        out_width, out_height = x1 - x0, y1 - y0
+
+        resized = get_buffer_pool().acquire(out_width * out_height * bytes_per_pixel)
+        src_stride = (sx1 - sx0) * bytes_per_pixel
+        dst_stride = out_width * bytes_per_pixel
+
+        # 每个输出行用同一组源字节偏移取值，itemgetter一次取出整行
+        flip_x, flip_y = flip
+        offsets = [((src_width - 1 - int(x / scale_x) if flip_x else int(x / scale_x)) - sx0)
+                   * bytes_per_pixel + c
+                   for x in range(x0, x1) for c in range(bytes_per_pixel)]
+        if len(offsets) == 1:
+            offset = offsets[0]
+            gather = lambda row: (row[offset],)
+        else:
+            gather = itemgetter(*offsets)
+
+        row = None
+        previous_src_y = None
+        for y in range(out_height):
+            src_y = int((y + y0) / scale_y)
+            src_y = (src_height - 1 - src_y if flip_y else src_y) - sy0
+            if src_y != previous_src_y:
+                src_start = src_y * src_stride
+                row = bytes(gather(data[src_start:src_start + src_stride]))
+                previous_src_y = src_y
+            resized[y * dst_stride:(y + 1) * dst_stride] = row
+        return resized, (out_width, out_height)
+
+    def to_tkinter_image(self, size=None, master=None):
+        """
+        转换为tkinter.PhotoImage
+
+        先执行操作栈并缩小到显示尺寸，再整体编码为二进制PPM (有透明像素时为PNG)
+        交给Tk解码。结果按显示尺寸缓存在图像上，像素或操作栈改变后失效。
+
+        参数:
+            size: 可选的显示尺寸，最长边像素数或 (最大宽, 最大高)，只缩小不放大
+            master: PhotoImage所属的Tk窗口，默认为默认根窗口
+
+        返回:
+            tkinter.PhotoImage实例
+        """
+        from utils.pool import get_buffer_pool
+
+        state = (id(self._pixels), self._data_version,
+                 tuple(id(params) for _, params in self._operation_stack))
+        key = (state, size if not isinstance(size, list) else tuple(size), id(master))
+        photo = self._tk_cache.get(key)
+        if photo is not None:
+            return photo
+
+        pool = get_buffer_pool()
+        data, color_mode, dimensions = self._run_pipeline()
+        owned = data is not self._pixels
+        try:
+            target = _display_size(size, *dimensions)
+            if target != dimensions:
+                resized, dimensions = self._resize_impl(
+                    data, target[0], target[1], size=dimensions, color_mode=color_mode)
+                if owned:
+                    pool.release(data)
+                data, owned = resized, True
+            image_data, image_format = _tk_image_data(data, color_mode, dimensions)
+        finally:
+            if owned:
+                pool.release(data)
+
+        photo = tk.PhotoImage(master=master, data=image_data, format=image_format)
+        for stale in [k for k in self._tk_cache if k[0] != state]:
+            del self._tk_cache[stale]
+        self._tk_cache[key] = photo
+        return photo
+
+
+def rendition_path(base_path, target):
+    """缩略版本的输出文件路径"""
+    size, file_format = target[0], target[1]
+    label = f"{size[0]}x{size[1]}" if isinstance(size, (tuple, list)) else str(size)
+    return f"{base_path}_{label}.{file_format.lstrip('.').lower()}"
+
+
+def _rendition_size(size, width, height):
+    """最长边限制 (不放大) 或精确的 (宽, 高)"""
+    if isinstance(size, (tuple, list)):
+        return int(size[0]), int(size[1])
+    scale = min(1.0, size / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _display_size(size, width, height):
+    """缩小到最长边或 (最大宽, 最大高) 以内，保持宽高比"""
+    if size is None:
+        return width, height
+    if isinstance(size, (tuple, list)):
+        scale = min(1.0, size[0] / width, size[1] / height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+    return _rendition_size(size, width, height)
+
+
+def _tk_image_data(data, color_mode, dimensions):
+    """编码为Tk能直接读取的 (数据, 格式)：不透明图像为PPM/PGM，否则为PNG"""
+    from formats.png import PNGAIc
+    from utils.modes import convert_pixels, has_alpha
+    from utils.pool import get_buffer_pool
+
+    width, height = dimensions
+    header = f"{width} {height}\n255\n".encode()
+    if color_mode == 'L':
+        return b'P5\n' + header + data, 'PPM'
+    if color_mode == 'RGB':
+        return b'P6\n' + header + data, 'PPM'
+
+    pool = get_buffer_pool()
+    if not has_alpha(color_mode) or not data[len(color_mode) - 1::len(color_mode)].strip(b'\xff'):
+        # Alpha全部不透明时丢弃Alpha，PPM的解码比PNG快得多
+        rgb = convert_pixels(data, color_mode, 'RGB')
+        try:
+            return b'P6\n' + header + rgb, 'PPM'
+        finally:
+            pool.release(rgb)
+
+    rgba = data if color_mode == 'RGBA' else convert_pixels(data, color_mode, 'RGBA')
+    try:
+        # 只在内存中传递一次，用最快的压缩级别
+        return PNGAIc().encode_bytes(rgba, 'RGBA', dimensions, compress_level=1), 'PNG'
+    finally:
+        if rgba is not data:
+            pool.release(rgba)
+
+
+# 翻转/旋转用 (水平翻转, 垂直翻转, 交换x和y) 表示：先按需翻转，再按需交换坐标轴，
+# 八种组合恰好覆盖所有90度倍数的旋转和翻转
+_IDENTITY = (False, False, False)
+_ORIENTATIONS = {
+    'flip_left_right': (True, False, False),
+    'flip_top_bottom': (False, True, False),
+    'rotate_90': (True, False, True),
+    'rotate_180': (True, True, False),
+    'rotate_270': (False, True, True),
+    'transpose': (False, False, True),
+    'transverse': (True, True, True),
+}
+
+# EXIF方向标签 (0x0112) 对应的校正变换
+_EXIF_ORIENTATIONS = {
+    2: 'flip_left_right',
+    3: 'rotate_180',
+    4: 'flip_top_bottom',
+    5: 'transpose',
+    6: 'rotate_270',
+    7: 'transverse',
+    8: 'rotate_90',
+}
+
+# 转置时每次处理的行带大小，行带留在缓存中，逐列取出的片段依次写入输出行
+_TRANSPOSE_BAND_BYTES = 256 * 1024
+
+
+def _map_point(element, x, y, width, height):
+    flip_x, flip_y, swap = element
+    if flip_x:
+        x = width - 1 - x
+    if flip_y:
+        y = height - 1 - y
+    return (y, x) if swap else (x, y)
+
+
+@lru_cache(maxsize=None)
+def _compose_orientations(first, second):
+    """先执行first再执行second，等价的单个变换"""
+    width, height = 2, 3
+    points = [(0, 0), (1, 0), (0, 1)]
+    mid_size = (height, width) if first[2] else (width, height)
+    expected = [_map_point(second, *_map_point(first, x, y, width, height), *mid_size)
+                for x, y in points]
+    for element in [_IDENTITY] + list(_ORIENTATIONS.values()):
+        if [_map_point(element, x, y, width, height) for x, y in points] == expected:
+            return element
+    raise AssertionError("orientations are closed under composition")
+
+
+def _plan_orientation(ops, orientation):
+    """
+    整理操作栈中的翻转/旋转
+
+    auto_orient 按图像的方向标签换成具体变换，相邻的变换合并为一个 (互相抵消时移除)，
+    紧跟缩放的变换并入缩放：翻转在采样时完成，交换坐标轴则推迟到缩放之后对较小的图像执行。
+    """
+    result = []
+    for op_type, params in ops:
+        if op_type == 'auto_orient':
+            method = _EXIF_ORIENTATIONS.get(orientation)
+            if method is None:
+                continue
+            op_type, params = 'orient', {'element': _ORIENTATIONS[method]}
+
+        if op_type == 'orient':
+            element = params['element']
+            if result and result[-1][0] == 'orient':
+                element = _compose_orientations(result.pop()[1]['element'], element)
+            if element != _IDENTITY:
+                result.append(('orient', {'element': element}))
+            continue
+
+        if op_type == 'resize' and result and result[-1][0] == 'orient':
+            flip_x, flip_y, swap = result.pop()[1]['element']
+            if swap:
+                # 先按交换后的目标尺寸缩放 (带翻转)，再转置缩放后的图像
+                result.append(('resize', {'width': params['height'], 'height': params['width'],
+                                          'flip': (flip_x, flip_y)}))
+                result.append(('orient', {'element': _ORIENTATIONS['transpose']}))
+            else:
+                result.append(('resize', {**params, 'flip': (flip_x, flip_y)}))
+            continue
+
+        result.append((op_type, params))
+    return result
+
+
+def _orient_pixels(data, size, channels, element):
+    """
+    执行翻转/旋转
+
+    返回:
+        (从缓冲池借出的像素数据, (宽, 高))
+    """
+    from utils.pool import get_buffer_pool
+
+    flip_x, flip_y, swap = element
+    width, height = size
+    stride = width * channels
+    out = get_buffer_pool().acquire(width * height * channels)
+
+    if not swap:
+        for y in range(height):
+            row = data[y * stride:(y + 1) * stride]
+            if flip_x:
+                row = _reverse_pixels(row, channels)
+            dst = (height - 1 - y if flip_y else y) * stride
+            out[dst:dst + stride] = row
+        return out, size
+
+    # 按行带分块转置：输入的第x列在行带内的片段写入输出第x行 (水平翻转时为倒数第x行)
+    out_stride = height * channels
+    band = max(1, _TRANSPOSE_BAND_BYTES // stride)
+    for y0 in range(0, height, band):
+        y1 = min(height, y0 + band)
+        block = data[y0 * stride:y1 * stride]
+        # 垂直翻转时片段倒序写入输出行的对称位置
+        position = (height - y1 if flip_y else y0) * channels
+        length = (y1 - y0) * channels
+        for x in range(width):
+            dst = (width - 1 - x if flip_x else x) * out_stride + position
+            for c in range(channels):
+                column = block[x * channels + c::stride]
+                out[dst + c:dst + length:channels] = column[::-1] if flip_y else column
+    return out, (height, width)
+
+
+def _reverse_pixels(row, channels):
+    """反转一行中像素的顺序，像素内的通道顺序不变"""
+    if channels == 1:
+        return row[::-1]
+    reversed_row = bytearray(len(row))
+    for c in range(channels):
+        reversed_row[c::channels] = row[c::channels][::-1]
+    return reversed_row
+
+
+def _clip_box(box, size):
+    """把 (左, 上, 右, 下) 限制在图像范围内"""
+    width, height = size
+    left, top, right, bottom = (int(v) for v in box)
+    left, top = max(0, left), max(0, top)
+    right, bottom = min(width, right), min(height, bottom)
+    if left >= right or top >= bottom:
+        raise ValueError(f"Crop box {tuple(box)} does not intersect image of size {size}")
+    return left, top, right, bottom
+
+
+def _crop_pixels(data, size, channels, box):
+    """复制交错像素数据中 box 区域的行片段"""
+    from utils.pool import get_buffer_pool
+
+    stride = size[0] * channels
+    left, top, right, bottom = box
+    row_bytes = (right - left) * channels
+    out = get_buffer_pool().acquire(row_bytes * (bottom - top))
+    for y in range(top, bottom):
+        start = y * stride + left * channels
+        dst = (y - top) * row_bytes
+        out[dst:dst + row_bytes] = data[start:start + row_bytes]
+    return out
+
+
+def _operation_size(op_type, params, size):
+    """操作的输出尺寸"""
+    if op_type == 'resize':
+        width, height = params['width'], params['height']
+        return int(width) if width else size[0], int(height) if height else size[1]
+    if op_type == 'crop':
+        left, top, right, bottom = _clip_box(params['box'], size)
+        return right - left, bottom - top
+    if op_type == 'orient' and params['element'][2]:
+        return size[1], size[0]
+    return size
+
+
+def _plan_region(ops, size):
+    """
+    把最后一个裁剪区域反向传播到前面的操作
+
+    每经过一个操作，区域按该操作的需求换算到它的输入坐标：滤镜向外扩展邻域半径，
+    缩放按采样位置映射，裁剪平移到裁剪框内。遇到需要整幅图像的操作 (全局统计的
+    滤镜、未注册的滤镜等) 时停止传播，在该操作之后插入裁剪。
+
+    参数:
+        ops: 操作栈
+        size: 源图像尺寸
+
+    返回:
+        (新的操作列表, 源图像区域)；源图像区域为None时新操作列表作用于整幅源图像
+    """
+    last = max(i for i, (op_type, _) in enumerate(ops) if op_type == 'crop')
+
+    # 每个操作的输入尺寸
+    sizes = []
+    for op_type, params in ops[:last + 1]:
+        sizes.append(size)
+        size = _operation_size(op_type, params, size)
+
+    region = _clip_box(ops[last][1]['box'], sizes[last])
+    steps = []  # 反向生成的区域化操作
+    j = last - 1
+    while j >= 0:
+        mapped = _map_region(ops[j][0], ops[j][1], region, sizes[j])
+        if mapped is None:
+            break
+        input_region, new_ops = mapped
+        steps.extend(reversed(new_ops))
+        region = input_region
+        j -= 1
+
+    steps.reverse()
+    tail = steps + list(ops[last + 1:])
+    if j < 0:
+        if region == (0, 0) + sizes[0]:
+            return tail, None
+        return tail, region
+    return list(ops[:j + 1]) + [('crop', {'box': region})] + tail, None
+
+
+def _map_region(op_type, params, region, input_size):
+    """
+    计算操作为生成 region 所需的输入区域
+
+    返回:
+        (输入区域, 作用于该输入区域、输出恰好为 region 的操作列表)；无法按区域处理时返回None
+    """
+    x0, y0, x1, y1 = region
+    if op_type in ('convert', 'hsv'):
+        return region, [(op_type, params)]
+
+    if op_type == 'crop':
+        left, top, _, _ = _clip_box(params['box'], input_size)
+        return (x0 + left, y0 + top, x1 + left, y1 + top), []
+
+    if op_type == 'resize':
+        width, height = params['width'], params['height']
+        scale_x = width / input_size[0] if width else 1.0
+        scale_y = height / input_size[1] if height else 1.0
+        # 与 _resize_impl 使用相同的采样位置计算
+        sx0, sy0 = int(x0 / scale_x), int(y0 / scale_y)
+        sx1, sy1 = int((x1 - 1) / scale_x) + 1, int((y1 - 1) / scale_y) + 1
+        flip_x, flip_y = params.get('flip', (False, False))
+        if flip_x:
+            sx0, sx1 = input_size[0] - sx1, input_size[0] - sx0
+        if flip_y:
+            sy0, sy1 = input_size[1] - sy1, input_size[1] - sy0
+        source = (sx0, sy0, sx1, sy1)
+        return source, [('resize', {**params, 'source_size': input_size,
+                                    'source_box': source, 'box': region})]
+
+    if op_type == 'orient':
+        # 翻转/转置子区域等于对应区域的翻转/转置
+        flip_x, flip_y, swap = params['element']
+        if swap:
+            x0, y0, x1, y1 = y0, x0, y1, x1
+        if flip_x:
+            x0, x1 = input_size[0] - x1, input_size[0] - x0
+        if flip_y:
+            y0, y1 = input_size[1] - y1, input_size[1] - y0
+        return (x0, y0, x1, y1), [(op_type, params)]
+
+    if op_type == 'overlay':
+        x, y = params['position']
+        return region, [('overlay', {**params, 'position': (x - x0, y - y0)})]
+
+    if op_type == 'watermark':
+        from filters.composite import watermark_placement
+        # 水印位置取决于整幅图像的尺寸，先按整幅图像计算再换成普通叠加
+        scaled_size, (x, y) = watermark_placement(
+            params['image'], input_size, params['relative_width'], params['anchor'],
+            params['margin'])
+        return region, [('overlay', {'image': params['image'], 'position': (x - x0, y - y0),
+                                     'blend': params['blend'], 'opacity': params['opacity'],
+                                     'size': scaled_size})]
+
+    if op_type == 'filter':
+        from filters.registry import get_filter_spec
+        spec = get_filter_spec(params['func'])
+        if spec is None or spec.full_frame or not (spec.pointwise or spec.needs_neighbors):
+            return None
+        if not spec.needs_neighbors:
+            return region, [(op_type, params)]
+        # 向外扩展邻域半径，滤镜执行后再裁掉扩展部分
+        halo = spec.halo
+        expanded = (max(0, x0 - halo), max(0, y0 - halo),
+                    min(input_size[0], x1 + halo), min(input_size[1], y1 + halo))
+        inner = (x0 - expanded[0], y0 - expanded[1], x1 - expanded[0], y1 - expanded[1])
+        return expanded, [(op_type, params), ('crop', {'box': inner})]
+
+    return None
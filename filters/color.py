@@ -1,35 +1,325 @@
+import math
+from functools import lru_cache
+
 from core import WallowImage
+from utils.color import ColorLUT3D, hsv_to_rgb, rgb_to_hsv
+from utils.histogram import compute_statistics, get_statistics
+from utils.modes import has_alpha
+from utils.pool import get_buffer_pool
+from .registry import register_filter, _apply_luts
+
+_GRAYSCALE_MATRIX = [[0.299, 0.587, 0.114]] * 3
+_SEPIA_MATRIX = [
+    [0.393, 0.769, 0.189],
+    [0.349, 0.686, 0.168],
+    [0.272, 0.534, 0.131],
+]
 
 
-def grayscale_filter(pixel_data):
-    processed = bytearray()
-    for i in range(0, len(pixel_data), 3):
+def grayscale_filter(pixel_data, color_mode='RGB', size=None):
+    channels = len(color_mode)
+    processed = get_buffer_pool().copy(pixel_data)
+    for i in range(0, len(pixel_data), channels):
         r, g, b = pixel_data[i:i+3]
-        gray = int(0.299 * r + 0.587 * g + 0.114 * b)
-        processed.extend([gray, gray, gray])
+        gray = (299 * r + 587 * g + 114 * b) // 1000
+        processed[i:i+3] = bytes((gray, gray, gray))
     return processed
 
-def sepia_filter(pixel_data):
-    processed = bytearray()
-    for i in range(0, len(pixel_data), 3):
+def sepia_filter(pixel_data, color_mode='RGB', size=None):
+    channels = len(color_mode)
+    processed = get_buffer_pool().copy(pixel_data)
+    for i in range(0, len(pixel_data), channels):
         r, g, b = pixel_data[i:i+3]
-        new_r = min(255, int(r * 0.393 + g * 0.769 + b * 0.189))
-        new_g = min(255, int(r * 0.349 + g * 0.686 + b * 0.168))
-        new_b = min(255, int(r * 0.272 + g * 0.534 + b * 0.131))
-        processed.extend([new_r, new_g, new_b])
+        new_r = min(255, (r * 393 + g * 769 + b * 189) // 1000)
+        new_g = min(255, (r * 349 + g * 686 + b * 168) // 1000)
+        new_b = min(255, (r * 272 + g * 534 + b * 131) // 1000)
+        processed[i:i+3] = bytes((new_r, new_g, new_b))
     return processed
 
 
-def apply_color_matrix(image, matrix):
-    # Matrix should be 3x3
-    r_matrix, g_matrix, b_matrix = matrix  # Unpack three rows
+def _register_matrix_filter(func, name, matrix):
+    """以颜色矩阵作为就地/快速实现注册 RGB(A) 滤镜，与 func 一样截断取整"""
+    rows = [list(row) + [0.0] for row in matrix]
+
+    def in_place(data, color_mode, size=None):
+        _apply_channel_matrix(data, len(color_mode), rows, (0, 1, 2), truncate=True)
+        return data
+
+    register_filter(func, name=name, pointwise=True, modes=('RGB', 'RGBA'), in_place=in_place,
+                    vectorized=lambda data, color_mode, size=None: in_place(
+                        get_buffer_pool().copy(data), color_mode, size))
+
+
+_register_matrix_filter(grayscale_filter, 'grayscale', _GRAYSCALE_MATRIX)
+_register_matrix_filter(sepia_filter, 'sepia', _SEPIA_MATRIX)
+
+
+def apply_color_matrix(image, matrix, in_place=False, truncate=False):
+    """
+    对图像应用颜色矩阵
+
+    结果四舍五入 (0.5进位) 并限制在0-255；早期版本截断取整，需要与之一致时指定
+    truncate=True。RGB图像按Alpha为255处理，4x5矩阵的Alpha列乘以255后并入偏移量。
+
+    参数:
+        image: WallowImage实例 (支持 L、LA、RGB、RGBA 模式)
+        matrix: 3x3 矩阵 (RGB 行)，或 4x5 矩阵 (RGBA 行，每行最后一列为0-255范围的偏移量)
+        in_place: 是否直接修改 image._pixel_data
+        truncate: 是否截断取整而不是四舍五入
+
+    返回:
+        处理后的WallowImage实例 (in_place=True 时为原实例)
+    """
+    rows = _normalize_color_matrix(matrix)
+    target = image if in_place else WallowImage._from_buffer(
+        get_buffer_pool().copy(image._pixel_data), image.color_mode, (image.width, image.height))
+
+    mode = image.color_mode
+    if mode == 'RGB':
+        # 没有Alpha通道时按不透明(255)处理，Alpha列并入偏移量
+        rows = [[m[0], m[1], m[2], 0.0, m[4] + m[3] * 255] for m in rows[:3]]
+        inputs = (0, 1, 2)
+    elif mode == 'RGBA':
+        inputs = (0, 1, 2, 3)
+    elif mode in ('L', 'LA'):
+        # 灰度输入视为 R=G=B，输出取结果的亮度
+        rows = _luma_rows(rows, has_alpha=mode == 'LA')
+        inputs = (0, 1) if mode == 'LA' else (0,)
+    else:
+        raise ValueError(f"Unsupported color mode: {mode}")
+
+    _apply_channel_matrix(target._pixel_data, len(mode), rows, inputs, truncate)
+    target._mark_modified()
+    return target
+
+
+def _normalize_color_matrix(matrix):
+    """将3x3或4x5矩阵统一为4x5形式 (R、G、B、A、偏移)"""
+    rows = [list(map(float, row)) for row in matrix]
+    if len(rows) == 3 and all(len(row) == 3 for row in rows):
+        return [row + [0.0, 0.0] for row in rows] + [[0.0, 0.0, 0.0, 1.0, 0.0]]
+    if len(rows) == 4 and all(len(row) == 5 for row in rows):
+        return rows
+    raise ValueError("Color matrix must be 3x3 or 4x5")
+
+
+def _luma_rows(rows, has_alpha):
+    """把4x5矩阵折算为灰度(及Alpha)通道上的矩阵，列为 (L, A, 偏移)"""
+    weights = (0.299, 0.587, 0.114)
+    luma = [0.0, 0.0, 0.0]
+    for w, m in zip(weights, rows[:3]):
+        luma[0] += w * (m[0] + m[1] + m[2])
+        luma[1] += w * m[3]
+        luma[2] += w * m[4]
+    alpha = rows[3]
+    alpha = [alpha[0] + alpha[1] + alpha[2], alpha[3], alpha[4]]
+    if not has_alpha:
+        return [[luma[0], 0.0, luma[2] + luma[1] * 255]]
+    return [luma, alpha]
+
+
+def _apply_channel_matrix(data, channels, rows, inputs, truncate=False):
+    """
+    就地对交错像素数据应用矩阵
+
+    rows 的每一行对应一个输出通道，前 len(inputs) 列为各输入通道的系数，
+    最后一列为偏移量。每个输出通道由预计算的乘积表查表求和得到。
+    结果默认四舍五入 (0.5进位)，truncate=True 时截断取整 (系数为三位小数时与精确计算一致)。
+    """
+    planes = [bytes(data[c::channels]) for c in inputs]
+    offset_col = len(rows[0]) - 1
+
+    for out_c, row in enumerate(rows):
+        coeffs = [row[k] for k in range(len(inputs))]
+        offset = row[offset_col]
+
+        # 无交叉项时退化为单通道查找表
+        cross = [k for k, m in enumerate(coeffs) if k != out_c and m != 0.0]
+        if not cross:
+            # 与下面的定点计算一样向下取整，四舍五入时先加0.5
+            half = 0.0 if truncate else 0.5
+            lut = bytes(_clamp_byte(math.floor(coeffs[out_c] * v + offset + half))
+                        for v in range(256))
+            data[out_c::channels] = planes[out_c].translate(lut)
+            continue
+
+        # 16位定点乘积表，偏移量与舍入项并入第一张表；截断时只加上抵消
+        # 乘积表舍入误差 (每张表至多0.5) 的余量
+        tables = [[round(m * v * 65536) for v in range(256)] for m in coeffs]
+        bias = round(offset * 65536) + (len(tables) if truncate else 32768)
+        low = sum(min(t) for t in tables) + bias
+        high = sum(max(t) for t in tables) + bias
+        low >>= 16
+        high >>= 16
+        bias -= low << 16
+        tables[0] = [t + bias for t in tables[0]]
+        clamp = bytes(_clamp_byte(v) for v in range(low, high + 1))
+
+        if len(inputs) == 1:
+            t0, = tables
+            result = bytes(clamp[t0[v] >> 16] for v in planes[0])
+        elif len(inputs) == 2:
+            t0, t1 = tables
+            result = bytes(map(lambda a, b: clamp[(t0[a] + t1[b]) >> 16], *planes))
+        elif len(inputs) == 3:
+            t0, t1, t2 = tables
+            result = bytes(map(lambda a, b, c: clamp[(t0[a] + t1[b] + t2[c]) >> 16], *planes))
+        else:
+            t0, t1, t2, t3 = tables
+            result = bytes(map(lambda a, b, c, d: clamp[(t0[a] + t1[b] + t2[c] + t3[d]) >> 16],
+                               *planes))
+        data[out_c::channels] = result
+
+
+def _clamp_byte(value):
+    return 0 if value < 0 else 255 if value > 255 else value
+
+
+def auto_levels(image, clip=0.5, step=1, in_place=False):
+    """
+    自动色阶：按各通道的直方图分别拉伸到0-255
+
+    参数:
+        image: WallowImage实例
+        clip: 两端各裁剪的像素百分比
+        step: 统计时的采样步长 (越大越快，精度越低)
+        in_place: 是否直接修改 image._pixel_data
+
+    返回:
+        处理后的WallowImage实例
+    """
+    luts = _levels_luts(get_statistics(image, step), clip, per_channel=True)
+    return _apply_image_luts(image, luts, in_place)
+
+
+def auto_contrast(image, clip=0.5, step=1, in_place=False):
+    """
+    自动对比度：所有颜色通道使用同一拉伸范围，不改变色相
+
+    参数同 auto_levels
+    """
+    luts = _levels_luts(get_statistics(image, step), clip, per_channel=False)
+    return _apply_image_luts(image, luts, in_place)
+
+
+def _levels_luts(stats, clip, per_channel):
+    """根据统计信息生成每个通道的拉伸查找表，Alpha通道保持不变"""
+    channels = len(stats.color_mode)
+    # Alpha (包括预乘的 RGBa) 总是最后一个通道
+    color_channels = range(channels - 1 if has_alpha(stats.color_mode) else channels)
+    points = stats.clip_points(clip)
+    if not per_channel:
+        low = min(points[c][0] for c in color_channels)
+        high = max(points[c][1] for c in color_channels)
+        points = [(low, high)] * len(points)
+
+    identity = bytes(range(256))
+    luts = []
+    for c in range(channels):
+        low, high = points[c]
+        if c not in color_channels or high <= low:
+            luts.append(identity)
+            continue
+        scale = 255 / (high - low)
+        luts.append(bytes(_clamp_byte(round((v - low) * scale)) for v in range(256)))
+    return luts
+
+
+def _apply_image_luts(image, luts, in_place):
+    target = image if in_place else WallowImage._from_buffer(
+        get_buffer_pool().copy(image._pixel_data), image.color_mode, (image.width, image.height))
+    _apply_luts(target._pixel_data, target.color_mode, luts)
+    target._mark_modified()
+    return target
+
+
+@lru_cache(maxsize=None)
+def make_levels_filter(clip=0.5, per_channel=True, name=None):
+    """
+    创建可放入操作栈的自动色阶滤镜，统计基于管线中的当前数据
+
+    相同参数的调用返回同一个已注册的滤镜。
+
+    参数:
+        clip: 两端各裁剪的像素百分比
+        per_channel: True 时各通道分别拉伸 (auto_levels)，False 时使用同一拉伸范围 (auto_contrast)
+        name: 滤镜名称，默认如 "auto_levels(clip=1.0)"
+
+    返回:
+        滤镜函数
+    """
+    def in_place(data, color_mode, size=None):
+        stats = compute_statistics(data, color_mode)
+        return _apply_luts(data, color_mode, _levels_luts(stats, clip, per_channel))
+
+    def levels_filter(pixel_data, color_mode, size=None):
+        return in_place(get_buffer_pool().copy(pixel_data), color_mode, size)
+
+    if name is None:
+        name = f"{'auto_levels' if per_channel else 'auto_contrast'}(clip={clip})"
+    return register_filter(levels_filter, name=name, pointwise=True, full_frame=True,
+                           in_place=in_place)
+
+
+make_levels_filter(per_channel=True, name='auto_levels')
+make_levels_filter(per_channel=False, name='auto_contrast')
+
+
+@lru_cache(maxsize=64)
+def compile_hsv_adjustment(hue=0.0, saturation=1.0, vibrance=0.0, lightness=0.0, lut_size=33):
+    """
+    将一组HSV调整参数编译为RGB->RGB查找表，相同参数的调用共享同一张表
+
+    参数:
+        hue: 色相旋转角度 (度)
+        saturation: 饱和度倍数
+        vibrance: 自然饱和度 (-1到1)，低饱和度的颜色变化更大
+        lightness: 明度调整 (-1到1)，正值向白色靠近，负值向黑色靠近
+        lut_size: 查找表每个轴的网格点数
+
+    返回:
+        ColorLUT3D实例
+
+    33级网格下与逐像素精确计算相比的每通道误差：只调整色相、明度时不超过2级；放大饱和度时
+    在饱和度被截断到100%的边界附近最大，1.5倍时约5级，2倍时约6级 (见 tests/test_color.py)。
+    """
+    def transform(r, g, b):
+        h, s, v = rgb_to_hsv(r, g, b)
+        h = (h + hue) % 360
+        s *= saturation
+        if vibrance:
+            s *= 1 + vibrance * (1 - s / 100)
+        s = max(0.0, min(100.0, s))
+        return hsv_to_rgb(h, s, v)
+
+    if lightness:
+        return _LightnessLUT(transform, lut_size, lightness)
+    return ColorLUT3D(transform, lut_size)
+
+
+class _LightnessLUT(ColorLUT3D):
+    """
+    色相/饱和度查找表之后按解析式调整明度 (HSV的V)
+
+    色相和饱和度不变时 hsv_to_rgb 对V是线性的，因此
+        lightness < 0: 结果 = 查表结果 * (1 + lightness)
+        lightness > 0: 结果 = 查表结果 * (1 - lightness) + 同色相/饱和度且 V=100 的颜色 * lightness
+    后者把像素按最大通道放大到255后查表得到。V=100 的颜色在黑色附近随输入剧烈变化，
+    把明度直接并入网格插值时，黑色附近的误差可达上百级。
+    """
 
-    processed = bytearray()
-    for i in range(0, len(image._pixel_data), 3):
-        r, g, b = image._pixel_data[i:i + 3]
-        nr = min(255, int(r * r_matrix[0] + g * r_matrix[1] + b * r_matrix[2]))
-        ng = min(255, int(r * g_matrix[0] + g * g_matrix[1] + b * g_matrix[2]))
-        nb = min(255, int(r * b_matrix[0] + g * b_matrix[1] + b * b_matrix[2]))
-        processed.extend([nr, ng, nb])
+    def __init__(self, transform, size, lightness):
+        super().__init__(transform, size)
+        self.lightness = max(-1.0, min(1.0, lightness))
 
-    return WallowImage(processed, image.color_mode, (image.width, image.height))
\ No newline at end of file
+    def _blend(self, r, g, b):
+        base = super()._blend(r, g, b)
+        lightness = self.lightness
+        if lightness < 0:
+            return [v * (1 + lightness) for v in base]
+        peak = max(r, g, b)
+        if peak:
+            full = super()._blend(r * 255 / peak, g * 255 / peak, b * 255 / peak)
+        else:
+            full = super()._blend(255, 255, 255)  # 黑色的色相、饱和度为0
+        return [v + (f - v) * lightness for v, f in zip(base, full)]
@@ -0,0 +1,229 @@
+"""
+图像合成 - 将RGBA图像(如水印)叠加到另一幅图像上
+"""
+
+from itertools import groupby
+from weakref import WeakKeyDictionary
+
+from core import WallowImage
+from utils.modes import _MULTIPLY, convert_pixels
+from utils.pool import get_buffer_pool
+
+BLEND_MODES = ('normal', 'multiply', 'screen')
+
+_TRANSPARENT = 0
+_OPAQUE = 1
+_PARTIAL = 2
+_ALPHA_KIND = bytes([_TRANSPARENT] + [_PARTIAL] * 254 + [_OPAQUE])
+
+_prepared_cache = WeakKeyDictionary()
+
+
+class PreparedOverlay:
+    """
+    预处理过的叠加图像
+
+    保存RGBA像素以及每一行中完全透明、完全不透明和半透明像素的区间，
+    合成时透明区间直接跳过，不透明区间整段复制，只有半透明像素需要逐个混合。
+
+    属性:
+        width, height: 尺寸
+        pixel_data: RGBA像素数据
+        spans: 每行一个 [(起始x, 结束x, 类型), ...] 列表
+    """
+
+    def __init__(self, pixel_data, dimensions, opacity=1.0):
+        self.width, self.height = dimensions
+        data = bytearray(pixel_data)
+        if opacity < 1.0:
+            scale = bytes(round(a * max(0.0, opacity)) for a in range(256))
+            data[3::4] = data[3::4].translate(scale)
+        self.pixel_data = bytes(data)
+        self.spans = [self._row_spans(y) for y in range(self.height)]
+
+    def _row_spans(self, y):
+        row_alpha = self.pixel_data[y * self.width * 4 + 3:(y + 1) * self.width * 4:4]
+        spans = []
+        x = 0
+        for kind, run in groupby(row_alpha.translate(_ALPHA_KIND)):
+            length = sum(1 for _ in run)
+            if kind != _TRANSPARENT:
+                spans.append((x, x + length, kind))
+            x += length
+        return spans
+
+    @property
+    def is_empty(self):
+        return not any(self.spans)
+
+
+def prepare_overlay(image, opacity=1.0, size=None):
+    """
+    获取图像预处理后的叠加数据，结果缓存在图像上，像素改变后失效
+
+    参数:
+        image: WallowImage实例 (任意支持的颜色模式)
+        opacity: 整体不透明度 (0-1)
+        size: 可选，缩放到的 (宽, 高)
+
+    返回:
+        PreparedOverlay实例
+    """
+    per_image = _prepared_cache.setdefault(image, {})
+    key = (id(image._pixel_data), image._data_version, opacity, size)
+    prepared = per_image.get(key)
+    if prepared is None:
+        for stale in [k for k in per_image if k[:2] != key[:2]]:
+            del per_image[stale]
+
+        pool = get_buffer_pool()
+        data = image._pixel_data
+        if image.color_mode != 'RGBA':
+            data = convert_pixels(data, image.color_mode, 'RGBA')
+        dimensions = (image.width, image.height)
+        if size is not None and tuple(size) != dimensions:
+            resized, dimensions = image._resize_impl(
+                data, size[0], size[1], size=dimensions, color_mode='RGBA')
+            if data is not image._pixel_data:
+                pool.release(data)
+            data = resized
+        prepared = PreparedOverlay(data, dimensions, opacity)
+        # PreparedOverlay保存了自己的副本，临时缓冲区归还缓冲池
+        if data is not image._pixel_data:
+            pool.release(data)
+        per_image[key] = prepared
+    return prepared
+
+
+def watermark_placement(image, base_size, relative_width=0.25, anchor='bottom-right', margin=0.02):
+    """
+    计算水印在指定输出尺寸上的大小和位置
+
+    参数:
+        image: 水印图像
+        base_size: 输出图像的 (宽, 高)
+        relative_width: 水印宽度占输出宽度的比例
+        anchor: 'top-left'、'top-right'、'bottom-left'、'bottom-right' 或 'center'
+        margin: 边距占输出宽度的比例
+
+    返回:
+        ((宽, 高), (x, y))
+    """
+    base_width, base_height = base_size
+    width = max(1, round(base_width * relative_width))
+    height = max(1, round(image.height * width / image.width))
+    gap = round(base_width * margin)
+
+    if anchor == 'center':
+        return (width, height), ((base_width - width) // 2, (base_height - height) // 2)
+    vertical, _, horizontal = anchor.partition('-')
+    if vertical not in ('top', 'bottom') or horizontal not in ('left', 'right'):
+        raise ValueError(f"Unsupported anchor: {anchor}")
+    x = gap if horizontal == 'left' else base_width - width - gap
+    y = gap if vertical == 'top' else base_height - height - gap
+    return (width, height), (x, y)
+
+
+def composite_into(pixel_data, color_mode, size, prepared, position=(0, 0), blend='normal'):
+    """
+    将预处理过的叠加图像就地合成到交错像素数据上
+
+    参数:
+        pixel_data: 底图像素数据 (RGB或RGBA，会被修改)
+        color_mode: 底图颜色模式
+        size: 底图 (宽, 高)
+        prepared: PreparedOverlay实例
+        position: 叠加图像左上角在底图上的 (x, y)
+        blend: 'normal'、'multiply' 或 'screen'
+
+    返回:
+        pixel_data
+    """
+    if color_mode not in ('RGB', 'RGBA'):
+        raise ValueError(f"Unsupported color mode for overlay: {color_mode}")
+    if blend not in BLEND_MODES:
+        raise ValueError(f"Unsupported blend mode: {blend}")
+
+    width, height = size
+    channels = len(color_mode)
+    ox, oy = position
+    src = prepared.pixel_data
+    row_bytes = prepared.width * 4
+
+    for y in range(max(0, -oy), min(prepared.height, height - oy)):
+        dst_row = (oy + y) * width
+        src_row = y * row_bytes
+        for start, end, kind in prepared.spans[y]:
+            # 裁剪到底图范围
+            start = max(start, -ox)
+            end = min(end, width - ox)
+            if start >= end:
+                continue
+
+            dst = (dst_row + ox + start) * channels
+            dst_end = dst + (end - start) * channels
+            overlay = src[src_row + start * 4:src_row + end * 4]
+
+            if kind == _OPAQUE and blend == 'normal':
+                if channels == 4:
+                    pixel_data[dst:dst_end] = overlay
+                else:
+                    for c in range(3):
+                        pixel_data[dst + c:dst_end:3] = overlay[c::4]
+                continue
+
+            alpha = overlay[3::4]
+            for c in range(3):
+                base = pixel_data[dst + c:dst_end:channels]
+                colour = _blend(base, overlay[c::4], blend)
+                if kind == _PARTIAL:
+                    colour = _mix(colour, base, alpha)
+                pixel_data[dst + c:dst_end:channels] = colour
+
+            if channels == 4:
+                # Alpha按 "over" 规则合成
+                base_alpha = pixel_data[dst + 3:dst_end:4]
+                table = _MULTIPLY
+                pixel_data[dst + 3:dst_end:4] = bytes(
+                    map(lambda a, b: a + table[255 - a][b], alpha, base_alpha))
+
+    return pixel_data
+
+
+def _blend(base, overlay, blend):
+    table = _MULTIPLY
+    if blend == 'normal':
+        return overlay
+    if blend == 'multiply':
+        return bytes(map(lambda b, o: table[b][o], base, overlay))
+    # screen: 1 - (1 - b) * (1 - o)
+    return bytes(map(lambda b, o: 255 - table[255 - b][255 - o], base, overlay))
+
+
+def _mix(colour, base, alpha):
+    """colour * a + base * (1 - a)"""
+    table = _MULTIPLY
+    return bytes(map(lambda c, b, a: table[a][c] + table[255 - a][b], colour, base, alpha))
+
+
+def overlay_image(base, overlay, position=(0, 0), blend='normal', opacity=1.0, in_place=False):
+    """
+    立即将overlay合成到base上
+
+    参数:
+        base: 底图WallowImage (RGB或RGBA)
+        overlay: 叠加的WallowImage
+        position: 叠加位置 (x, y)
+        blend: 混合模式
+        opacity: 整体不透明度
+        in_place: 是否直接修改 base._pixel_data
+
+    返回:
+        合成后的WallowImage实例
+    """
+    target = base if in_place else WallowImage._from_buffer(
+        get_buffer_pool().copy(base._pixel_data), base.color_mode, (base.width, base.height))
+    composite_into(target._pixel_data, target.color_mode, (target.width, target.height),
+                   prepare_overlay(overlay, opacity), position, blend)
+    target._mark_modified()
+    return target
@@ -0,0 +1,205 @@
+"""
+滤镜注册表 - 声明滤镜的能力，供处理管线调度使用
+"""
+
+from utils.pool import get_buffer_pool
+
+_FILTER_REGISTRY = {}
+
+
+class FilterSpec:
+    """
+    滤镜能力声明
+
+    已注册滤镜的实现以 func(pixel_data, color_mode, size) 调用，返回处理后的像素数据。
+
+    run_filter_chain 据此合并相邻的查找表滤镜，并在就地实现、快速实现和基础实现之间选择；
+    pointwise/halo/full_frame 用于裁剪区域的反向传播。滤镜不按行分带、也不分到多个线程执行：
+    纯Python的逐像素循环持有GIL，多线程不能加速，分带只会增加切片和拼接的开销。
+
+    参数:
+        func: 基础实现，不修改输入
+        name: 滤镜名称 (默认为函数名)
+        pointwise: 输出像素是否只依赖同位置的输入像素
+        halo: 需要的邻域半径 (像素)，0 表示不需要邻域
+        full_frame: 结果是否依赖整幅图像 (如基于全图统计的色阶)，
+                    为True时裁剪区域不会传播到该滤镜之前
+        modes: 支持的颜色模式集合，None 表示全部
+        in_place: 可选的就地实现，直接改写并返回传入的缓冲区
+        vectorized: 可选的更快实现，语义与 func 相同
+        channel_lut: 可选，channel_lut(color_mode) 返回每个通道一张256字节查找表，
+                     相邻的查找表滤镜会被合并成一次遍历
+    """
+
+    def __init__(self, func, name=None, pointwise=False, halo=0, modes=None,
+                 in_place=None, vectorized=None, channel_lut=None, full_frame=False):
+        self.func = func
+        self.name = name or getattr(func, '__name__', repr(func))
+        self.pointwise = pointwise
+        self.halo = halo
+        self.full_frame = full_frame
+        self.modes = frozenset(modes) if modes is not None else None
+        self.in_place = in_place
+        self.vectorized = vectorized
+        self.channel_lut = channel_lut
+
+    @property
+    def needs_neighbors(self):
+        return self.halo > 0
+
+    def supports(self, color_mode):
+        return self.modes is None or color_mode in self.modes
+
+    def __repr__(self):
+        return f"FilterSpec({self.name!r}, pointwise={self.pointwise}, halo={self.halo})"
+
+
+def register_filter(func=None, **options):
+    """
+    注册滤镜，可直接调用或作为装饰器使用
+
+        @register_filter(pointwise=True, modes=('RGB',))
+        def my_filter(pixel_data, color_mode, size): ...
+
+    返回:
+        原函数 (不做包装)
+    """
+    def decorator(f):
+        spec = FilterSpec(f, **options)
+        _FILTER_REGISTRY[f] = spec
+        _FILTER_REGISTRY[spec.name] = spec
+        return f
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def get_filter_spec(func_or_name):
+    """获取滤镜的能力声明，未注册的滤镜返回None"""
+    try:
+        return _FILTER_REGISTRY.get(func_or_name)
+    except TypeError:  # 不可哈希的可调用对象
+        return None
+
+
+def list_filters():
+    """返回所有已注册滤镜的名称"""
+    return sorted(key for key in _FILTER_REGISTRY if isinstance(key, str))
+
+
+def make_lut_filter(luts, name=None):
+    """
+    由查找表创建一个已注册的逐通道滤镜
+
+    参数:
+        luts: 256字节查找表，或 {颜色模式: [每个通道一张表]} 字典
+        name: 滤镜名称
+
+    返回:
+        滤镜函数
+    """
+    if isinstance(luts, (bytes, bytearray)):
+        table = bytes(luts)
+        channel_lut = lambda color_mode: [table] * len(color_mode)
+    else:
+        per_mode = {mode: [bytes(t) for t in tables] for mode, tables in luts.items()}
+        channel_lut = per_mode.get
+
+    def lut_filter(pixel_data, color_mode, size=None):
+        return _apply_luts(get_buffer_pool().copy(pixel_data), color_mode, channel_lut(color_mode))
+
+    modes = None if isinstance(luts, (bytes, bytearray)) else list(luts)
+    return register_filter(lut_filter, name=name or 'lut_filter', pointwise=True, modes=modes,
+                           in_place=lambda d, m, s=None: _apply_luts(d, m, channel_lut(m)),
+                           channel_lut=channel_lut)
+
+
+def run_filter_chain(funcs, pixel_data, color_mode, size, owned=False):
+    """
+    依次执行一串滤镜
+
+    已注册的滤镜按声明选择最快的实现：相邻的查找表滤镜合并为一次遍历，
+    拥有缓冲区时优先使用就地实现。未注册的滤镜走保守路径：不与其他滤镜合并，
+    且在不拥有缓冲区时传入副本，避免改写源数据。
+
+    参数:
+        funcs: 滤镜函数或已注册滤镜名称的列表
+        pixel_data: 输入像素数据
+        color_mode: 颜色模式
+        size: (宽, 高)
+        owned: 调用方是否允许改写 pixel_data
+
+    返回:
+        (处理后的像素数据, 结果是否可由调用方改写)
+    """
+    pool = get_buffer_pool()
+    source = None if owned else pixel_data
+    data = pixel_data
+    i = 0
+    while i < len(funcs):
+        func = funcs[i]
+        spec = get_filter_spec(func)
+
+        if spec is None and isinstance(func, str):
+            raise ValueError(f"Unknown filter: {func}")
+        if spec is None:
+            previous = data if owned else None
+            data = func(data if owned else pool.copy(data))
+            owned = isinstance(data, bytearray)
+            if previous is not None and previous is not data:
+                pool.release(previous)
+            i += 1
+            continue
+
+        if not spec.supports(color_mode):
+            raise ValueError(f"Filter {spec.name} does not support color mode {color_mode}")
+
+        # 合并连续的查找表滤镜
+        luts, count = chain_channel_luts(funcs[i:], color_mode)
+        if luts is not None:
+            i += count
+            data = _apply_luts(data if owned else pool.copy(data), color_mode, luts)
+            owned = True
+            continue
+
+        if spec.in_place is not None and owned:
+            data = spec.in_place(data, color_mode, size)
+        else:
+            previous = data if owned else None
+            data = (spec.vectorized or spec.func)(data, color_mode, size)
+            owned = isinstance(data, bytearray) and data is not source
+            if previous is not None and previous is not data:
+                pool.release(previous)
+        i += 1
+
+    return data, owned
+
+
+def chain_channel_luts(funcs, color_mode):
+    """
+    把序列开头连续的查找表滤镜合并为每个通道一张查找表
+
+    返回:
+        (查找表列表, 合并的滤镜数)，第一个滤镜不是查找表滤镜时返回 (None, 0)
+    """
+    luts = None
+    count = 0
+    for func in funcs:
+        spec = get_filter_spec(func)
+        if spec is None or spec.channel_lut is None or not spec.supports(color_mode):
+            break
+        next_luts = spec.channel_lut(color_mode)
+        if next_luts is None:
+            break
+        luts = next_luts if luts is None else [a.translate(b) for a, b in zip(luts, next_luts)]
+        count += 1
+    return luts, count
+
+
+def _apply_luts(data, color_mode, luts):
+    """就地对每个通道应用查找表"""
+    channels = len(color_mode)
+    for c, lut in enumerate(luts):
+        data[c::channels] = data[c::channels].translate(lut)
+    return data
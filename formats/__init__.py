@@ -31,4 +31,11 @@ def get_codec(file_path=None, header=None):
     raise ValueError("No compatible codec found")
 
 
-__all__ = ['get_codec', 'ImageAIc', 'BMPAIc', 'PNGAIc', 'JPEGAIc', 'GIFAIc']
+def probe_image(file_path):
+    """只读取文件头，返回 (宽, 高, 颜色模式)"""
+    with open(file_path, 'rb') as f:
+        header = f.read(16)
+    return get_codec(file_path, header).probe(file_path)
+
+
+__all__ = ['get_codec', 'probe_image', 'ImageAIc', 'BMPAIc', 'PNGAIc', 'JPEGAIc', 'GIFAIc']
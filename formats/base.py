@@ -20,6 +20,36 @@ class ImageAIc(ABC):
     def encode(self, image: 'WallowImage', file_path: str, **options):
         pass
 
+    def probe(self, file_path: str):
+        """只读取文件头，返回 (宽, 高, 解码后的颜色模式)"""
+        raise NotImplementedError(f"{type(self).__name__} does not support probing")
+
+    def read_orientation(self, file_path: str) -> int:
+        """读取EXIF方向标签 (1-8)，不支持的格式返回1"""
+        return 1
+
+    def decode_thumbnail(self, file_path: str, min_size: int) -> 'WallowImage':
+        """
+        以尽量低的开销解码用于预览的小图，最长边不小于 min_size (原图更小时为原图)
+
+        默认实现完整解码，JPEG优先使用文件中嵌入的缩略图。
+        """
+        return self.decode(file_path)
+
+    def decode_region(self, file_path: str, box) -> 'WallowImage':
+        """
+        只解码 box = (左, 上, 右, 下) 区域
+
+        默认实现解码整幅图像后裁剪，能按行读取的格式会覆盖此方法。
+        """
+        from core import _crop_pixels
+
+        image = self.decode(file_path)
+        left, top, right, bottom = box
+        data = _crop_pixels(image._pixel_data, (image.width, image.height),
+                            len(image.color_mode), box)
+        return WallowImage(data, image.color_mode, (right - left, bottom - top))
+
 
 class BitmapCodec(ImageAIc):
     SUPPORTED_MODES = {'RGB', 'RGBA', 'L'}
\ No newline at end of file
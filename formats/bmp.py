@@ -13,52 +13,68 @@ class BMPAIc(ImageAIc):  # 将BMP改名为BMPAIc
         # BMP文件头标识
         return header.startswith(b'BM')
 
-    def decode(self, file_path):
+    def probe(self, file_path):
         with open(file_path, 'rb') as f:
-            bmp_data = f.read()
-
-        # 读取头信息
-        header_size = struct.unpack('<I', bmp_data[14:18])[0]
-        width = struct.unpack('<i', bmp_data[18:22])[0]
-        height = struct.unpack('<i', bmp_data[22:26])[0]
-        bpp = struct.unpack('<H', bmp_data[28:30])[0]
-
-        if bpp != 24 and bpp != 32:
-            raise ValueError(f"Unsupported BMP bit depth: {bpp}")
-
-        # 像素数据偏移位置
-        pixel_offset = struct.unpack('<I', bmp_data[10:14])[0]
-
-        # 读取像素数据
-        pixel_data = bytearray()
-
-        # 确定颜色模式
-        if bpp == 24:
-            color_mode = 'RGB'
-        else:  # bpp == 32
-            color_mode = 'RGBA'
+            header = f.read(30)
+        if len(header) < 30 or not self.detect(header):
+            raise ValueError("Not a valid BMP file")
+        width = struct.unpack('<i', header[18:22])[0]
+        height = struct.unpack('<i', header[22:26])[0]
+        bpp = struct.unpack('<H', header[28:30])[0]
+        return width, abs(height), 'RGBA' if bpp == 32 else 'RGB'
 
-        # BMP像素数据是从下到上存储的
-        row_size = width * (bpp // 8)
-        padding = (4 - (row_size % 4)) % 4  # 每行需要填充到4字节的倍数
-
-        for y in range(height - 1, -1, -1):
-            row_start = pixel_offset + y * (row_size + padding)
-            row_end = row_start + row_size
-            row_data = bmp_data[row_start:row_end]
+    def decode(self, file_path):
+        return self.decode_region(file_path, None)
 
+    def decode_region(self, file_path, box):
+        """按行读取，只读取 box 覆盖的行；box为None时解码整幅图像"""
+        with open(file_path, 'rb') as f:
+            header = f.read(30)
+            if len(header) < 30 or not self.detect(header):
+                raise ValueError("Not a valid BMP file")
+
+            # 读取头信息
+            pixel_offset = struct.unpack('<I', header[10:14])[0]  # 像素数据偏移位置
+            width = struct.unpack('<i', header[18:22])[0]
+            height = struct.unpack('<i', header[22:26])[0]
+            bpp = struct.unpack('<H', header[28:30])[0]
+
+            if bpp != 24 and bpp != 32:
+                raise ValueError(f"Unsupported BMP bit depth: {bpp}")
+
+            # 确定颜色模式
+            color_mode = 'RGB' if bpp == 24 else 'RGBA'
+            channels = bpp // 8
+
+            # BMP像素数据通常是从下到上存储的，高度为负时从上到下
+            bottom_up = height > 0
+            height = abs(height)
+            left, top, right, bottom = box or (0, 0, width, height)
+            row_size = width * channels
+            padded_row_size = row_size + (4 - (row_size % 4)) % 4  # 每行填充到4字节的倍数
+
+            # 需要的行在文件中是连续的，一次读出
+            first_row = height - bottom if bottom_up else top
+            f.seek(pixel_offset + first_row * padded_row_size)
+            rows = f.read((bottom - top) * padded_row_size)
+
+        region_width = right - left
+        out_row = region_width * channels
+        pixel_data = bytearray(out_row * (bottom - top))
+        for i in range(bottom - top):
+            y = (bottom - top - 1 - i) if bottom_up else i
+            start = i * padded_row_size + left * channels
+            row_data = rows[start:start + out_row]
+            dst = y * out_row
             # 在BMP中，RGB顺序是BGR
-            for i in range(0, len(row_data), bpp // 8):
-                if bpp == 24:  # RGB
-                    b, g, r = row_data[i:i + 3]
-                    pixel_data.extend([r, g, b])
-                else:  # RGBA
-                    b, g, r, a = row_data[i:i + 4]
-                    pixel_data.extend([r, g, b, a])
+            pixel_data[dst:dst + out_row] = row_data
+            pixel_data[dst:dst + out_row:channels] = row_data[2::channels]
+            pixel_data[dst + 2:dst + out_row:channels] = row_data[0::channels]
 
-        return WallowImage(pixel_data, color_mode, (width, height))
+        return WallowImage(pixel_data, color_mode, (region_width, bottom - top))
 
-    def encode(self, pixel_data, color_mode, dimensions, output_path):
+    def encode(self, pixel_data, color_mode, dimensions, output_path, quality=85):
+        # 无损格式，quality参数仅为与其他编解码器保持一致
         width, height = dimensions
 
         # BMP文件头（14字节）
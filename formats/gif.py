@@ -1,3 +1,4 @@
+import struct
 from io import BytesIO
 
 try:
@@ -20,6 +21,14 @@ class GIFAIc(ImageAIc):
         return (header.startswith(b'GIF87a') or
                 header.startswith(b'GIF89a'))
 
+    def probe(self, file_path):
+        with open(file_path, 'rb') as f:
+            header = f.read(10)
+        if len(header) < 10 or not self.detect(header):
+            raise ValueError("Not a valid GIF file")
+        width, height = struct.unpack('<HH', header[6:10])
+        return width, height, 'RGB'
+
     def decode(self, file_path):
         if not PIL_AVAILABLE:
             raise ImportError("PIL/Pillow library is required for GIF support")
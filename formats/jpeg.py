@@ -1,5 +1,7 @@
+import math
 import struct
 from io import BytesIO
+from operator import itemgetter
 
 try:
     from PIL import Image as PILImage
@@ -20,20 +22,45 @@ class JPEGAIc(ImageAIc):
         # JPEG文件头标识 (SOI marker)
         return header.startswith(b'\xFF\xD8\xFF')
 
-    def decode(self, file_path):
-        if not PIL_AVAILABLE:
-            raise ImportError("PIL/Pillow library is required for JPEG support")
+    def probe(self, file_path):
+        # 逐个跳过标记段，直到遇到SOF帧头
+        with open(file_path, 'rb') as f:
+            width, height = _frame_size(f)
+        return width, height, 'RGB'
+
+    def read_orientation(self, file_path):
+        with open(file_path, 'rb') as f:
+            for marker, length in _iter_segments(f):
+                if marker == 0xE1:
+                    payload = f.read(length)
+                    if payload.startswith(b'Exif\x00\x00'):
+                        return _exif_orientation(payload[6:])
+                elif marker == 0xDA or 0xC0 <= marker <= 0xCF:
+                    break
+        return 1
+
+    def decode(self, file_path, draft_size=None):
+        image = _decode_pil(file_path, draft_size)
+        image.orientation = self.read_orientation(file_path)
+        return image
 
-        with PILImage.open(file_path) as img:
-            # 将PIL图像转换为RGB模式
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
+    def decode_thumbnail(self, file_path, min_size):
+        # 只读取图像数据之前的标记段，找出EXIF和JFIF中嵌入的缩略图
+        with open(file_path, 'rb') as f:
+            (width, height), orientation, candidates = _scan_thumbnails(f)
 
-            # 获取像素数据
-            width, height = img.size
-            pixel_data = bytearray(img.tobytes())
+        # 使用最长边足够、宽高比与原图一致 (允许1像素取整误差) 的最小缩略图
+        for thumb_width, thumb_height, decode in sorted(candidates, key=itemgetter(0, 1)):
+            if (max(thumb_width, thumb_height) >= min_size
+                    and abs(thumb_width * height - thumb_height * width) <= max(width, height)):
+                image = decode()
+                image.orientation = orientation
+                return image
 
-        return WallowImage(pixel_data, 'RGB', (width, height))
+        # 没有合适的缩略图时按DCT比例缩小解码，最长边不小于min_size
+        scale = min(1.0, min_size / max(width, height))
+        return self.decode(file_path, draft_size=(math.ceil(width * scale),
+                                                  math.ceil(height * scale)))
 
     def encode(self, pixel_data, color_mode, dimensions, output_path, quality=85):
         if not PIL_AVAILABLE:
@@ -50,3 +77,185 @@ class JPEGAIc(ImageAIc):
 
         # 保存为JPEG
         pil_img.save(output_path, format='JPEG', quality=quality)
+
+
+def _decode_pil(source, draft_size=None):
+    """用PIL解码文件路径或文件对象中的JPEG为RGB图像"""
+    if not PIL_AVAILABLE:
+        raise ImportError("PIL/Pillow library is required for JPEG support")
+
+    with PILImage.open(source) as img:
+        # 只需要小图时让解码器按1/2、1/4或1/8比例解码DCT系数
+        if draft_size is not None:
+            img.draft('RGB', draft_size)
+
+        # 将PIL图像转换为RGB模式
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        # 获取像素数据
+        width, height = img.size
+        pixel_data = bytearray(img.tobytes())
+
+    return WallowImage(pixel_data, 'RGB', (width, height))
+
+
+def _is_frame_header(marker):
+    # SOF0-SOF15，0xC4 (DHT)、0xC8 (JPG)、0xCC (DAC) 除外
+    return 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC)
+
+
+def _frame_size(f):
+    """跳过标记段直到SOF帧头，返回 (宽, 高)"""
+    for marker, _ in _iter_segments(f):
+        if _is_frame_header(marker):
+            _, height, width = struct.unpack('>BHH', f.read(5))
+            return width, height
+    raise ValueError("JPEG frame header not found")
+
+
+def _scan_thumbnails(f):
+    """
+    读取SOF帧头之前的标记段，收集嵌入的缩略图
+
+    返回:
+        ((宽, 高), EXIF方向, [(缩略图宽, 缩略图高, 解码函数)])
+    """
+    orientation = 1
+    candidates = []
+    for marker, length in _iter_segments(f):
+        if _is_frame_header(marker):
+            _, height, width = struct.unpack('>BHH', f.read(5))
+            return (width, height), orientation, [c for c in candidates if c is not None]
+        if marker == 0xE1:
+            payload = f.read(length)
+            if payload.startswith(b'Exif\x00\x00'):
+                orientation = _exif_orientation(payload[6:])
+                thumbnail = _exif_thumbnail(payload[6:])
+                if thumbnail is not None:
+                    candidates.append(_jpeg_thumbnail(thumbnail))
+        elif marker == 0xE0:
+            candidates.append(_jfif_thumbnail(f.read(length)))
+    raise ValueError("JPEG frame header not found")
+
+
+def _jpeg_thumbnail(data):
+    """以JPEG压缩的缩略图，没有PIL或无法解析时返回None"""
+    if not PIL_AVAILABLE:
+        return None
+    try:
+        width, height = _frame_size(BytesIO(data))
+    except (ValueError, struct.error):
+        return None
+    return width, height, lambda: _decode_pil(BytesIO(data))
+
+
+def _jfif_thumbnail(payload):
+    """APP0段中的JFIF (RGB) 或JFXX扩展 (JPEG、调色板、RGB) 缩略图，没有时返回None"""
+    if payload.startswith(b'JFIF\x00') and len(payload) >= 14:
+        width, height = payload[12], payload[13]
+        rgb = payload[14:14 + width * height * 3]
+    elif payload.startswith(b'JFXX\x00') and len(payload) >= 6:
+        code = payload[5]
+        if code == 0x10:
+            return _jpeg_thumbnail(payload[6:])
+        width, height = payload[6:8] if len(payload) >= 8 else (0, 0)
+        if code == 0x11:
+            palette = payload[8:8 + 768]
+            indices = payload[8 + 768:8 + 768 + width * height]
+            if len(palette) < 768 or len(indices) < width * height:
+                return None
+            # 按通道查表后交错为RGB
+            rgb = bytearray(width * height * 3)
+            for c in range(3):
+                rgb[c::3] = indices.translate(palette[c::3])
+        elif code == 0x13:
+            rgb = payload[8:8 + width * height * 3]
+        else:
+            return None
+    else:
+        return None
+
+    if not width or not height or len(rgb) < width * height * 3:
+        return None
+    return width, height, lambda: WallowImage(rgb, 'RGB', (width, height))
+
+
+def _iter_segments(f):
+    """
+    依次遍历JPEG文件头部的标记段，到SOS (图像数据开始) 为止
+
+    生成:
+        (标记, 段数据长度)，生成时文件位于段数据开头，调用方可以读取段数据
+    """
+    if f.read(2) != b'\xFF\xD8':
+        raise ValueError("Not a valid JPEG file")
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            raise ValueError("Invalid JPEG marker")
+        if marker[1] in (0x01, 0xFF) or 0xD0 <= marker[1] <= 0xD7:
+            # 填充字节和不带长度的标记
+            if marker[1] == 0xFF:
+                f.seek(-1, 1)
+            continue
+        if marker[1] == 0xD9:  # EOI
+            return
+        length = struct.unpack('>H', f.read(2))[0] - 2
+        start = f.tell()
+        yield marker[1], length
+        if marker[1] == 0xDA:
+            return
+        f.seek(start + length)
+
+
+def _exif_thumbnail(tiff):
+    """读取EXIF中IFD1指向的JPEG缩略图数据，没有时返回None"""
+    if tiff[:2] == b'II':
+        order = '<'
+    elif tiff[:2] == b'MM':
+        order = '>'
+    else:
+        return None
+    try:
+        ifd0 = struct.unpack(order + 'I', tiff[4:8])[0]
+        count = struct.unpack(order + 'H', tiff[ifd0:ifd0 + 2])[0]
+        ifd1 = struct.unpack(order + 'I', tiff[ifd0 + 2 + count * 12:ifd0 + 6 + count * 12])[0]
+        if not ifd1:
+            return None
+        values = {}
+        count = struct.unpack(order + 'H', tiff[ifd1:ifd1 + 2])[0]
+        for i in range(count):
+            entry = ifd1 + 2 + i * 12
+            tag, value_type = struct.unpack(order + 'HH', tiff[entry:entry + 4])
+            # JPEGInterchangeFormat (偏移) 和 JPEGInterchangeFormatLength (长度)
+            if tag in (0x0201, 0x0202) and value_type == 4:  # LONG
+                values[tag] = struct.unpack(order + 'I', tiff[entry + 8:entry + 12])[0]
+    except struct.error:
+        return None
+    if 0x0201 not in values or 0x0202 not in values:
+        return None
+    data = tiff[values[0x0201]:values[0x0201] + values[0x0202]]
+    return data if data.startswith(b'\xFF\xD8') else None
+
+
+def _exif_orientation(tiff):
+    """从EXIF的TIFF数据中读取IFD0的方向标签 (0x0112)，没有时返回1"""
+    if tiff[:2] == b'II':
+        order = '<'
+    elif tiff[:2] == b'MM':
+        order = '>'
+    else:
+        return 1
+    try:
+        ifd_offset = struct.unpack(order + 'I', tiff[4:8])[0]
+        count = struct.unpack(order + 'H', tiff[ifd_offset:ifd_offset + 2])[0]
+        for i in range(count):
+            entry = ifd_offset + 2 + i * 12
+            tag, value_type = struct.unpack(order + 'HH', tiff[entry:entry + 4])
+            if tag == 0x0112 and value_type == 3:  # SHORT
+                value = struct.unpack(order + 'H', tiff[entry + 8:entry + 10])[0]
+                return value if 1 <= value <= 8 else 1
+    except struct.error:
+        pass
+    return 1
@@ -14,72 +14,103 @@ class PNGAIc(ImageAIc):  # 将PNG改名为PNGAIc
         # PNG文件头标识
         return header.startswith(b'\x89PNG\r\n\x1a\n')
 
-    def decode(self, file_path):
+    def probe(self, file_path):
         with open(file_path, 'rb') as f:
-            png_data = f.read()
-
-        # 检查PNG签名
-        if not self.detect(png_data[:8]):
+            header = f.read(29)
+        if len(header) < 29 or not self.detect(header):
             raise ValueError("Not a valid PNG file")
+        width, height = struct.unpack('>II', header[16:24])
+        color_type = header[25]
+        return width, height, 'RGBA' if color_type == 6 else 'RGB'
 
-        # 解析IHDR块
-        ihdr_data = png_data[16:29]
-        width = struct.unpack('>I', ihdr_data[0:4])[0]
-        height = struct.unpack('>I', ihdr_data[4:8])[0]
-        bit_depth = ihdr_data[8]
-        color_type = ihdr_data[9]
-
-        # 目前仅支持RGB和RGBA格式
-        if color_type == 2:  # RGB
-            color_mode = 'RGB'
-            bytes_per_pixel = 3
-        elif color_type == 6:  # RGBA
-            color_mode = 'RGBA'
-            bytes_per_pixel = 4
-        else:
-            raise ValueError(f"Unsupported PNG color type: {color_type}")
-
-        if bit_depth != 8:
-            raise ValueError(f"Unsupported PNG bit depth: {bit_depth}")
-
-        # 提取IDAT块并合并
-        idat_data = bytearray()
-        offset = 8  # 跳过PNG签名
-
-        while offset < len(png_data):
-            chunk_length = struct.unpack('>I', png_data[offset:offset + 4])[0]
-            chunk_type = png_data[offset + 4:offset + 8]
-            chunk_data = png_data[offset + 8:offset + 8 + chunk_length]
-
-            if chunk_type == b'IDAT':
-                idat_data.extend(chunk_data)
-            elif chunk_type == b'IEND':
-                break
-
-            offset += 12 + chunk_length  # 跳到下一个块
-
-        # 解压IDAT数据
-        decompressed_data = zlib.decompress(idat_data)
-
-        # 解析像素数据
-        pixel_data = bytearray(width * height * bytes_per_pixel)
-        stride = width * bytes_per_pixel + 1  # +1是因为每行前面有一个过滤类型字节
-
-        for y in range(height):
-            filter_type = decompressed_data[y * stride]
-            row_start = y * width * bytes_per_pixel
+    def decode(self, file_path):
+        return self.decode_region(file_path, None)
 
-            for x in range(width):
-                src_pos = y * stride + 1 + x * bytes_per_pixel
-                dst_pos = row_start + x * bytes_per_pixel
+    def decode_region(self, file_path, box):
+        """
+        解码 box 覆盖的行；box为None时解码整幅图像
 
-                # 复制像素数据（不进行过滤，简化实现）
-                for i in range(bytes_per_pixel):
-                    pixel_data[dst_pos + i] = decompressed_data[src_pos + i]
+        由于行过滤依赖上一行，仍需从第一行解压到最后一个需要的行，
+        但之后的IDAT数据不再读取和解压。
+        """
+        with open(file_path, 'rb') as f:
+            # 检查PNG签名
+            if not self.detect(f.read(8)):
+                raise ValueError("Not a valid PNG file")
+
+            # 解析IHDR块
+            ihdr_data = f.read(25)[8:21]
+            width = struct.unpack('>I', ihdr_data[0:4])[0]
+            height = struct.unpack('>I', ihdr_data[4:8])[0]
+            bit_depth = ihdr_data[8]
+            color_type = ihdr_data[9]
+            interlace = ihdr_data[12]
+
+            # 目前仅支持RGB和RGBA格式
+            if color_type == 2:  # RGB
+                color_mode = 'RGB'
+                bytes_per_pixel = 3
+            elif color_type == 6:  # RGBA
+                color_mode = 'RGBA'
+                bytes_per_pixel = 4
+            else:
+                raise ValueError(f"Unsupported PNG color type: {color_type}")
+
+            if bit_depth != 8:
+                raise ValueError(f"Unsupported PNG bit depth: {bit_depth}")
+            if interlace != 0:
+                raise ValueError("Interlaced PNG is not supported")
+
+            left, top, right, bottom = box or (0, 0, width, height)
+            row_bytes = width * bytes_per_pixel
+            stride = row_bytes + 1  # +1是因为每行前面有一个过滤类型字节
+            region_row = (right - left) * bytes_per_pixel
+            pixel_data = bytearray(region_row * (bottom - top))
+
+            decompressor = zlib.decompressobj()
+            pending = bytearray()
+            previous = bytes(row_bytes)
+            y = 0
+            while y < bottom:
+                chunk_header = f.read(8)
+                if len(chunk_header) < 8:
+                    raise ValueError("Truncated PNG data")
+                chunk_length = struct.unpack('>I', chunk_header[0:4])[0]
+                chunk_type = chunk_header[4:8]
+                if chunk_type == b'IEND':
+                    raise ValueError("Truncated PNG data")
+                if chunk_type != b'IDAT':
+                    f.seek(chunk_length + 4, 1)  # 跳过数据和CRC
+                    continue
+
+                # 解压IDAT数据，逐行还原过滤
+                pending += decompressor.decompress(f.read(chunk_length))
+                f.seek(4, 1)
+                offset = 0
+                while y < bottom and len(pending) - offset >= stride:
+                    row = _unfilter(pending[offset], pending[offset + 1:offset + stride],
+                                    previous, bytes_per_pixel)
+                    if y >= top:
+                        dst = (y - top) * region_row
+                        pixel_data[dst:dst + region_row] = \
+                            row[left * bytes_per_pixel:right * bytes_per_pixel]
+                    previous = row
+                    offset += stride
+                    y += 1
+                del pending[:offset]
+
+        return WallowImage(pixel_data, color_mode, (right - left, bottom - top))
+
+    def encode(self, pixel_data, color_mode, dimensions, output_path, quality=85):
+        # 无损格式，quality参数仅为与其他编解码器保持一致
+        png_data = self.encode_bytes(pixel_data, color_mode, dimensions)
 
-        return WallowImage(pixel_data, color_mode, (width, height))
+        # 写入PNG文件
+        with open(output_path, 'wb') as f:
+            f.write(png_data)
 
-    def encode(self, pixel_data, color_mode, dimensions, output_path):
+    def encode_bytes(self, pixel_data, color_mode, dimensions, compress_level=6):
+        """编码为内存中的PNG数据，compress_level为zlib压缩级别 (0-9)"""
         width, height = dimensions
 
         # PNG签名
@@ -105,22 +136,15 @@ class PNGAIc(ImageAIc):  # 将PNG改名为PNGAIc
         # 创建IHDR块
         ihdr = self._create_chunk(b'IHDR', ihdr_chunk)
 
-        # 准备像素数据以进行压缩
-        raw_data = bytearray(height * (width * bytes_per_pixel + 1))
-
+        # 准备像素数据以进行压缩，每行的第一个字节表示过滤类型（0表示无过滤）
+        row_bytes = width * bytes_per_pixel
+        raw_data = bytearray(height * (row_bytes + 1))
         for y in range(height):
-            # 每行的第一个字节表示过滤类型（0表示无过滤）
-            raw_data[y * (width * bytes_per_pixel + 1)] = 0
-
-            for x in range(width):
-                src_pos = (y * width + x) * bytes_per_pixel
-                dst_pos = y * (width * bytes_per_pixel + 1) + 1 + x * bytes_per_pixel
-
-                for i in range(bytes_per_pixel):
-                    raw_data[dst_pos + i] = pixel_data[src_pos + i]
+            dst_pos = y * (row_bytes + 1) + 1
+            raw_data[dst_pos:dst_pos + row_bytes] = pixel_data[y * row_bytes:(y + 1) * row_bytes]
 
         # 压缩数据
-        compressed_data = zlib.compress(raw_data)
+        compressed_data = zlib.compress(raw_data, compress_level)
 
         # 创建IDAT块
         idat = self._create_chunk(b'IDAT', compressed_data)
@@ -128,12 +152,7 @@ class PNGAIc(ImageAIc):  # 将PNG改名为PNGAIc
         # 创建IEND块
         iend = self._create_chunk(b'IEND', b'')
 
-        # 写入PNG文件
-        with open(output_path, 'wb') as f:
-            f.write(png_signature)
-            f.write(ihdr)
-            f.write(idat)
-            f.write(iend)
+        return b''.join((png_signature, ihdr, idat, iend))
 
     def _create_chunk(self, chunk_type, data):
         """创建PNG块"""
@@ -148,3 +167,38 @@ class PNGAIc(ImageAIc):  # 将PNG改名为PNGAIc
 
         chunk[8 + len(data):] = struct.pack('>I', crc)
         return chunk
+
+
+def _unfilter(filter_type, row, previous, bpp):
+    """还原一行的PNG过滤，返回原始字节"""
+    if filter_type == 0:  # None
+        return bytes(row)
+    if filter_type == 2:  # Up
+        return bytes(map(lambda a, b: (a + b) & 0xFF, row, previous))
+
+    row = bytearray(row)
+    n = len(row)
+    if filter_type == 1:  # Sub
+        for i in range(bpp, n):
+            row[i] = (row[i] + row[i - bpp]) & 0xFF
+    elif filter_type == 3:  # Average
+        for i in range(n):
+            left = row[i - bpp] if i >= bpp else 0
+            row[i] = (row[i] + ((left + previous[i]) >> 1)) & 0xFF
+    elif filter_type == 4:  # Paeth
+        for i in range(n):
+            a = row[i - bpp] if i >= bpp else 0
+            b = previous[i]
+            c = previous[i - bpp] if i >= bpp else 0
+            p = a + b - c
+            pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+            if pa <= pb and pa <= pc:
+                predictor = a
+            elif pb <= pc:
+                predictor = b
+            else:
+                predictor = c
+            row[i] = (row[i] + predictor) & 0xFF
+    else:
+        raise ValueError(f"Unsupported PNG filter type: {filter_type}")
+    return bytes(row)
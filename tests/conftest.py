@@ -0,0 +1,15 @@
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 编解码器、滤镜和工具模块以顶层模块 (core、formats、filters、utils) 导入
+sys.path.insert(0, ROOT)
+
+# utils.batch、utils.cli 等以相对导入引用 core，与 python -m wallow 一样把仓库作为 wallow 包导入
+if 'wallow' not in sys.modules:
+    _spec = importlib.util.spec_from_file_location(
+        'wallow', os.path.join(ROOT, '__init__.py'), submodule_search_locations=[ROOT])
+    sys.modules['wallow'] = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(sys.modules['wallow'])
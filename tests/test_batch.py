@@ -0,0 +1,78 @@
+import os
+import shutil
+import signal
+
+from formats.bmp import BMPAIc
+
+from core import WallowImage
+from wallow.utils.batch import batch_process, iter_batch_events, process_folder
+from wallow.utils.metrics import BatchMetrics
+
+
+def _inputs(tmp_path, count=3):
+    image = WallowImage(bytes(range(48)), 'RGB', (4, 4))
+    paths = []
+    for n in range(count):
+        path = str(tmp_path / f"in{n}.bmp")
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def _kill_worker(image):
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def test_unpicklable_task_becomes_error_events(tmp_path):
+    paths = _inputs(tmp_path)
+    metrics = BatchMetrics()
+
+    events = list(iter_batch_events(paths, lambda image: image, str(tmp_path / 'out'), workers=2,
+                                    executor='process', chunksize=2, metrics=metrics))
+
+    assert sorted(event.path for event in events) == paths
+    assert all(event.status == 'error' and event.exception is not None for event in events)
+    assert metrics.snapshot()['counts']['error'] == len(paths)
+
+
+def test_dead_worker_process_becomes_error_events(tmp_path):
+    paths = _inputs(tmp_path)
+    events = []
+
+    count = batch_process(paths, _kill_worker, str(tmp_path / 'out'), threads=1,
+                          executor='process', on_event=events.append, verbose=False)
+
+    assert count == 0
+    assert sorted(event.path for event in events) == paths
+    assert {event.status for event in events} == {'error'}
+
+
+def test_dedupe_decodes_each_input_once(tmp_path, monkeypatch):
+    source = tmp_path / 'in'
+    source.mkdir()
+    size = 16
+    patterns = [lambda x, y: x * 16, lambda x, y: 255 - x * 16,
+                lambda x, y: (x * 37 + y * 91) % 256]
+    for n, pattern in enumerate(patterns):
+        pixels = bytes(pattern(x, y) for y in range(size) for x in range(size))
+        WallowImage(pixels, 'L', (size, size)).convert('RGB').render().save(
+            str(source / f"in{n}.bmp"))
+    shutil.copy(source / 'in0.bmp', source / 'copy.bmp')
+
+    decoded = []
+    decode = BMPAIc.decode
+
+    def counting_decode(self, file_path):
+        decoded.append(os.path.basename(file_path))
+        return decode(self, file_path)
+
+    monkeypatch.setattr(BMPAIc, 'decode', counting_decode)
+    events = []
+
+    count = process_folder(str(source), lambda image: image.flip(), str(tmp_path / 'out'),
+                           dedupe=0, on_event=events.append, verbose=False)
+
+    assert count == 3
+    assert sorted(decoded) == ['copy.bmp', 'in0.bmp', 'in1.bmp', 'in2.bmp']
+    assert all(event.status == 'ok' for event in events)
+    assert sorted(os.listdir(tmp_path / 'out')) == ['in0.bmp', 'in1.bmp', 'in2.bmp']
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from core import WallowImage
+from utils.cache import OutputCache
+
+PIXELS = bytes((i * 37 + 11) % 256 for i in range(8 * 6 * 3))
+
+
+def _image(orientation=1):
+    image = WallowImage(PIXELS, 'RGB', (8, 6))
+    image.orientation = orientation
+    return image.auto_orient().resize(4, 3)
+
+
+def _files(directory):
+    return sorted(name for _, _, names in os.walk(directory) for name in names
+                  if name != '.lock')
+
+
+def test_render_hits_after_first_miss(tmp_path):
+    cache = OutputCache(str(tmp_path))
+
+    data, hit = cache.render(_image(), 'bmp')
+    again, hit_again = cache.render(_image(), 'bmp')
+
+    assert (hit, hit_again) == (False, True)
+    assert again == data
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_orientation_is_part_of_the_key(tmp_path):
+    cache = OutputCache(str(tmp_path))
+
+    assert cache.key(_image(1), 'bmp') != cache.key(_image(6), 'bmp')
+    upright, _ = cache.render(_image(1), 'bmp')
+    rotated, hit = cache.render(_image(6), 'bmp')
+    assert not hit
+    assert rotated != upright
+
+
+def test_eviction_keeps_size_under_limit(tmp_path):
+    cache = OutputCache(str(tmp_path))
+    data = b'x' * 1000
+    for n in range(5):
+        cache.put(f"{n:040x}", data)
+        os.utime(cache.path(f"{n:040x}"), (n, n))  # n越小越久未使用
+    cache.get(f"{0:040x}")  # 命中后更新修改时间
+
+    assert cache.evict(2500) <= 2500
+    assert cache.get(f"{0:040x}") == data
+    assert cache.get(f"{1:040x}") is None
+    assert cache.get(f"{4:040x}") == data
+
+
+def test_failed_write_leaves_no_entry(tmp_path):
+    cache = OutputCache(str(tmp_path))
+    key = 'ab' * 20
+
+    def write(temp_path):
+        with open(temp_path, 'wb') as f:
+            f.write(b'partial')
+        raise RuntimeError('encoder failed')
+
+    with pytest.raises(RuntimeError):
+        cache._store(key, write)
+
+    assert cache.get(key) is None
+    assert _files(tmp_path) == []
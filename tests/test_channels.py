@@ -0,0 +1,63 @@
+from core import WallowImage
+from utils.pool import get_buffer_pool
+
+WIDTH, HEIGHT = 6, 4
+PIXELS = bytes((i * 37 + 11) % 256 for i in range(WIDTH * HEIGHT * 4))
+
+
+def _overwrite_pool(size):
+    # 取出缓冲池中同尺寸的空闲缓冲区并写满，模拟下一个文件复用它们
+    pool = get_buffer_pool()
+    buffers = [pool.acquire(size) for _ in range(pool.max_per_bucket + 1)]
+    for buf in buffers:
+        buf[:] = b'\xAA' * size
+    for buf in buffers:
+        pool.release(buf)
+
+
+def test_split_channels_survive_parent_save(tmp_path):
+    parent = WallowImage(PIXELS, 'RGBA', (WIDTH, HEIGHT))
+    red, green, blue, alpha = parent.split_channels()
+
+    parent.save(str(tmp_path / 'parent.png'))
+    _overwrite_pool(WIDTH * HEIGHT)
+
+    assert bytes(red._pixel_data) == PIXELS[0::4]
+    assert bytes(alpha._pixel_data) == PIXELS[3::4]
+
+
+def test_get_channel_survives_layout_change_and_close():
+    image = WallowImage(PIXELS, 'RGBA', (WIDTH, HEIGHT))
+    interleaved = image.get_channel('G')
+    image.to_planar()
+    planar = image.get_channel('B')
+    image.render()
+    image.close()
+    _overwrite_pool(WIDTH * HEIGHT * 4)
+    _overwrite_pool(WIDTH * HEIGHT)
+
+    assert bytes(interleaved) == PIXELS[1::4]
+    assert bytes(planar) == PIXELS[2::4]
+
+
+def test_channel_lut_does_not_change_lent_view():
+    invert = bytes(255 - v for v in range(256))
+    for planar in (False, True):
+        image = WallowImage(PIXELS, 'RGBA', (WIDTH, HEIGHT))
+        if planar:
+            image.to_planar()
+        view = image.get_channel('R')
+        image.apply_channel_lut('R', invert)
+
+        assert bytes(view) == PIXELS[0::4]
+        assert bytes(image.get_channel('R')) == PIXELS[0::4].translate(invert)
+
+
+def test_merge_channels_round_trip():
+    image = WallowImage(PIXELS, 'RGBA', (WIDTH, HEIGHT))
+    swapped = WallowImage.merge_channels(
+        [image.get_channel(c) for c in 'BGRA'], 'RGBA', (WIDTH, HEIGHT))
+
+    expected = bytearray(PIXELS)
+    expected[0::4], expected[2::4] = PIXELS[2::4], PIXELS[0::4]
+    assert bytes(swapped._pixel_data) == bytes(expected)
@@ -0,0 +1,140 @@
+import filters.color
+from core import WallowImage
+from filters.registry import get_filter_spec
+from utils.color import (cmyk_to_rgb, hsv_to_rgb_image, image_rgb_to_hsv, image_rgb_to_lab,
+                         lab_to_rgb_image)
+
+WIDTH, HEIGHT = 5, 3
+PIXELS = bytes((i * 53 + 7) % 256 for i in range(WIDTH * HEIGHT * 3))
+
+
+def _image():
+    return WallowImage(PIXELS, 'RGB', (WIDTH, HEIGHT))
+
+
+def test_hsv_round_trip_with_top_level_utils_color():
+    result = hsv_to_rgb_image(image_rgb_to_hsv(_image()), (WIDTH, HEIGHT))
+
+    assert (result.width, result.height, result.color_mode) == (WIDTH, HEIGHT, 'RGB')
+    assert all(abs(a - b) <= 1 for a, b in zip(result._pixel_data, PIXELS))
+
+
+def test_lab_round_trip_with_top_level_utils_color():
+    result = lab_to_rgb_image(image_rgb_to_lab(_image()), (WIDTH, HEIGHT))
+
+    assert (result.width, result.height) == (WIDTH, HEIGHT)
+    assert all(abs(a - b) <= 2 for a, b in zip(result._pixel_data, PIXELS))
+
+
+def test_compiled_hsv_adjustment_apply_image():
+    lut = filters.color.compile_hsv_adjustment()
+    result = lut.apply_image(_image())
+
+    assert isinstance(result, WallowImage)
+    assert all(abs(a - b) <= 2 for a, b in zip(result._pixel_data, PIXELS))
+
+
+def test_matrix_filter_fast_paths_match_reference():
+    # 最后一个像素的精确灰度值为 1，按浮点计算为 0.9999999999999999
+    data = bytes(range(256)) * 3 + bytes((1, 1, 1))
+    for name, func in (('grayscale', filters.color.grayscale_filter),
+                       ('sepia', filters.color.sepia_filter)):
+        spec = get_filter_spec(name)
+        expected = bytes(func(data, 'RGB'))
+
+        assert bytes(spec.vectorized(data, 'RGB')) == expected
+        assert bytes(spec.in_place(bytearray(data), 'RGB')) == expected
+
+
+def test_make_levels_filter_uses_clip():
+    data = bytes((i * 13) % 200 + 20 for i in range(64 * 48 * 3))
+    for per_channel, reference in ((True, filters.color.auto_levels),
+                                   (False, filters.color.auto_contrast)):
+        levels = filters.color.make_levels_filter(5.0, per_channel)
+        result = WallowImage(data, 'RGB', (64, 48)).apply_filter(levels).render()
+        expected = reference(WallowImage(data, 'RGB', (64, 48)), clip=5.0)
+
+        assert bytes(result._pixel_data) == bytes(expected._pixel_data)
+        assert bytes(result._pixel_data) != bytes(
+            reference(WallowImage(data, 'RGB', (64, 48)))._pixel_data)
+
+
+def test_levels_keep_premultiplied_alpha():
+    # Alpha取值 10..200，颜色通道不超过Alpha (预乘)
+    alpha = [10 + i * 190 // 47 for i in range(48)]
+    data = bytes(v for a in alpha for v in (a // 2, a // 3, a // 4, a))
+    for name in ('auto_levels', 'auto_contrast'):
+        image = WallowImage(data, 'RGBa', (8, 6)).apply_filter(name)
+        result = image.render()._pixel_data
+        direct = getattr(filters.color, name)(WallowImage(data, 'RGBa', (8, 6)), clip=0.5)
+
+        assert bytes(result[3::4]) == bytes(alpha)
+        assert bytes(direct._pixel_data[3::4]) == bytes(alpha)
+        assert bytes(result[0::4]) != data[0::4]
+
+
+def test_color_lut_keeps_no_memo_between_calls():
+    lut = filters.color.compile_hsv_adjustment(hue=30)
+    first = bytes(lut.apply(PIXELS, 'RGB'))
+
+    assert bytes(lut.apply(PIXELS, 'RGB')) == first
+    assert not any(hasattr(value, 'cache_info') for value in vars(lut).values())
+
+
+def test_cmyk_to_rgb():
+    assert cmyk_to_rgb(0, 0, 0, 0) == (255, 255, 255)
+    assert cmyk_to_rgb(0, 1, 1, 0) == (255, 0, 0)
+    assert cmyk_to_rgb(0, 0, 0, 0.5) == (127, 127, 127)
+
+
+def _exact_hsv(hue=0.0, saturation=1.0, lightness=0.0):
+    from utils.color import hsv_to_rgb, rgb_to_hsv
+
+    def transform(r, g, b):
+        h, s, v = rgb_to_hsv(r, g, b)
+        s = max(0.0, min(100.0, s * saturation))
+        v = v + (100 - v) * lightness if lightness > 0 else v * (1 + lightness)
+        return tuple(max(0, min(255, round(c))) for c in hsv_to_rgb((h + hue) % 360, s, v))
+    return transform
+
+
+def test_hsv_adjustment_error_bound():
+    # 包括黑色附近 (0-15) 的所有颜色和较粗的全范围网格
+    colors = [(r, g, b) for r in range(16) for g in range(0, 16, 3) for b in range(16)]
+    colors += [(r, g, b) for r in range(0, 256, 17) for g in range(0, 256, 17)
+               for b in range(0, 256, 17)]
+    # 与 compile_hsv_adjustment 文档中的误差范围一致
+    for params, bound in (({'hue': 30}, 2), ({'lightness': 0.6}, 2), ({'lightness': 1.0}, 2),
+                          ({'lightness': -0.4}, 2), ({'hue': 20, 'lightness': 0.3}, 2),
+                          ({'saturation': 1.5}, 5), ({'saturation': 1.5, 'lightness': 0.6}, 5)):
+        lut = filters.color.compile_hsv_adjustment(**params)
+        exact = _exact_hsv(**params)
+        worst = max(abs(a - b) for color in colors for a, b in zip(lut(*color), exact(*color)))
+
+        assert worst <= bound, params
+
+
+def test_color_matrix_rounds_half_up():
+    pixels = bytes((3, 6, 0, 5, 0, 0, 1, 2, 0))
+    # 无交叉项的查找表与有交叉项的定点乘积表都按0.5进位
+    scale = [[0.5, 0, 0], [0, 1, 0], [0, 0, 1]]
+    cross = [[0.5, 0.6, 0], [0, 1, 0], [0, 0, 1]]
+
+    scaled = filters.color.apply_color_matrix(WallowImage(pixels, 'RGB', (3, 1)), scale)
+    mixed = filters.color.apply_color_matrix(WallowImage(pixels, 'RGB', (3, 1)), cross)
+    truncated = filters.color.apply_color_matrix(WallowImage(pixels, 'RGB', (3, 1)), cross,
+                                                 truncate=True)
+
+    assert bytes(scaled._pixel_data[::3]) == bytes((2, 3, 1))  # 1.5、2.5、0.5
+    assert bytes(mixed._pixel_data[::3]) == bytes((5, 3, 2))  # 5.1、2.5、1.7
+    assert bytes(truncated._pixel_data[::3]) == bytes((5, 2, 1))
+
+
+def test_color_matrix_treats_rgb_alpha_as_opaque():
+    # R' = R + 0.1 * A，RGB图像的A按255计算
+    matrix = [[1, 0, 0, 0.1, 0], [0, 1, 0, 0, 0], [0, 0, 1, 0, 0], [0, 0, 0, 1, 0]]
+    rgb = WallowImage(bytes((0, 0, 0, 100, 0, 0)), 'RGB', (2, 1))
+    rgba = WallowImage(bytes((0, 0, 0, 255, 100, 0, 0, 10)), 'RGBA', (2, 1))
+
+    assert bytes(filters.color.apply_color_matrix(rgb, matrix)._pixel_data[::3]) == b'\x1a\x7e'
+    assert bytes(filters.color.apply_color_matrix(rgba, matrix)._pixel_data[::4]) == b'\x1a\x65'
@@ -0,0 +1,33 @@
+from core import WallowImage
+from filters.registry import make_lut_filter
+
+WIDTH, HEIGHT = 6, 4
+INVERT = make_lut_filter(bytes(255 - v for v in range(256)), 'invert')
+HALVE = make_lut_filter(bytes(v // 2 for v in range(256)), 'halve')
+
+
+def _image(mode):
+    data = bytes((i * 37 + 11) % 256 for i in range(WIDTH * HEIGHT * len(mode)))
+    return WallowImage(data, mode, (WIDTH, HEIGHT))
+
+
+def _step_by_step(image, ops):
+    for op in ops:
+        image = WallowImage._from_buffer(bytearray(image._pixel_data), image.color_mode,
+                                         (image.width, image.height))
+        image._operation_stack = [op]
+        image = image.render()
+    return image
+
+
+def test_lut_filters_fused_into_convert_match_separate_passes():
+    for src, dst in (('L', 'RGBA'), ('RGBA', 'L'), ('RGB', 'RGBa'), ('RGBa', 'RGB'), ('LA', 'LA')):
+        ops = [('filter', {'func': INVERT}), ('convert', {'mode': dst, 'background': 200}),
+               ('filter', {'func': HALVE}), ('filter', {'func': INVERT})]
+        image = _image(src)
+        image._operation_stack = list(ops)
+        fused = image.render()
+        expected = _step_by_step(_image(src), ops)
+
+        assert fused.color_mode == expected.color_mode == dst
+        assert bytes(fused._pixel_data) == bytes(expected._pixel_data)
@@ -0,0 +1,61 @@
+import pytest
+
+from core import WallowImage
+from filters.registry import register_filter
+
+WIDTH, HEIGHT = 12, 9
+CALLS = []
+
+
+@register_filter(halo=1, modes=('L',))
+def _box_blur(pixel_data, color_mode, size):
+    """3x3均值模糊，图像边缘按最近的像素延伸"""
+    width, height = size
+    CALLS.append(size)
+    out = bytearray(len(pixel_data))
+    for y in range(height):
+        rows = [min(max(y + d, 0), height - 1) * width for d in (-1, 0, 1)]
+        for x in range(width):
+            columns = [min(max(x + d, 0), width - 1) for d in (-1, 0, 1)]
+            out[y * width + x] = sum(pixel_data[r + c] for r in rows for c in columns) // 9
+    return out
+
+
+def _source():
+    return WallowImage(bytes((x * 29 + y * 53 + x * y * 7) % 256
+                             for y in range(HEIGHT) for x in range(WIDTH)), 'L', (WIDTH, HEIGHT))
+
+
+def _crop(data, size, box):
+    width = size[0]
+    left, top, right, bottom = box
+    return b''.join(bytes(data[y * width + left:y * width + right]) for y in range(top, bottom))
+
+
+@pytest.mark.parametrize('box', [(3, 2, 8, 6), (0, 0, 4, 3), (7, 5, 12, 9), (0, 4, 12, 5)])
+def test_crop_after_halo_filter_matches_full_frame(box):
+    image = _source()
+    expected = _crop(_box_blur(_box_blur(image._pixel_data, 'L', (WIDTH, HEIGHT)), 'L',
+                               (WIDTH, HEIGHT)), (WIDTH, HEIGHT), box)
+    CALLS.clear()
+
+    result = image.apply_filter(_box_blur).apply_filter(_box_blur).crop(box).render()
+
+    assert (result.width, result.height) == (box[2] - box[0], box[3] - box[1])
+    assert bytes(result._pixel_data) == expected
+    # 每经过一个滤镜，区域向外扩展1像素 (不超出图像)，而不是处理整幅图像
+    left, top, right, bottom = box
+    outer = (min(right + 2, WIDTH) - max(left - 2, 0), min(bottom + 2, HEIGHT) - max(top - 2, 0))
+    inner = (min(right + 1, WIDTH) - max(left - 1, 0), min(bottom + 1, HEIGHT) - max(top - 1, 0))
+    assert CALLS == [outer, inner]
+
+
+def test_crop_region_maps_through_flip_before_halo_filter():
+    flipped = _source().flip().render()
+    full = _box_blur(flipped._pixel_data, 'L', (WIDTH, HEIGHT))
+    CALLS.clear()
+
+    result = _source().flip().apply_filter(_box_blur).crop((1, 1, 5, 4)).render()
+
+    assert bytes(result._pixel_data) == _crop(full, (WIDTH, HEIGHT), (1, 1, 5, 4))
+    assert CALLS == [(6, 5)]
@@ -0,0 +1,44 @@
+import filters.color
+from filters.registry import get_filter_spec, make_lut_filter, run_filter_chain
+
+WIDTH, HEIGHT = 6, 4
+PIXELS = bytes((i * 37 + 11) % 256 for i in range(WIDTH * HEIGHT * 3))
+INVERT = make_lut_filter(bytes(255 - v for v in range(256)), 'invert')
+HALVE = make_lut_filter(bytes(v // 2 for v in range(256)), 'halve')
+
+
+def _swap_red_blue(data):
+    # 未注册的滤镜：只接收像素数据
+    out = bytearray(data)
+    out[0::3], out[2::3] = data[2::3], data[0::3]
+    return out
+
+
+def _separately(funcs, data):
+    """逐个调用基础实现 (未注册的滤镜直接调用)，作为参照"""
+    for func in funcs:
+        spec = get_filter_spec(func)
+        data = spec.func(data, 'RGB', (WIDTH, HEIGHT)) if spec else func(data)
+    return bytes(data)
+
+
+def _run(funcs, owned):
+    source = bytearray(PIXELS)
+    data, _ = run_filter_chain(funcs, source, 'RGB', (WIDTH, HEIGHT), owned=owned)
+    if not owned:
+        assert source == PIXELS
+    return bytes(data)
+
+
+def test_fused_in_place_and_opaque_chains_match_separate_calls():
+    chains = [
+        [INVERT, HALVE, INVERT],
+        [filters.color.grayscale_filter, filters.color.sepia_filter],
+        [INVERT, lambda data: _swap_red_blue(data), 'sepia', HALVE],
+        ['auto_contrast', INVERT, 'grayscale'],
+    ]
+    for funcs in chains:
+        expected = _separately(funcs, PIXELS)
+
+        assert _run(funcs, owned=False) == expected
+        assert _run(funcs, owned=True) == expected
@@ -0,0 +1,72 @@
+import os
+
+from core import WallowImage
+from formats.bmp import BMPAIc
+from wallow.utils.batch import batch_process
+
+
+def _flip(image):
+    return image.flip()
+
+
+def _mirror(image):
+    return image.flip().flip()
+
+
+def _inputs(tmp_path, count=3):
+    source = tmp_path / 'in'
+    source.mkdir()
+    paths = []
+    for n in range(count):
+        path = str(source / f"in{n}.bmp")
+        WallowImage(bytes((n * 40 + i) % 256 for i in range(48)), 'RGB', (4, 4)).save(path)
+        paths.append(path)
+    return paths
+
+
+def _run(paths, out, manifest, func=_flip):
+    events = []
+    batch_process(paths, func, str(out), threads=2, manifest=str(manifest),
+                  on_event=events.append, verbose=False)
+    return {os.path.basename(event.path): event.status for event in events}
+
+
+def test_manifest_skips_unchanged_inputs(tmp_path):
+    paths = _inputs(tmp_path)
+    out, manifest = tmp_path / 'out', tmp_path / 'manifest.db'
+
+    assert _run(paths, out, manifest) == dict.fromkeys(['in0.bmp', 'in1.bmp', 'in2.bmp'], 'ok')
+    assert set(_run(paths, out, manifest).values()) == {'skipped'}
+
+    # 输入改变、输出被删除或配方改变时重新处理
+    WallowImage(bytes(75), 'RGB', (5, 5)).save(paths[0])
+    os.remove(out / 'in1.bmp')
+    assert _run(paths, out, manifest) == {'in0.bmp': 'ok', 'in1.bmp': 'ok', 'in2.bmp': 'skipped'}
+    assert set(_run(paths, out, manifest, _mirror).values()) == {'ok'}
+
+
+def test_failed_write_keeps_previous_output(tmp_path, monkeypatch):
+    paths = _inputs(tmp_path, count=2)
+    out, manifest = tmp_path / 'out', tmp_path / 'manifest.db'
+    _run(paths, out, manifest)
+    previous = (out / 'in0.bmp').read_bytes()
+    encode = BMPAIc.encode
+
+    def failing_encode(self, pixel_data, color_mode, dimensions, output_path, quality=85):
+        if 'in0' not in output_path:
+            return encode(self, pixel_data, color_mode, dimensions, output_path, quality)
+        with open(output_path, 'wb') as f:
+            f.write(b'BM')  # 写了一半
+        raise OSError('disk full')
+
+    monkeypatch.setattr(BMPAIc, 'encode', failing_encode)
+    os.remove(out / 'in1.bmp')
+    os.utime(paths[0], ns=(0, 0))
+
+    assert _run(paths, out, manifest) == {'in0.bmp': 'error', 'in1.bmp': 'ok'}
+    assert sorted(os.listdir(out)) == ['in0.bmp', 'in1.bmp']
+    assert (out / 'in0.bmp').read_bytes() == previous
+
+    # 失败的文件不记录到清单，下次运行重新处理
+    monkeypatch.setattr(BMPAIc, 'encode', encode)
+    assert _run(paths, out, manifest) == {'in0.bmp': 'ok', 'in1.bmp': 'skipped'}
@@ -0,0 +1,90 @@
+import pytest
+
+from core import WallowImage
+
+WIDTH, HEIGHT = 4, 3
+
+
+def _mirror(rows):
+    return [row[::-1] for row in rows]
+
+
+def _flip_vertical(rows):
+    return rows[::-1]
+
+
+def _rotate_cw(rows):
+    return [list(row) for row in zip(*rows[::-1])]
+
+
+# EXIF规范：把存储的像素按这些步骤变换后为正向显示
+_EXIF_STEPS = {
+    1: [],
+    2: [_mirror],
+    3: [_rotate_cw, _rotate_cw],
+    4: [_flip_vertical],
+    5: [_mirror, _rotate_cw, _rotate_cw, _rotate_cw],
+    6: [_rotate_cw],
+    7: [_mirror, _rotate_cw],
+    8: [_rotate_cw, _rotate_cw, _rotate_cw],
+}
+
+# 同样的步骤用 flip/rotate 表示 (rotate 为逆时针)
+_METHOD_STEPS = {
+    1: [],
+    2: [('flip', 'horizontal')],
+    3: [('rotate', 180)],
+    4: [('flip', 'vertical')],
+    5: [('flip', 'horizontal'), ('rotate', 90)],
+    6: [('rotate', -90)],
+    7: [('flip', 'horizontal'), ('rotate', -90)],
+    8: [('rotate', 90)],
+}
+
+
+def _source(orientation=1):
+    image = WallowImage(bytes(range(WIDTH * HEIGHT)), 'L', (WIDTH, HEIGHT))
+    image.orientation = orientation
+    return image
+
+
+def _rows(image):
+    data = bytes(image._pixel_data)
+    return [list(data[y * image.width:(y + 1) * image.width]) for y in range(image.height)]
+
+
+def _expected(orientation):
+    rows = _rows(_source())
+    for step in _EXIF_STEPS[orientation]:
+        rows = step(rows)
+    return rows
+
+
+def test_reference_transposes_orientation_5():
+    rows = _rows(_source())
+
+    assert _expected(5) == [list(column) for column in zip(*rows)]
+
+
+@pytest.mark.parametrize('orientation', range(1, 9))
+def test_auto_orient_matches_exif_steps(orientation):
+    result = _source(orientation).auto_orient().render()
+
+    assert _rows(result) == _expected(orientation)
+    assert result.orientation == 1
+
+
+@pytest.mark.parametrize('orientation', range(1, 9))
+def test_flip_and_rotate_steps_match_auto_orient(orientation):
+    image = _source()
+    for method, argument in _METHOD_STEPS[orientation]:
+        getattr(image, method)(argument)
+
+    assert _rows(image.render()) == _expected(orientation)
+
+
+@pytest.mark.parametrize('orientation', range(1, 9))
+def test_auto_orient_composes_with_following_operations(orientation):
+    result = _source(orientation).auto_orient().flip().crop((0, 0, 2, 2)).render()
+
+    assert _rows(result) == [row[:2] for row in _mirror(_expected(orientation))[:2]]
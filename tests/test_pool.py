@@ -0,0 +1,82 @@
+import pytest
+
+from core import WallowImage
+from utils.pool import BufferPool, set_buffer_pool
+
+
+@pytest.fixture
+def pool():
+    pool = BufferPool()
+    previous = set_buffer_pool(pool)
+    yield pool
+    set_buffer_pool(previous)
+
+
+def test_released_buffer_is_reused_for_same_size():
+    pool = BufferPool()
+    buf = pool.acquire(64)
+    pool.release(buf)
+
+    assert pool.acquire(64) is buf
+    assert pool.acquire(64) is not buf
+    assert pool.acquire(32) is not buf
+    stats = pool.stats()
+    assert (stats['hits'], stats['misses'], stats['releases']) == (1, 3, 1)
+    assert stats['pooled_bytes'] == 0
+    assert stats['peak_bytes'] == 64
+
+
+def test_release_discards_beyond_limits():
+    pool = BufferPool(max_bytes=100, max_per_bucket=2)
+    buffers = [pool.acquire(30) for _ in range(3)]
+    for buf in buffers:
+        pool.release(buf)
+    pool.release(buffers[0])  # 重复归还不会让同一个缓冲区入池两次
+    pool.release(pool.acquire(50))  # 超过 max_bytes
+
+    stats = pool.stats()
+    assert stats['discards'] == 2
+    assert stats['pooled_bytes'] == 60
+    assert {id(pool.acquire(30)), id(pool.acquire(30))} == {id(buffers[0]), id(buffers[1])}
+
+
+def test_release_ignores_immutable_buffers():
+    pool = BufferPool()
+    pool.release(bytes(16))
+
+    assert pool.stats()['releases'] == 0
+    assert pool.stats()['pooled_bytes'] == 0
+
+
+def test_borrow_returns_buffer_on_exit():
+    pool = BufferPool()
+    with pytest.raises(RuntimeError):
+        with pool.borrow(16) as buf:
+            raise RuntimeError
+
+    assert pool.stats()['pooled_bytes'] == 16
+    assert pool.acquire(16) is buf
+
+
+def test_clear_drops_idle_buffers():
+    pool = BufferPool()
+    pool.release(pool.acquire(16))
+    pool.clear()
+
+    assert pool.stats()['pooled_bytes'] == 0
+    assert pool.stats()['misses'] == 1
+    pool.acquire(16)
+    assert pool.stats()['misses'] == 2
+
+
+def test_render_reuses_buffer_released_by_close(pool):
+    first = WallowImage(bytes(range(48)), 'RGB', (4, 4))
+    pixels = first._pixel_data
+    first.close()
+    assert pool.stats()['pooled_bytes'] == 48
+
+    rendered = WallowImage(bytes(48), 'RGB', (4, 4)).flip().rotate(180).render()
+
+    assert rendered._pixel_data is pixels
+    assert pool.stats()['hits'] == 1
+    assert pool.stats()['misses'] == 0
@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+from core import WallowImage
+from utils.pool import BufferPool, set_buffer_pool
+
+tk = pytest.importorskip('tkinter')
+from tk.preview import PreviewSession  # noqa: E402
+
+PIXELS = bytes((i * 37 + 11) % 256 for i in range(64 * 48 * 3))
+
+
+def test_preview_applies_exif_orientation():
+    image = WallowImage(PIXELS, 'RGB', (64, 48))
+    image.orientation = 6
+    image.auto_orient()
+    session = PreviewSession(image, max_size=(32, 32))
+
+    assert session.render()[2] == (24, 32)
+    preview = session.commit(apply=False)
+    assert (preview.width, preview.height) == (48, 64)
+    result = session.commit(apply=True)
+    assert bytes(preview._pixel_data) == bytes(result._pixel_data)
+
+
+class _RecordingPool(BufferPool):
+    def __init__(self):
+        super().__init__()
+        self.released = []
+
+    def release(self, buf):
+        self.released.append(id(buf))
+        super().release(buf)
+
+
+def test_set_viewport_defers_release_until_render_finishes():
+    pool = _RecordingPool()
+    previous = set_buffer_pool(pool)
+    try:
+        started, resume = threading.Event(), threading.Event()
+
+        def blocking(data):
+            started.set()
+            resume.wait(5)
+            return data
+
+        image = WallowImage(PIXELS, 'RGB', (64, 48))
+        image.apply_filter(blocking)
+        session = PreviewSession(image, max_size=(32, 32))
+        old_proxy = id(session._proxy[0])
+
+        worker = threading.Thread(target=session.render)
+        worker.start()
+        assert started.wait(5)
+        session.set_viewport((16, 16))
+        assert old_proxy not in pool.released
+
+        resume.set()
+        worker.join(5)
+        assert old_proxy in pool.released
+        session.close()
+    finally:
+        set_buffer_pool(previous)
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+import utils.scan
+from core import WallowImage
+from utils.scan import scan_images
+from wallow.utils.batch import process_folder
+from wallow.utils.metrics import BatchMetrics
+
+
+def _write_tree(root):
+    image = WallowImage(bytes(range(48)), 'RGB', (4, 4))
+    for directory in ('', 'good', 'locked'):
+        os.makedirs(root / directory, exist_ok=True)
+        image.save(str(root / directory / f"{directory or 'top'}.bmp"))
+
+
+def _lock(monkeypatch, path):
+    # 以root运行时chmod无效，直接让该目录的scandir失败
+    scandir = os.scandir
+
+    def failing_scandir(directory):
+        if os.path.abspath(directory) == os.path.abspath(path):
+            raise PermissionError(13, 'Permission denied', str(directory))
+        return scandir(directory)
+
+    monkeypatch.setattr(utils.scan.os, 'scandir', failing_scandir)
+
+
+def test_missing_root_raises_at_call(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        scan_images(str(tmp_path / 'missing'))
+    with pytest.raises(FileNotFoundError):
+        process_folder(str(tmp_path / 'missing'), lambda image: image, verbose=False)
+
+
+def test_unreadable_root_raises(tmp_path, monkeypatch):
+    _write_tree(tmp_path)
+    _lock(monkeypatch, tmp_path)
+
+    with pytest.raises(PermissionError):
+        scan_images(str(tmp_path), recursive=True)
+
+
+def test_unreadable_subdirectory_is_reported(tmp_path, monkeypatch):
+    _write_tree(tmp_path)
+    _lock(monkeypatch, tmp_path / 'locked')
+
+    found = sorted(os.path.relpath(p, tmp_path) for p in scan_images(str(tmp_path), recursive=True))
+    assert found == [os.path.join('good', 'good.bmp'), 'top.bmp']
+
+    events, metrics = [], BatchMetrics()
+    count = process_folder(str(tmp_path), lambda image: image, str(tmp_path / 'out'),
+                           recursive=True, on_event=events.append, metrics=metrics,
+                           verbose=False)
+
+    assert count == 2
+    errors = [event for event in events if event.status == 'error']
+    assert [os.path.abspath(event.path) for event in errors] == [str(tmp_path / 'locked')]
+    assert isinstance(errors[0].exception, PermissionError)
+    assert metrics.snapshot()['counts']['error'] == 1
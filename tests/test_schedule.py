@@ -0,0 +1,72 @@
+import threading
+import time
+
+from core import WallowImage
+from utils.schedule import MemoryScheduler, estimate_memory
+from wallow.utils.batch import batch_process
+
+
+def _save(tmp_path, name, size):
+    path = str(tmp_path / name)
+    WallowImage(bytes(size * size * 3), 'RGB', (size, size)).save(path)
+    return path
+
+
+def test_estimate_reads_header_dimensions(tmp_path):
+    path = _save(tmp_path, 'a.bmp', 10)
+
+    assert estimate_memory(path) == 10 * 10 * 3 * 3
+    assert estimate_memory(path, pipeline_factor=1) == 300
+
+
+def test_scheduler_pops_largest_within_budget(tmp_path):
+    small, large = _save(tmp_path, 'small.bmp', 10), _save(tmp_path, 'large.bmp', 20)
+    scheduler = MemoryScheduler(1600, pipeline_factor=1)
+    for path in (small, small, large):
+        scheduler.push(path)
+
+    assert scheduler.pop() == (large, 1200)
+    assert scheduler.pop() == (small, 300)
+    assert scheduler.pop() is None
+    scheduler.release(1200)
+    assert scheduler.pop() == (small, 300)
+    assert scheduler.in_use == 600
+
+
+def test_scheduler_waits_for_largest_candidate(tmp_path):
+    small, large = _save(tmp_path, 'small.bmp', 10), _save(tmp_path, 'large.bmp', 20)
+    scheduler = MemoryScheduler(1000, pipeline_factor=1)
+    scheduler.push(small)
+    scheduler.push(large)
+
+    # 最大的候选放不进剩余预算时不让小图像插队，没有任务在运行时强制提交
+    assert scheduler.pop() is None
+    assert scheduler.pop(force=True) == (large, 1200)
+    assert len(scheduler) == 1
+
+
+def test_memory_budget_caps_concurrent_work(tmp_path):
+    paths = [_save(tmp_path, f"small{n}.bmp", 10) for n in range(4)]
+    paths.insert(2, _save(tmp_path, 'large.bmp', 20))
+    budget = 2000  # 大图像估算3600，超出预算时单独运行；小图像估算900，同时最多两个
+    lock = threading.Lock()
+    active = []
+    started = []
+
+    def track(image):
+        cost = image.width * image.height * 3 * 3
+        with lock:
+            active.append(cost)
+            started.append((image.width, sum(active), len(active)))
+        time.sleep(0.05)
+        with lock:
+            active.remove(cost)
+        return image
+
+    count = batch_process(paths, track, str(tmp_path / 'out'), threads=4,
+                          memory_budget=budget, verbose=False)
+
+    assert count == len(paths)
+    assert started[0] == (20, 3600, 1)  # 大图像先提交，且独自运行
+    assert all(total <= budget for _, total, _ in started[1:])
+    assert max(running for _, _, running in started) == 2
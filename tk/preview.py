@@ -1,32 +1,695 @@
+import math
+import queue
+import threading
 import tkinter as tk
+from collections import OrderedDict
+from contextlib import contextmanager
+from operator import itemgetter
 from tkinter import filedialog
 
+from core import WallowImage, _display_size, _tk_image_data
+
+
+class TilePyramid:
+    """
+    多分辨率瓦片金字塔
+
+    第 level 层的尺寸为原图的 1/2**level。各层不预先生成，
+    瓦片在请求时直接从原图按步长取样得到，耗时只与瓦片大小有关。
+
+    参数:
+        image: WallowImage实例 (操作栈会先执行一次)
+        tile_size: 瓦片边长 (像素)
+    """
+
+    def __init__(self, image, tile_size=256):
+        if image._operation_stack:
+            image = image.render()
+        self.image = image
+        self.tile_size = tile_size
+        self.width, self.height = image.width, image.height
+        self.color_mode = image.color_mode
+        # 最高一层整幅图像不超过一个瓦片
+        self.levels = max(0, math.ceil(math.log2(max(self.width, self.height) / tile_size))) + 1
+
+    def level_size(self, level):
+        factor = 1 << level
+        return -(-self.width // factor), -(-self.height // factor)
+
+    def tile_count(self, level):
+        width, height = self.level_size(level)
+        return -(-width // self.tile_size), -(-height // self.tile_size)
+
+    def region(self, level, x0, y0, x1, y1):
+        """
+        取出第 level 层中 [x0, x1) x [y0, y1) 区域的像素
+
+        返回:
+            (像素数据, (宽, 高))
+        """
+        factor = 1 << level
+        channels = len(self.color_mode)
+        data = self.image._pixel_data
+        stride = self.width * channels
+        width = x1 - x0
+
+        out = bytearray(width * (y1 - y0) * channels)
+        row_bytes = width * channels
+        if factor == 1:
+            for y in range(y0, y1):
+                start = y * stride + x0 * channels
+                dst = (y - y0) * row_bytes
+                out[dst:dst + row_bytes] = data[start:start + row_bytes]
+            return out, (width, y1 - y0)
+
+        # 每行用同一组偏移量取样，itemgetter一次取出整行
+        span = ((width - 1) * factor + 1) * channels
+        offsets = [x * factor * channels + c for x in range(width) for c in range(channels)]
+        gather = itemgetter(*offsets) if len(offsets) > 1 else (lambda row: (row[0],))
+        for y in range(y0, y1):
+            start = y * factor * stride + x0 * factor * channels
+            dst = (y - y0) * row_bytes
+            out[dst:dst + row_bytes] = bytes(gather(data[start:start + span]))
+        return out, (width, y1 - y0)
+
+    def tile(self, level, tx, ty):
+        """第 level 层第 (tx, ty) 个瓦片的 (像素数据, (宽, 高))"""
+        width, height = self.level_size(level)
+        size = self.tile_size
+        return self.region(level, tx * size, ty * size,
+                           min((tx + 1) * size, width), min((ty + 1) * size, height))
+
+
+class TileViewer(tk.Frame):
+    """
+    支持缩放和平移的瓦片图像查看器
+
+    只转换并显示当前视口内的瓦片。瓦片在后台线程中取样和编码，
+    Tk图像只在主线程中创建；瓦片到达之前先显示放大的低分辨率概览。
+
+    操作:
+        滚轮 / + - 缩放，鼠标左键拖动平移，0 适应窗口
+
+    参数:
+        master: 父窗口
+        image: WallowImage实例
+        tile_size: 瓦片边长
+        max_tiles: 缓存的Tk瓦片图像数
+        width, height: 初始视口尺寸
+    """
+
+    MAX_ZOOM = 8
+    POLL_INTERVAL = 30
+
+    def __init__(self, master, image, tile_size=256, max_tiles=256, width=800, height=600):
+        super().__init__(master)
+        self.pyramid = TilePyramid(image, tile_size)
+        self.max_tiles = max_tiles
+        self.canvas = tk.Canvas(self, width=min(width, self.pyramid.width),
+                                height=min(height, self.pyramid.height),
+                                highlightthickness=0, background='#808080')
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+
+        self._tiles = OrderedDict()  # (level, tx, ty, 放大倍数) -> PhotoImage
+        self._visible = set()
+        self._drag = None
+        self._closed = False
+
+        # 概览图：整幅图像所在的最高一层，同步生成
+        top = self.pyramid.levels - 1
+        overview, size = self.pyramid.region(top, 0, 0, *self.pyramid.level_size(top))
+        self._overview = self._photo(overview, size)
+        self._overview_level = top
+        self._backdrop = None
+
+        # 后台线程：按请求顺序生成瓦片数据，已经移出视口的请求直接丢弃
+        self._lock = threading.Lock()
+        self._wanted = set()
+        self._requested = set()  # 已提交但结果尚未取回的瓦片 (只在主线程中访问)
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._worker = threading.Thread(target=self._load_tiles, daemon=True)
+        self._worker.start()
+
+        self.zoom = 1.0
+        self.origin = (0.0, 0.0)  # 视口左上角对应的原图坐标
+        self._fitted = False
+
+        self.canvas.bind('<Configure>', self._on_configure)
+        self.canvas.bind('<ButtonPress-1>', self._on_press)
+        self.canvas.bind('<B1-Motion>', self._on_drag)
+        self.canvas.bind('<MouseWheel>', self._on_wheel)
+        self.canvas.bind('<Button-4>', lambda e: self.zoom_at(2.0, e.x, e.y))
+        self.canvas.bind('<Button-5>', lambda e: self.zoom_at(0.5, e.x, e.y))
+        self.canvas.bind('<Key-plus>', lambda e: self.zoom_at(2.0))
+        self.canvas.bind('<Key-equal>', lambda e: self.zoom_at(2.0))
+        self.canvas.bind('<Key-minus>', lambda e: self.zoom_at(0.5))
+        self.canvas.bind('<Key-0>', lambda e: self.fit())
+        self.canvas.bind('<Destroy>', self._on_destroy)
+        self.after(self.POLL_INTERVAL, self._poll)
+
+    # 视口
+
+    def fit(self):
+        """缩放到整幅图像能完整显示的最大2的幂次比例"""
+        view_width, view_height = self._view_size()
+        scale = min(view_width / self.pyramid.width, view_height / self.pyramid.height)
+        self.zoom = self._clamp_zoom(2.0 ** math.floor(math.log2(scale)))
+        self.origin = (0.0, 0.0)
+        self.redraw()
+
+    def zoom_at(self, factor, x=None, y=None):
+        """以视口中的 (x, y) 为中心缩放 (缩放比例保持为2的幂)"""
+        view_width, view_height = self._view_size()
+        if x is None:
+            x, y = view_width / 2, view_height / 2
+        zoom = self._clamp_zoom(self.zoom * factor)
+        if zoom == self.zoom:
+            return
+        ox, oy = self.origin
+        image_x, image_y = ox + x / self.zoom, oy + y / self.zoom
+        self.zoom = zoom
+        self.origin = (image_x - x / zoom, image_y - y / zoom)
+        self.redraw()
+
+    def pan(self, dx, dy):
+        """按视口像素平移"""
+        ox, oy = self.origin
+        self.origin = (ox - dx / self.zoom, oy - dy / self.zoom)
+        self.redraw()
+
+    def _clamp_zoom(self, zoom):
+        min_zoom = 2.0 ** -(self.pyramid.levels - 1)
+        return min(self.MAX_ZOOM, max(min_zoom, zoom))
+
+    def _view_size(self):
+        return max(1, self.canvas.winfo_width()), max(1, self.canvas.winfo_height())
+
+    def _level_and_magnification(self):
+        if self.zoom >= 1:
+            return 0, int(self.zoom)
+        return round(-math.log2(self.zoom)), 1
+
+    # 绘制
+
+    def redraw(self):
+        pyramid = self.pyramid
+        view_width, view_height = self._view_size()
+        level, mag = self._level_and_magnification()
+        factor = 1 << level
+        tile_extent = pyramid.tile_size * factor  # 瓦片覆盖的原图像素数
+
+        # 限制平移范围，图像小于视口时居中
+        ox, oy = self.origin
+        ox = self._clamp_origin(ox, pyramid.width, view_width / self.zoom)
+        oy = self._clamp_origin(oy, pyramid.height, view_height / self.zoom)
+        self.origin = (ox, oy)
+
+        columns, rows = pyramid.tile_count(level)
+        tx0 = max(0, int(ox // tile_extent))
+        ty0 = max(0, int(oy // tile_extent))
+        tx1 = min(columns, int((ox + view_width / self.zoom) // tile_extent) + 1)
+        ty1 = min(rows, int((oy + view_height / self.zoom) // tile_extent) + 1)
+        visible = [(level, tx, ty) for ty in range(ty0, ty1) for tx in range(tx0, tx1)]
+        self._visible = {key + (mag,) for key in visible} | {key + (1,) for key in visible}
+
+        self.canvas.delete('tile')
+        missing = []
+        for key in visible:
+            photo = self._get_tile(key, mag)
+            if photo is None:
+                missing.append(key)
+                continue
+            _, tx, ty = key
+            self.canvas.create_image(round((tx * tile_extent - ox) * self.zoom),
+                                     round((ty * tile_extent - oy) * self.zoom),
+                                     image=photo, anchor=tk.NW, tags='tile')
+
+        with self._lock:
+            self._wanted = set(missing)
+        for key in missing:
+            if key not in self._requested:
+                self._requested.add(key)
+                self._requests.put(key)
+        self._draw_backdrop(bool(missing))
+
+    @staticmethod
+    def _clamp_origin(origin, extent, view_extent):
+        """extent 和 view_extent 均为原图像素"""
+        if extent <= view_extent:
+            return (extent - view_extent) / 2
+        return min(max(0.0, origin), extent - view_extent)
+
+    def _draw_backdrop(self, needed):
+        """在缺少瓦片的区域下方显示放大的概览图"""
+        self.canvas.delete('backdrop')
+        self._backdrop = None
+        if not needed:
+            return
+
+        view_width, view_height = self._view_size()
+        ox, oy = self.origin
+        scale = 1 << self._overview_level
+        overview_width, overview_height = self.pyramid.level_size(self._overview_level)
+        x0 = max(0, int(ox // scale))
+        y0 = max(0, int(oy // scale))
+        x1 = min(overview_width, int((ox + view_width / self.zoom) // scale) + 1)
+        y1 = min(overview_height, int((oy + view_height / self.zoom) // scale) + 1)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        # 缩放比例不小于最高一层，概览图只需按2的幂整数放大
+        ratio = int(self.zoom * scale)
+        backdrop = tk.PhotoImage(master=self.canvas)
+        backdrop.tk.call(backdrop, 'copy', self._overview, '-from', x0, y0, x1, y1,
+                         '-zoom', ratio, ratio)
+        self._backdrop = backdrop
+        self.canvas.create_image(round((x0 * scale - ox) * self.zoom),
+                                 round((y0 * scale - oy) * self.zoom),
+                                 image=backdrop, anchor=tk.NW, tags='backdrop')
+        self.canvas.tag_lower('backdrop')
+
+    # 瓦片缓存
+
+    def _photo(self, data, size):
+        image_data, image_format = _tk_image_data(data, self.pyramid.color_mode, size)
+        return tk.PhotoImage(master=self.canvas, data=image_data, format=image_format)
+
+    def _get_tile(self, key, mag):
+        photo = self._tiles.get(key + (1,))
+        if photo is None:
+            return None
+        self._tiles.move_to_end(key + (1,))
+        if mag == 1:
+            return photo
+
+        zoomed = self._tiles.get(key + (mag,))
+        if zoomed is None:
+            zoomed = photo.zoom(mag)
+            self._put_tile(key + (mag,), zoomed)
+        else:
+            self._tiles.move_to_end(key + (mag,))
+        return zoomed
+
+    def _put_tile(self, key, photo):
+        self._tiles[key] = photo
+        if len(self._tiles) <= self.max_tiles:
+            return
+        # 淘汰最久未使用、且不在当前视口中的瓦片
+        for stale in [k for k in self._tiles if k not in self._visible]:
+            if len(self._tiles) <= self.max_tiles:
+                break
+            del self._tiles[stale]
+
+    # 后台加载
+
+    def _load_tiles(self):
+        """后台线程：取样并编码瓦片，不调用任何Tk接口"""
+        while True:
+            key = self._requests.get()
+            if key is None:
+                return
+            with self._lock:
+                wanted = key in self._wanted
+                self._wanted.discard(key)
+            if not wanted:
+                self._results.put((key, None))
+                continue
+            data, size = self.pyramid.tile(*key)
+            self._results.put((key, _tk_image_data(data, self.pyramid.color_mode, size)))
+
+    def _poll(self):
+        """主线程：把后台生成的瓦片数据转换为Tk图像"""
+        if self._closed:
+            return
+        arrived = False
+        while True:
+            try:
+                key, result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._requested.discard(key)
+            if result is None:
+                # 请求时已移出视口，之后需要时重新请求
+                arrived = True
+                continue
+            if key + (1,) not in self._tiles:
+                image_data, image_format = result
+                photo = tk.PhotoImage(master=self.canvas, data=image_data, format=image_format)
+                self._put_tile(key + (1,), photo)
+                arrived = True
+        if arrived:
+            self.redraw()
+        self.after(self.POLL_INTERVAL, self._poll)
+
+    # 事件
+
+    def _on_configure(self, event):
+        if not self._fitted:
+            self._fitted = True
+            self.fit()
+        else:
+            self.redraw()
+
+    def _on_press(self, event):
+        self.canvas.focus_set()
+        self._drag = (event.x, event.y)
+
+    def _on_drag(self, event):
+        if self._drag is None:
+            return
+        dx, dy = event.x - self._drag[0], event.y - self._drag[1]
+        self._drag = (event.x, event.y)
+        self.pan(dx, dy)
+
+    def _on_wheel(self, event):
+        self.zoom_at(2.0 if event.delta > 0 else 0.5, event.x, event.y)
+
+    def _on_destroy(self, event):
+        if event.widget is self.canvas and not self._closed:
+            self._closed = True
+            self._requests.put(None)
+
 
 class TkPreview:
     @staticmethod
-    def show_image(image_instance):
-        global photo_data
+    def show_image(image_instance, tile_size=256):
         root = tk.Tk()
         root.title("Wallow Image Preview")
 
-        canvas = tk.Canvas(root,
-                           width=image_instance.width,
-                           height=image_instance.height)
-        canvas.pack()
+        viewer = TileViewer(root, image_instance, tile_size=tile_size,
+                            width=min(image_instance.width, root.winfo_screenwidth() - 100),
+                            height=min(image_instance.height, root.winfo_screenheight() - 150))
+        viewer.pack(fill=tk.BOTH, expand=True)
+        root.mainloop()
+
+
+class PreviewSession:
+    """
+    交互式调整参数时的流水线预览
+
+    操作栈在按视口大小缩小的代理图像上执行，每一步的结果都会缓存，
+    修改第 N 个操作只需从第 N 步开始重新计算。原图只在 commit 时按全分辨率处理。
+
+    参数:
+        image: 原始WallowImage实例，其操作栈作为初始操作
+        max_size: 代理图像的最大尺寸，最长边像素数或 (最大宽, 最大高)
+    """
+
+    def __init__(self, image, max_size=(800, 600)):
+        self.image = image
+        self.ops = [(op_type, dict(params)) for op_type, params in image._operation_stack]
+        self._lock = threading.Lock()
+        self._dirty = 0  # 第一个需要重新计算的步骤
+        self._stages = []  # 每一步的 (像素数据, 颜色模式, (宽, 高), 是否自有缓冲区)
+        self._proxy = None
+        self._readers = 0  # 正在计算或使用预览结果的线程数
+        self._retired = []  # 被替换、等待读取方结束后归还的代理缓冲区
+        self.set_viewport(max_size)
+
+    # 编辑操作 (可以在任意线程中调用)
+
+    def set_params(self, index, **params):
+        """修改第 index 个操作的参数"""
+        with self._lock:
+            op_type, old = self.ops[index]
+            self.ops[index] = (op_type, {**old, **params})
+            self._dirty = min(self._dirty, index)
+
+    def set_operation(self, index, op_type, **params):
+        """替换第 index 个操作"""
+        with self._lock:
+            self.ops[index] = (op_type, params)
+            self._dirty = min(self._dirty, index)
+
+    def append(self, op_type, **params):
+        with self._lock:
+            self.ops.append((op_type, params))
+            self._dirty = min(self._dirty, len(self.ops) - 1)
+
+    def remove(self, index):
+        with self._lock:
+            del self.ops[index]
+            self._dirty = min(self._dirty, index)
+
+    def set_viewport(self, max_size):
+        """按新的视口尺寸重新生成代理图像，所有步骤需要重新计算"""
+        from utils.pool import get_buffer_pool
+
+        image = self.image
+        size = _display_size(max_size, image.width, image.height)
+        with self._lock:
+            old = self._proxy
+            if size == (image.width, image.height):
+                self._proxy = (image._pixel_data, image.color_mode, size, False)
+            else:
+                data, size = image._resize_impl(image._pixel_data, size[0], size[1])
+                self._proxy = (data, image.color_mode, size, True)
+            self.scale = size[0] / image.width
+            self._dirty = 0
+            old = self._retire(old)
+        if old is not None:
+            get_buffer_pool().release(old)
+
+    def _retire(self, proxy):
+        """
+        替换下来的代理图像 (调用方持有_lock)
+
+        返回:
+            可以立即归还的缓冲区；有线程正在读取时推迟到其结束后归还，返回None
+        """
+        if proxy is None or not proxy[3]:
+            return None
+        if self._readers:
+            self._retired.append(proxy[0])
+            return None
+        return proxy[0]
+
+    @contextmanager
+    def _reading(self):
+        """在块内读取代理图像和步骤结果，期间替换下来的代理缓冲区推迟归还"""
+        from utils.pool import get_buffer_pool
+
+        with self._lock:
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._readers -= 1
+                retired = [] if self._readers else self._retired
+                if not self._readers:
+                    self._retired = []
+            for data in retired:
+                get_buffer_pool().release(data)
+
+    # 计算
+
+    def render(self):
+        """
+        计算预览结果
+
+        返回:
+            (像素数据, 颜色模式, (宽, 高))，数据归会话所有，下次计算或修改视口后可能失效；
+            在其他线程可能修改视口时改用 rendered()
+        """
+        with self._reading():
+            return self._render()
+
+    @contextmanager
+    def rendered(self):
+        """
+        计算预览结果，在with块内使用
+
+            with session.rendered() as (data, color_mode, size):
+                ...
+
+        块内其他线程调用 set_viewport 或 close 时，旧的代理缓冲区在块结束后才归还缓冲池。
+        """
+        with self._reading():
+            yield self._render()
+
+    def _render(self):
+        from utils.pool import get_buffer_pool
+
+        with self._lock:
+            ops = list(self.ops)
+            start = min(self._dirty, len(self._stages))
+            self._dirty = len(ops)
+            proxy = self._proxy
+            scale = self.scale
+        orientation = self.image.orientation
+
+        # 丢弃失效的步骤结果
+        pool = get_buffer_pool()
+        for data, _, _, owned in self._stages[start:]:
+            if owned:
+                pool.release(data)
+        del self._stages[start:]
+
+        current = self._stages[-1] if self._stages else proxy
+        for op_type, params in ops[start:]:
+            data, color_mode, size, _ = current
+            # 只执行单个操作，输入数据不会被修改
+            stage = WallowImage._from_buffer(data, color_mode, size)
+            stage.orientation = orientation  # auto_orient 按原图的方向标签变换
+            stage._operation_stack = [_proxy_operation(op_type, params, scale)]
+            result = stage._run_pipeline()
+            current = result + (result[0] is not data,)
+            self._stages.append(current)
+        return current[:3]
+
+    def commit(self, apply=True):
+        """
+        按全分辨率执行当前操作
+
+        参数:
+            apply: 是否把当前操作写回原图的操作栈
+
+        返回:
+            处理结果 (新的WallowImage)
+        """
+        with self._lock:
+            ops = [(op_type, dict(params)) for op_type, params in self.ops]
+        if apply:
+            self.image._operation_stack = ops
+            return self.image.render()
+        image = WallowImage._from_buffer(self.image._pixel_data, self.image.color_mode,
+                                         (self.image.width, self.image.height))
+        image.orientation = self.image.orientation
+        image._operation_stack = ops
+        return image.render()
+
+    def close(self):
+        """归还缓存的中间结果和代理图像"""
+        from utils.pool import get_buffer_pool
+
+        pool = get_buffer_pool()
+        for data, _, _, owned in self._stages:
+            if owned:
+                pool.release(data)
+        self._stages = []
+        with self._lock:
+            proxy = self._retire(self._proxy)
+            self._proxy = None
+        if proxy is not None:
+            pool.release(proxy)
+
+
+def _proxy_operation(op_type, params, scale):
+    """把带有像素坐标的操作换算到代理分辨率"""
+    if scale == 1.0:
+        return op_type, params
+    if op_type == 'resize':
+        return op_type, {
+            'width': max(1, round(params['width'] * scale)) if params.get('width') else None,
+            'height': max(1, round(params['height'] * scale)) if params.get('height') else None,
+        }
+    if op_type == 'crop':
+        return op_type, {'box': tuple(round(v * scale) for v in params['box'])}
+    if op_type == 'overlay':
+        image = params['image']
+        x, y = params['position']
+        return op_type, {
+            **params,
+            'position': (round(x * scale), round(y * scale)),
+            'size': (max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+        }
+    return op_type, params
+
+
+class LivePreview(tk.Frame):
+    """
+    实时预览窗口部件
+
+    参数修改经过防抖后交给后台线程，在代理分辨率上从被修改的步骤开始重新计算；
+    Tk图像只在主线程中创建。
+
+    参数:
+        master: 父窗口
+        session: PreviewSession实例
+        delay: 防抖延迟 (毫秒)
+    """
+
+    POLL_INTERVAL = 30
+
+    def __init__(self, master, session, delay=150):
+        super().__init__(master)
+        self.session = session
+        self.delay = delay
+        proxy_size = session._proxy[2]
+        self.canvas = tk.Canvas(self, width=proxy_size[0], height=proxy_size[1],
+                                highlightthickness=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+        self._photo = None
+        self._pending = None
+        self._closed = False
+        self.error = None
+
+        self._wake = threading.Event()
+        self._results = queue.Queue()
+        self._worker = threading.Thread(target=self._render_loop, daemon=True)
+        self._worker.start()
+
+        self.canvas.bind('<Destroy>', self._on_destroy)
+        self.after(self.POLL_INTERVAL, self._poll)
+        self.refresh(immediate=True)
+
+    def set_params(self, index, **params):
+        """修改参数并在防抖延迟后刷新预览"""
+        self.session.set_params(index, **params)
+        self.refresh()
+
+    def refresh(self, immediate=False):
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+            self._pending = None
+        if immediate:
+            self._wake.set()
+        else:
+            self._pending = self.after(self.delay, self._fire)
+
+    def commit(self, apply=True):
+        """按全分辨率处理，返回结果图像"""
+        return self.session.commit(apply)
 
-        photo = tk.PhotoImage(
-            width=image_instance.width,
-            height=image_instance.height
-        )
+    def _fire(self):
+        self._pending = None
+        self._wake.set()
 
-        # 转换颜色模式
-        if image_instance.color_mode == 'RGB':
-            photo_data = bytes(image_instance._pixel_data)
-        elif image_instance.color_mode == 'RGBA':
-            photo_data = bytes([v for i in range(0, len(image_instance._pixel_data), 4)
-                                for v in image_instance._pixel_data[i:i + 3]])
+    def _render_loop(self):
+        """后台线程：计算期间到达的多次修改合并为一次重新计算"""
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._closed:
+                return
+            try:
+                with self.session.rendered() as (data, color_mode, size):
+                    image_data = _tk_image_data(data, color_mode, size)
+                self._results.put((image_data, None))
+            except Exception as e:
+                self._results.put((None, e))
 
-        photo.put(photo_data, (0, 0, image_instance.width - 1, image_instance.height - 1))  # type: ignore
+    def _poll(self):
+        if self._closed:
+            return
+        latest = None
+        while True:
+            try:
+                latest = self._results.get_nowait()
+            except queue.Empty:
+                break
+        if latest is not None:
+            image_data, self.error = latest
+            if image_data is not None:
+                self._photo = tk.PhotoImage(master=self.canvas, data=image_data[0],
+                                            format=image_data[1])
+                self.canvas.delete('preview')
+                self.canvas.create_image(0, 0, image=self._photo, anchor=tk.NW, tags='preview')
+        self.after(self.POLL_INTERVAL, self._poll)
 
-        canvas.create_image(0, 0, image=photo, anchor=tk.NW)
-        root.mainloop()
\ No newline at end of file
+    def _on_destroy(self, event):
+        if event.widget is self.canvas and not self._closed:
+            self._closed = True
+            self._wake.set()
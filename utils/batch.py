@@ -3,112 +3,677 @@
 """
 
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from ..core import WallowImage
+import shutil
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor,
+                                wait)
 
+from ..core import WallowImage, rendition_path
+from .cache import OutputCache
+from .manifest import BatchManifest, recipe_fingerprint
+from .metrics import FileEvent, StageTimer
+from .phash import HashIndex, hash_file
+from .scan import file_stat, scan_images
+from .schedule import MemoryScheduler
 
-def batch_process(file_paths, process_func, output_dir=None, threads=4, **kwargs):
+EXECUTORS = ('thread', 'process')
+
+# 结果值：输入与配方均未改变，已根据清单跳过
+SKIPPED = 'skipped'
+
+
+def batch_process(file_paths, process_func, output_dir=None, threads=4,
+                  executor='thread', chunksize=1, max_in_flight=None, manifest=None,
+                  on_event=None, metrics=None, verbose=True, renditions=None,
+                  memory_budget=None, output_format=None, quality=85, cache=None,
+                  profiler=None, **kwargs):
     """
     批量处理图像文件
 
     参数:
-        file_paths: 文件路径列表
+        file_paths: 文件路径列表或任意可迭代对象 (按需读取)
         process_func: 处理函数，接收WallowImage对象并返回处理后的WallowImage
+                      (使用进程池时必须是模块级函数)
         output_dir: 输出目录 (如果未指定，则使用原目录)
-        threads: 并行处理的线程数
+        threads: 并行的工作线程/进程数
+        executor: 'thread' 或 'process'
+        chunksize: 每个任务包含的文件数
+        max_in_flight: 同时提交的最大任务数 (默认为 threads 的2倍)
+        manifest: 清单文件路径或BatchManifest实例，记录已完成的文件，
+                  输入和配方都未改变的文件会被跳过，中断后可以续跑
+        on_event: 每个文件完成时以FileEvent调用的回调 (如 JsonLinesSink)
+        metrics: 可选的BatchMetrics，用于汇总吞吐量和延迟
+        verbose: 是否打印每个文件的处理结果
+        renditions: 可选的 (尺寸, 格式, 质量) 列表，每个文件解码一次后输出全部尺寸，
+                    文件名为 "{原文件名}_{尺寸}.{格式}"
+        memory_budget: 可选的内存预算 (字节)，同时处理的文件的估算峰值内存之和不超过该值，
+                       并优先处理大图像
+        output_format: 输出格式 (如 'png')，默认与输入文件相同
+        quality: 输出质量 (用于有损格式)
+        cache: 输出缓存目录或OutputCache实例，输入内容、操作栈和保存选项都相同的
+               文件直接使用缓存的输出；图像延迟解码，process_func只向操作栈添加操作时，
+               命中缓存的文件不需要解码 (不用于 renditions)
+        profiler: 可选的ProfileCollector，每个任务在工作线程/进程中用cProfile分析，
+                  统计结果汇总到其中
         **kwargs: 传递给process_func的额外参数
 
     返回:
         成功处理的文件数量
     """
-    results = {}
     processed_count = 0
 
-    with ThreadPoolExecutor(max_workers=threads) as executor:
-        futures = {}
-
-        for file_path in file_paths:
-            future = executor.submit(
-                _process_single_file,
-                file_path,
-                process_func,
-                output_dir,
-                **kwargs
-            )
-            futures[future] = file_path
-
-        for future in as_completed(futures):
-            file_path = futures[future]
+    for event in iter_batch_events(
+            file_paths, process_func, output_dir, workers=threads, executor=executor,
+            chunksize=chunksize, max_in_flight=max_in_flight, manifest=manifest,
+            metrics=metrics, renditions=renditions, memory_budget=memory_budget,
+            output_format=output_format, quality=quality, cache=cache, profiler=profiler,
+            **kwargs):
+        if event.status == 'ok':
+            processed_count += 1
+        if on_event is not None:
+            on_event(event)
+        if not verbose:
+            continue
+        if event.status == 'skipped':
+            print(f"未改变，跳过: {event.path}")
+        elif event.status == 'error':
+            print(f"处理失败: {event.path} - {event.error}")
+        else:
+            print(f"处理完成: {event.path}")
+
+    return processed_count
+
+
+def iter_batch_process(file_paths, process_func, output_dir=None, workers=4,
+                       executor='thread', chunksize=1, max_in_flight=None, manifest=None,
+                       **kwargs):
+    """
+    批量处理图像文件，以生成器形式逐个返回结果
+
+    参数:
+        同 batch_process，workers 为工作线程/进程数
+
+    生成:
+        (文件路径, 结果)，处理失败时结果为异常对象，因清单跳过时为 SKIPPED
+    """
+    for event in iter_batch_events(file_paths, process_func, output_dir, workers, executor,
+                                   chunksize, max_in_flight, manifest, **kwargs):
+        if event.status == 'skipped':
+            yield event.path, SKIPPED
+        elif event.status == 'error':
+            yield event.path, event.exception or Exception(event.error)
+        else:
+            yield event.path, True
+
+
+def iter_batch_events(file_paths, process_func, output_dir=None, workers=4,
+                      executor='thread', chunksize=1, max_in_flight=None, manifest=None,
+                      metrics=None, renditions=None, memory_budget=None, output_format=None,
+                      quality=85, cache=None, profiler=None, **kwargs):
+    """
+    批量处理图像文件，以生成器形式逐个返回FileEvent
+
+    文件路径按需从 file_paths 中读取，同时在执行器中的任务数不超过
+    max_in_flight，因此内存占用与输入数量无关。
+
+    指定 memory_budget 时，每个文件单独作为一个任务 (忽略 chunksize)，
+    根据文件头估算其峰值内存，只在估算总量不超过预算时提交，
+    并在预读的候选文件中优先提交大图像。
+
+    参数:
+        同 batch_process，workers 为工作线程/进程数
+
+    生成:
+        FileEvent实例，包含各阶段耗时、读写字节数和错误信息
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"不支持的执行器: {executor}")
+    if max_in_flight is None:
+        # 有内存预算时只提交正在运行的任务，排队中的任务不占用预算
+        max_in_flight = workers if memory_budget else workers * 2
+    scheduler = (MemoryScheduler(memory_budget, lookahead=max(64, max_in_flight * 4))
+                 if memory_budget else None)
+
+    owns_manifest = isinstance(manifest, str)
+    if owns_manifest:
+        manifest = BatchManifest(manifest)
+    if isinstance(cache, (str, os.PathLike)):
+        cache = OutputCache(cache)
+    recipe = (recipe_fingerprint(process_func, kwargs,
+                                 extra=[renditions, output_format, quality])
+              if manifest is not None else None)
+    input_stats = {}
+    costs = {}
+    chunks = {}
+    skipped = []
+    # 输出路径 -> 输入路径，检测输出到同一文件的不同输入 (如 a.png 与 a.bmp 都转换为 a.png)
+    claimed_outputs = {}
+
+    def finish(event):
+        event.finished_at = time.time()
+        if metrics is not None:
+            metrics.update(event)
+        return event
+
+    def collect(done):
+        for future in done:
+            cost = costs.pop(future)
+            chunk = chunks.pop(future)
+            if scheduler is not None:
+                scheduler.release(cost)
             try:
-                result = future.result()
-                results[file_path] = result
-                processed_count += 1
-                print(f"处理完成: {file_path}")
+                events = future.result()
             except Exception as e:
-                results[file_path] = e
-                print(f"处理失败: {file_path} - {str(e)}")
+                # 工作进程异常退出、任务参数无法序列化等：任务中的每个文件都报告为错误
+                events = [_failed_event(path, e, output_dir, renditions, output_format)
+                          for path in chunk]
+            else:
+                if profiler is not None:
+                    events, stats = events
+                    profiler.add(stats)
+            for event in events:
+                st = input_stats.pop(event.path, None)
+                if manifest is not None and event.status == 'ok':
+                    manifest.record(event.path, recipe, event.output_path, st)
+                yield finish(event)
+
+    def next_input():
+        """
+        读取下一个需要处理的文件
+
+        清单中未改变的文件、无法读取的文件或目录和输出路径冲突的文件不提交，其事件放入skipped
+        """
+        for file_path in paths:
+            error = getattr(file_path, 'error', None)
+            if error is not None:
+                # 扫描时无法读取的子目录
+                event = FileEvent(file_path, 'error')
+                event.error = f"读取目录失败: {error}"
+                event.exception = error
+                skipped.append(finish(event))
+                continue
+            output_path = _output_path(file_path, output_dir, renditions, output_format)
+            conflict = _claim_outputs(claimed_outputs, file_path, output_dir, renditions,
+                                      output_format)
+            if conflict is not None:
+                event = FileEvent(file_path, 'error', output_path)
+                event.error = f"输出路径冲突: {conflict[0]} 已是 {conflict[1]} 的输出"
+                skipped.append(finish(event))
+                continue
+            if manifest is not None:
+                try:
+                    st = file_stat(file_path)
+                except OSError as e:
+                    event = FileEvent(file_path, 'error', output_path)
+                    event.error = f"读取错误: {e}"
+                    event.traceback = traceback.format_exc()
+                    event.exception = e
+                    skipped.append(finish(event))
+                    continue
+                if manifest.is_current(file_path, recipe, output_path, st):
+                    skipped.append(finish(FileEvent(file_path, 'skipped', output_path)))
+                    continue
+                input_stats[file_path] = st
+            return file_path
+        return None
+
+    def next_chunk():
+        if scheduler is None:
+            chunk = []
+            while len(chunk) < chunksize:
+                file_path = next_input()
+                if file_path is None:
+                    break
+                chunk.append(file_path)
+            return chunk, 0
+
+        while scheduler.wants_more:
+            file_path = next_input()
+            if file_path is None:
+                break
+            scheduler.push(file_path)
+        # 没有任务在运行时，超出预算的单个文件也要提交
+        item = scheduler.pop(force=not pending)
+        if item is None:
+            return [], 0
+        return [item[0]], item[1]
+
+    executor_class = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+    paths = iter(file_paths)
+    pending = set()
+
+    try:
+        with executor_class(max_workers=workers, initializer=_init_worker) as pool:
+            try:
+                while True:
+                    chunk, cost = next_chunk()
+                    yield from skipped
+                    skipped.clear()
+
+                    if chunk:
+                        task = _process_chunk if profiler is None else _profile_chunk
+                        try:
+                            future = pool.submit(task, chunk, process_func, output_dir,
+                                                 renditions, kwargs, output_format, quality,
+                                                 cache)
+                        except Exception as e:  # 进程池已损坏
+                            if scheduler is not None:
+                                scheduler.release(cost)
+                            for path in chunk:
+                                input_stats.pop(path, None)
+                                yield finish(_failed_event(path, e, output_dir, renditions,
+                                                           output_format))
+                            continue
+                        pending.add(future)
+                        costs[future] = cost
+                        chunks[future] = chunk
+                    elif not pending:
+                        break
+
+                    # 达到上限、输入读完或预算不足时等待已有任务完成，再继续提交
+                    if not chunk or len(pending) >= max_in_flight:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        yield from collect(done)
+            finally:
+                for future in pending:
+                    future.cancel()
+    finally:
+        if owns_manifest:
+            manifest.close()
+
+
+def _init_worker():
+    """工作线程/进程初始化：预先导入编解码器，避免首个任务承担导入开销"""
+    import formats  # noqa: F401
+
+
+def _process_chunk(chunk, process_func, output_dir, renditions, kwargs, output_format=None,
+                   quality=85, cache=None):
+    """在工作线程/进程中处理一组文件，返回FileEvent列表"""
+    events = []
+    for file_path in chunk:
+        event = FileEvent(file_path, output_path=_output_path(file_path, output_dir, renditions,
+                                                              output_format))
+        try:
+            _process_single_file(file_path, process_func, output_dir, event=event,
+                                 renditions=renditions, output_format=output_format,
+                                 quality=quality, cache=cache, **kwargs)
+        except Exception as e:
+            _record_error(event, e)
+        events.append(event)
+    return events
+
+
+def _failed_event(file_path, error, output_dir, renditions, output_format):
+    """任务整体失败时为其中的文件生成error事件 (在except块中调用)"""
+    event = FileEvent(file_path, output_path=_output_path(file_path, output_dir, renditions,
+                                                          output_format))
+    _record_error(event, error)
+    return event
+
+
+def _record_error(event, error):
+    event.status = 'error'
+    event.error = str(error)
+    event.traceback = traceback.format_exc()
+    event.exception = error
+
+
+def _profile_chunk(*args):
+    """在cProfile下执行 _process_chunk，返回 (FileEvent列表, 统计数据)"""
+    import cProfile
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Python 3.12起同一时间只能启用一个分析器，其他线程中的任务不分析
+        return _process_chunk(*args), None
+    try:
+        events = _process_chunk(*args)
+    finally:
+        profile.disable()
+    profile.create_stats()
+    return events, profile.stats
 
-    return processed_count
 
+def _output_path(file_path, output_dir, renditions=None, output_format=None):
+    """计算输入文件对应的输出路径 (有多个缩略版本时为第一个版本的路径)"""
+    if renditions:
+        return _rendition_paths(file_path, output_dir, renditions)[0]
+    if output_format:
+        file_path = f"{os.path.splitext(file_path)[0]}.{output_format.lstrip('.').lower()}"
+    if output_dir:
+        return os.path.join(output_dir, os.path.basename(file_path))
 
-def _process_single_file(file_path, process_func, output_dir, **kwargs):
-    """处理单个文件的辅助函数"""
+    # 在原始文件名后添加后缀
+    file_dir = os.path.dirname(file_path)
+    file_name = os.path.basename(file_path)
+    name_parts = file_name.split('.')
+    return os.path.join(
+        file_dir,
+        f"{name_parts[0]}_processed.{'.'.join(name_parts[1:])}"
+    )
+
+
+def _claim_outputs(claimed, file_path, output_dir, renditions, output_format):
+    """
+    登记文件的所有输出路径
+
+    返回:
+        None，或已被其他输入占用时的 (输出路径, 占用它的输入路径)
+    """
+    if renditions:
+        paths = _rendition_paths(file_path, output_dir, renditions)
+    else:
+        paths = [_output_path(file_path, output_dir, output_format=output_format)]
+    source = os.path.abspath(file_path)
+    keys = [os.path.normcase(os.path.abspath(path)) for path in paths]
+    for key, path in zip(keys, paths):
+        owner = claimed.get(key)
+        if owner is not None and owner != source:
+            return path, owner
+    for key in keys:
+        claimed[key] = source
+    return None
+
+
+def _rendition_paths(file_path, output_dir, renditions):
+    file_dir, file_name = os.path.split(file_path)
+    base_path = os.path.join(output_dir or file_dir, os.path.splitext(file_name)[0])
+    return [rendition_path(base_path, target) for target in renditions]
+
+
+def _atomic_save(image, output_path, timer=None, quality=85):
+    """先写入同目录下的临时文件再重命名，避免留下写了一半的输出"""
+    timer = timer or StageTimer(FileEvent(output_path))
+    file_dir, file_name = os.path.split(output_path)
+    extension = file_name.rsplit('.', 1)[-1]
+    temp_path = os.path.join(
+        file_dir, f".{file_name}.{os.getpid()}.{threading.get_ident()}.tmp.{extension}")
     try:
-        img = WallowImage.open(file_path)
-        processed_img = process_func(img, **kwargs)
+        # 编解码器直接写入文件，encode阶段包含写入临时文件的时间
+        with timer('encode'):
+            image.save(temp_path, quality)
+        with timer('write'):
+            os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _process_single_file(file_path, process_func, output_dir, event=None, renditions=None,
+                         output_format=None, quality=85, cache=None, **kwargs):
+    """处理单个文件的辅助函数，耗时和读写字节数记录到event"""
+    timer = StageTimer(event or FileEvent(file_path))
+    cached = cache is not None and not renditions
+    try:
+        with timer('decode'):
+            # 去重时为计算哈希已完整解码的图像直接复用；使用缓存时先只读取文件头，命中缓存则不需要解码
+            img = getattr(file_path, 'image', None)
+            if img is None:
+                img = WallowImage.open(file_path, lazy=cached)
+            else:
+                file_path.image = None
+        timer.event.bytes_read = file_stat(file_path).st_size
 
         if output_dir:
-            file_name = os.path.basename(file_path)
-            output_path = os.path.join(output_dir, file_name)
             os.makedirs(output_dir, exist_ok=True)
+
+        with timer('process'):
+            processed_img = process_func(img, **kwargs)
+            if renditions:
+                outputs = list(zip(
+                    processed_img.render_renditions(renditions),
+                    _rendition_paths(file_path, output_dir, renditions),
+                    [target[2] if len(target) > 2 else quality for target in renditions]))
+            else:
+                outputs = [(processed_img if cached else processed_img.render(),
+                            _output_path(file_path, output_dir, output_format=output_format),
+                            quality)]
+
+        if cached:
+            _save_cached(outputs[0], cache, timer)
         else:
-            # 在原始文件名前添加前缀
-            file_dir = os.path.dirname(file_path)
-            file_name = os.path.basename(file_path)
-            name_parts = file_name.split('.')
-            output_path = os.path.join(
-                file_dir,
-                f"{name_parts[0]}_processed.{'.'.join(name_parts[1:])}"
-            )
-
-        processed_img.save(output_path)
+            _save_outputs(outputs, timer)
+        timer.event.bytes_written = sum(os.path.getsize(path) for _, path, _ in outputs)
+
+        # 归还像素缓冲区，供下一个同尺寸文件复用
+        for rendered in {id(image): image for image, _, _ in outputs
+                         if image is not processed_img}.values():
+            rendered.close()
+        if processed_img is not img:
+            processed_img.close()
+        img.close()
         return True
     except Exception as e:
         raise Exception(f"处理错误: {str(e)}")
 
 
+def _save_cached(output, cache, timer):
+    """通过输出缓存保存 (图像, 路径, 质量)：未命中时编码并写入缓存"""
+    image, output_path, quality = output
+    file_dir, file_name = os.path.split(output_path)
+    temp_path = os.path.join(
+        file_dir, f".{file_name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with timer('encode'):
+        data, timer.event.cache_hit = cache.render(image, file_name.rsplit('.', 1)[-1], quality)
+    try:
+        with timer('write'):
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _save_outputs(outputs, timer):
+    """保存 (图像, 路径, 质量) 列表，多个输出时并行编码"""
+    if len(outputs) == 1:
+        image, path, quality = outputs[0]
+        _atomic_save(image, path, timer, quality)
+        return
+
+    with ThreadPoolExecutor(max_workers=len(outputs)) as executor:
+        futures = [executor.submit(_atomic_save, image, path, timer, quality)
+                   for image, path, quality in outputs]
+        for future in futures:
+            future.result()
+
+
 def process_folder(folder_path, process_func, output_dir=None,
-                   extensions=None, recursive=False, **kwargs):
+                   extensions=None, recursive=False, dedupe=None, dedupe_index=None,
+                   dedupe_action='skip', hash_method='dhash', scan_workers=8,
+                   verify_magic=False, **kwargs):
     """
     处理文件夹中的所有图像
 
+    文件在扫描的同时即开始处理，不需要等待整个目录树扫描完成。无法读取的子目录作为
+    error事件报告，folder_path 本身无法读取时抛出OSError。
+
     参数:
         folder_path: 要处理的文件夹路径
         process_func: 处理函数
         output_dir: 输出目录
         extensions: 要处理的文件扩展名列表 (如 ['.jpg', '.png'])
         recursive: 是否递归处理子文件夹
-        **kwargs: 传递给process_func的额外参数
+        dedupe: 感知哈希距离阈值，与已处理图像距离不超过该值的输入视为重复；None表示不去重
+        dedupe_index: 哈希索引文件路径，跨多次运行保留已处理图像的哈希 (只登记处理成功的图像)
+        dedupe_action: 'skip' 跳过重复输入，'alias' 将已有输出链接为重复输入的输出
+        hash_method: 'ahash'、'dhash' 或 'phash'
+        scan_workers: 并行扫描子目录的线程数
+        verify_magic: 是否通过文件头确认格式，跳过扩展名与内容不符的文件
+        **kwargs: 传递给batch_process和process_func的额外参数
 
     返回:
         成功处理的文件数量
     """
-    if extensions is None:
-        extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.gif']
+    file_paths = scan_images(folder_path, extensions, recursive, workers=scan_workers,
+                             verify_magic=verify_magic, report_errors=True)
 
-    extensions = [ext.lower() if ext.startswith('.') else f'.{ext.lower()}'
-                  for ext in extensions]
+    if dedupe is None:
+        return batch_process(file_paths, process_func, output_dir, **kwargs)
 
-    file_paths = []
+    if dedupe_action not in ('skip', 'alias'):
+        raise ValueError(f"不支持的去重方式: {dedupe_action}")
 
-    if recursive:
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                if os.path.splitext(file)[1].lower() in extensions:
-                    file_paths.append(os.path.join(root, file))
-    else:
-        for file in os.listdir(folder_path):
-            if os.path.splitext(file)[1].lower() in extensions:
-                file_paths.append(os.path.join(folder_path, file))
+    renditions = kwargs.get('renditions')
+    output_format = kwargs.get('output_format')
+    on_event = kwargs.pop('on_event', None)
+    metrics = kwargs.get('metrics')
+    verbose = kwargs.get('verbose', True)
+
+    def output_paths(path):
+        return _output_paths(path, output_dir, renditions, output_format)
+
+    aliases = []
+    pending = {}  # 已提交的输入 -> (哈希, 输出路径)，处理成功后才登记到索引
+    failed = set()
+
+    with HashIndex(dedupe_index) as index:
+        def record(event):
+            entry = pending.pop(event.path, None)
+            if entry is not None:
+                if event.status in ('ok', SKIPPED):
+                    index.add(*entry)
+                else:
+                    failed.add(event.path)
+            if on_event is not None:
+                on_event(event)
+
+        # 只有线程池且不预读候选文件时才复用哈希时解码的图像，否则图像会在进程间传递或大量积压
+        keep_decoded = (kwargs.get('executor', 'thread') == 'thread'
+                        and not kwargs.get('memory_budget') and kwargs.get('cache') is None)
+        unique_paths = _unique_paths(file_paths, index, pending, dedupe, hash_method, aliases,
+                                     output_paths, kwargs.get('threads', 4), verbose,
+                                     keep_decoded)
+        count = batch_process(unique_paths, process_func, output_dir, on_event=record, **kwargs)
+
+        # 与之重复的输入处理失败时，重复的输入照常处理
+        retry = [alias for alias in aliases if alias[3] in failed]
+        if retry:
+            for file_path, hash_value, _, _ in retry:
+                pending[file_path] = (hash_value, output_paths(file_path))
+            count += batch_process([alias[0] for alias in retry], process_func, output_dir,
+                                   on_event=record, **kwargs)
+
+    if dedupe_action == 'alias':
+        for file_path, _, original_outputs, original in aliases:
+            if original in failed:
+                continue
+            for source, target in zip(original_outputs, output_paths(file_path)):
+                try:
+                    _link_output(source, target)
+                except OSError as e:
+                    event = FileEvent(file_path, 'error', target)
+                    event.error = f"链接输出失败: {e}"
+                    event.traceback = traceback.format_exc()
+                    event.exception = e
+                    event.finished_at = time.time()
+                    if metrics is not None:
+                        metrics.update(event)
+                    if on_event is not None:
+                        on_event(event)
+                    if verbose:
+                        print(f"处理失败: {file_path} - {event.error}")
+                    break
+    return count
+
+
+def _output_paths(file_path, output_dir, renditions, output_format=None):
+    if renditions:
+        return _rendition_paths(file_path, output_dir, renditions)
+    return [_output_path(file_path, output_dir, output_format=output_format)]
+
+
+class _DecodedPath(str):
+    """附带已解码图像的输入路径，_process_single_file 直接使用该图像而不再解码"""
+
+    def __new__(cls, file_path, image):
+        path = super().__new__(cls, file_path)
+        path.image = image
+        return path
 
-    return batch_process(file_paths, process_func, output_dir, **kwargs)
+    def __reduce__(self):
+        # 传给工作进程时只传路径
+        return str, (str(self),)
+
+
+def _unique_paths(file_paths, index, pending, distance, method, aliases, output_paths, workers,
+                  verbose, keep_decoded=False):
+    """
+    按顺序过滤掉与已处理图像或本次已提交的输入重复的输入
+
+    哈希在线程池中计算 (最多提前 workers*2 个文件)，查找按输入顺序进行，
+    因此结果与单线程处理一致。提交的输入记录到pending (哈希, 输出路径)，
+    由调用方在处理成功后登记到index。重复的输入以
+    (输入, 哈希, 已有的输出路径, 与之重复的本次输入或None) 记录到aliases。
+    keep_decoded 为True时，为计算哈希完整解码的图像随路径 (_DecodedPath) 一起交给处理，
+    同时保留的图像不超过预读窗口与正在处理的文件数之和。
+    """
+    def compute(file_path):
+        if getattr(file_path, 'error', None) is not None:
+            return None, None
+        try:
+            return hash_file(file_path, method, keep=keep_decoded)
+        except Exception:
+            return None, None
+
+    submitted = HashIndex()  # 本次运行已提交的输入，值为 (输入, 输出路径)
+    window = deque()
+    paths = iter(file_paths)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            while len(window) < workers * 2:
+                file_path = next(paths, None)
+                if file_path is None:
+                    break
+                window.append((file_path, pool.submit(compute, file_path)))
+            if not window:
+                return
+
+            file_path, future = window.popleft()
+            hash_value, image = future.result()
+            if hash_value is None:
+                # 无法计算哈希 (包括无法读取的子目录) 时照常交给batch_process，由其报告错误
+                yield file_path
+                continue
+
+            match = index.nearest(hash_value, distance)
+            if match is not None:
+                aliases.append((file_path, hash_value, match[2], None))
+            else:
+                match = submitted.nearest(hash_value, distance)
+                if match is None:
+                    outputs = output_paths(file_path)
+                    pending[file_path] = (hash_value, outputs)
+                    submitted.add(hash_value, (file_path, outputs))
+                    yield file_path if image is None else _DecodedPath(file_path, image)
+                    continue
+                original, outputs = match[2]
+                aliases.append((file_path, hash_value, outputs, original))
+            if image is not None:
+                image.close()
+
+            if verbose:
+                print(f"重复图像，跳过: {file_path} (距离 {match[0]})")
+
+
+def _link_output(source, target):
+    """让target指向与source相同的内容 (优先硬链接，失败时复制)，source不存在时抛出FileNotFoundError"""
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"已有的输出不存在: {source}")
+    if os.path.abspath(source) == os.path.abspath(target):
+        return
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    temp_path = f"{target}.{os.getpid()}.link"
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        shutil.copy2(source, temp_path)
+    os.replace(temp_path, target)
@@ -0,0 +1,259 @@
+"""
+输出缓存 - 以输入内容和处理配方为键，在磁盘上缓存编码后的输出
+"""
+
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .manifest import _canonical_json, file_digest
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+# 淘汰后缓存总大小占上限的比例，留出余量避免每次写入都触发淘汰
+_EVICT_TARGET = 0.9
+
+# 超过该时间 (秒) 仍未完成的临时文件视为写入进程已退出，淘汰时删除
+_STALE_TEMP_SECONDS = 3600
+
+
+class OutputCache:
+    """
+    内容寻址的磁盘输出缓存
+
+    键由输入文件内容的哈希、方向标签、操作栈的规范化序列化和保存选项 (格式、质量) 决定，
+    命中时直接返回保存的输出字节，不需要解码、执行操作栈和编码。
+
+    条目保存为 "{directory}/{键的前两位}/{键}"，先写入临时文件再重命名，
+    读取方只会看到完整的条目。命中时更新条目的修改时间，总大小超过 max_bytes 时
+    按修改时间淘汰最久未使用的条目；淘汰时持有目录下的文件锁，
+    同一主机上的多个进程可以共用一个缓存目录。
+
+    参数:
+        directory: 缓存目录
+        max_bytes: 缓存总大小上限 (字节)
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # 本进程估算的缓存总大小，第一次写入时扫描目录得到
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __getstate__(self):
+        # 传给工作进程时只保留配置
+        return {'directory': self.directory, 'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'], state['max_bytes'])
+
+    def key(self, image, output_format, quality=85):
+        """
+        计算图像 (含尚未执行的操作栈) 按给定格式和质量保存时的缓存键
+
+        延迟打开且像素未被修改的图像使用源文件内容的哈希，其他图像使用像素数据的哈希。
+        操作参数中有无法按值描述的对象 (如没有属性、使用默认repr的对象) 时抛出TypeError。
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(_input_digest(image).encode())
+        digest.update(_canonical_json([
+            image._operation_stack, output_format.lstrip('.').lower(), quality
+        ]).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """读取缓存条目，未命中时返回None"""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # 读取后被其他进程淘汰
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """原子写入缓存条目"""
+        def write(temp_path):
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+
+        self._store(key, write)
+
+    def render(self, image, output_format, quality=85):
+        """
+        返回图像按给定格式和质量编码后的字节，优先从缓存读取
+
+        未命中时执行操作栈并编码，结果写入缓存。配合 WallowImage.open(path, lazy=True)
+        使用时，命中的图像完全不需要解码。操作栈无法计算缓存键时直接编码，不使用缓存。
+
+        返回:
+            (输出字节, 是否命中缓存)
+        """
+        output_format = output_format.lstrip('.').lower()
+        try:
+            key = self.key(image, output_format, quality)
+        except TypeError:
+            key = None
+        data = self.get(key) if key is not None else None
+        if data is not None:
+            return data, True
+
+        result = []
+
+        def write(temp_path):
+            # 编解码器根据扩展名选择，临时文件保留输出格式的扩展名
+            image.save(temp_path, quality)
+            with open(temp_path, 'rb') as f:
+                result.append(f.read())
+
+        if key is not None:
+            self._store(key, write, suffix=f".{output_format}")
+            return result[0], False
+
+        temp_path = os.path.join(
+            self.directory, f".uncached.{os.getpid()}.{threading.get_ident()}.{output_format}")
+        try:
+            write(temp_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        with self._lock:
+            self.misses += 1
+        return result[0], False
+
+    def _store(self, key, write, suffix=''):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp{suffix}"
+        try:
+            write(temp_path)
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries()[0])
+            else:
+                self._size += size
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self, target=None):
+        """
+        淘汰最久未使用的条目，直到总大小不超过 target
+
+        参数:
+            target: 目标大小 (字节)，默认为 max_bytes 的90%
+
+        返回:
+            淘汰后的缓存总大小
+        """
+        if target is None:
+            target = int(self.max_bytes * _EVICT_TARGET)
+
+        with self._file_lock():
+            entries, stale = self._entries()
+            for path in stale:
+                _remove(path)
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                _remove(path)
+                total -= size
+
+        with self._lock:
+            self._size = total
+        return total
+
+    def clear(self):
+        """删除所有缓存条目"""
+        return self.evict(0)
+
+    def _entries(self):
+        """返回 ([(修改时间, 大小, 路径)], [过期的临时文件路径])"""
+        entries, stale = [], []
+        now = time.time()
+        for bucket in os.scandir(self.directory):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if '.tmp' in entry.name:
+                    if now - st.st_mtime > _STALE_TEMP_SECONDS:
+                        stale.append(entry.path)
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries, stale
+
+    @contextmanager
+    def _file_lock(self):
+        """跨进程的互斥锁，没有fcntl的平台上只在本进程内互斥"""
+        with open(os.path.join(self.directory, '.lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass  # 已被其他进程删除，或在Windows上仍被打开
+
+
+def _input_digest(image):
+    """输入的哈希，包括执行操作栈时读取的图像状态 (auto_orient 使用的方向标签)"""
+    return f"{_pixels_digest(image)}:{image.orientation}"
+
+
+def _pixels_digest(image):
+    source = image._source
+    if source is not None and image._data_version == 0:
+        st = os.stat(source[1])
+        return _file_digest(os.path.abspath(source[1]), st.st_size, st.st_mtime_ns)
+
+    digest = hashlib.blake2b(image._pixel_data, digest_size=20)
+    digest.update(f"{image.color_mode}:{image.width}x{image.height}".encode())
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=1024)
+def _file_digest(file_path, size, mtime_ns):
+    # 大小或修改时间改变时键不同，重新计算哈希
+    return file_digest(file_path)
@@ -0,0 +1,281 @@
+"""
+命令行入口 - 按JSON/TOML配方批量处理图像
+
+    python -m wallow recipe.toml "photos/**/*.jpg" -o out --jobs 8
+
+配方示例 (TOML):
+
+    [[ops]]
+    op = "auto_orient"
+
+    [[ops]]
+    op = "resize"
+    width = 1600
+
+    [[ops]]
+    op = "filter"
+    name = "auto_contrast"
+    clip = 1.0
+
+    [output]
+    dir = "out"
+    format = "png"
+    quality = 90
+    renditions = [[1024, "jpg", 85], [256, "jpg", 80]]
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+
+from .batch import EXECUTORS, batch_process
+from .cache import OutputCache
+from .metrics import BatchMetrics, JsonLinesSink, ProfileCollector
+from .scan import DEFAULT_EXTENSIONS, scan_images
+
+# 配方中的操作名 -> WallowImage方法名
+RECIPE_OPS = {
+    'resize': 'resize',
+    'crop': 'crop',
+    'convert': 'convert',
+    'hsv': 'adjust_hsv',
+    'adjust_hsv': 'adjust_hsv',
+    'filter': 'apply_filter',
+    'flip': 'flip',
+    'rotate': 'rotate',
+    'transpose': 'transpose',
+    'auto_orient': 'auto_orient',
+    'overlay': 'overlay',
+    'watermark': 'watermark',
+}
+
+# 配方中可以带参数的滤镜 -> 参数名
+FILTER_PARAMS = {
+    'auto_levels': ('clip',),
+    'auto_contrast': ('clip',),
+}
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def load_recipe(path):
+    """读取配方文件 (.toml 或 JSON)"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    if path.lower().endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+        recipe = tomllib.loads(content.decode('utf-8'))
+    else:
+        recipe = json.loads(content)
+    validate_recipe(recipe)
+    return recipe
+
+
+def validate_recipe(recipe):
+    """检查配方中的操作和滤镜名称，有错误时抛出ValueError"""
+    from filters.registry import list_filters
+    import filters.color  # noqa: F401  注册内置滤镜
+
+    if not isinstance(recipe, dict):
+        raise ValueError("配方必须是一个对象")
+    ops = recipe.get('ops', [])
+    if not isinstance(ops, list):
+        raise ValueError("配方中的 ops 必须是列表")
+    known_filters = set(list_filters())
+    for index, op in enumerate(ops):
+        name = op.get('op') if isinstance(op, dict) else None
+        if name not in RECIPE_OPS:
+            raise ValueError(f"第 {index + 1} 个操作不支持: {name}")
+        if name == 'filter' and op.get('name') not in known_filters:
+            raise ValueError(f"未注册的滤镜: {op.get('name')} (可用: {', '.join(sorted(known_filters))})")
+        if name == 'filter':
+            extra = set(op) - {'op', 'name'} - set(FILTER_PARAMS.get(op['name'], ()))
+            if extra:
+                raise ValueError(f"滤镜 {op['name']} 不支持参数: {', '.join(sorted(extra))}")
+            clip = op.get('clip', 0.5)
+            if isinstance(clip, bool) or not isinstance(clip, (int, float)) or not 0 <= clip < 50:
+                raise ValueError(f"滤镜 {op['name']} 的 clip 必须是 0 到 50 之间的数")
+        if name in ('overlay', 'watermark') and not isinstance(op.get('image'), str):
+            raise ValueError(f"{name} 操作需要 image 文件路径")
+
+
+def apply_recipe(image, ops):
+    """
+    按配方中的操作依次加入操作栈 (模块级函数，可用于进程池)
+
+    参数:
+        image: WallowImage实例
+        ops: 配方中的操作列表，每项为 {'op': 名称, 其他参数...}，
+             参数与WallowImage对应方法相同 (resize 使用 width/height，
+             filter 使用 name 及 FILTER_PARAMS 中的参数)
+
+    返回:
+        image
+    """
+    import filters.color  # noqa: F401  工作进程中注册内置滤镜
+
+    for op in ops:
+        params = dict(op)
+        name = params.pop('op')
+        if name == 'filter':
+            filter_name = params.pop('name')
+            if params:
+                image.apply_filter(filters.color.make_levels_filter(
+                    per_channel=filter_name == 'auto_levels', **params))
+            else:
+                image.apply_filter(filter_name)
+            continue
+        if name in ('overlay', 'watermark'):
+            params['image'] = _load_overlay(params['image'])
+            if 'position' in params:
+                params['position'] = tuple(params['position'])
+        if name == 'resize':
+            params = {'new_width': params.get('width'), 'new_height': params.get('height')}
+        if name == 'crop':
+            params['box'] = tuple(params['box'])
+        getattr(image, RECIPE_OPS[name])(**params)
+    return image
+
+
+@lru_cache(maxsize=None)
+def _load_overlay(path):
+    """叠加图像在每个进程中只解码一次"""
+    from ..core import WallowImage
+    return WallowImage.open(path)
+
+
+def parse_size(text):
+    """解析 '512M'、'2G'、'1.5GB' 或字节数"""
+    value = text.strip().upper().removesuffix('B').removesuffix('I')
+    unit = value[-1] if value and value[-1] in _SIZE_UNITS else ''
+    number = value[:-1] if unit else value
+    try:
+        return int(float(number) * _SIZE_UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的大小: {text}")
+
+
+def expand_inputs(patterns, recursive=False, extensions=DEFAULT_EXTENSIONS):
+    """
+    展开输入：文件、目录 (扫描其中的图像) 或glob模式，按出现顺序去重
+
+    生成:
+        文件路径
+    """
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths = scan_images(pattern, extensions, recursive, report_errors=True)
+        elif glob.has_magic(pattern):
+            paths = (p for p in glob.iglob(pattern, recursive=True) if os.path.isfile(p))
+        else:
+            paths = [pattern]
+        for path in paths:
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                yield path
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m wallow',
+        description='按配方批量处理图像')
+    parser.add_argument('recipe', help='配方文件 (.json 或 .toml)')
+    parser.add_argument('inputs', nargs='+', help='输入文件、目录或glob模式 (如 "photos/**/*.jpg")')
+    parser.add_argument('-o', '--output-dir', help='输出目录 (覆盖配方中的 output.dir)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 4,
+                        help='并行的工作线程/进程数 (默认为CPU核数)')
+    parser.add_argument('--executor', choices=EXECUTORS, default='thread', help='执行器类型')
+    parser.add_argument('--chunksize', type=int, default=1, help='每个任务包含的文件数')
+    parser.add_argument('--memory-budget', type=parse_size,
+                        help='内存预算 (如 4G)，按文件头估算的峰值内存调度任务')
+    parser.add_argument('--recursive', action='store_true', help='递归扫描输入目录')
+    parser.add_argument('--manifest', help='清单文件，跳过已处理且未改变的文件')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='输出缓存目录，输入和配方都相同的文件直接使用缓存的输出')
+    parser.add_argument('--cache-size', type=parse_size, default='1G',
+                        help='输出缓存的大小上限 (默认 1G)')
+    parser.add_argument('--events', help='把每个文件的处理事件写入JSON Lines文件')
+    parser.add_argument('--summary', default='-',
+                        help='汇总JSON的输出路径，"-" 表示标准输出 (默认)')
+    parser.add_argument('--profile', nargs='?', const='wallow.prof', metavar='PATH',
+                        help='用cProfile分析工作线程/进程中的每个任务，汇总结果保存到PATH '
+                             '并打印耗时最多的函数')
+    parser.add_argument('-v', '--verbose', action='store_true', help='打印每个文件的处理结果')
+    return parser
+
+
+def main(argv=None):
+    """
+    命令行入口
+
+    返回:
+        退出码：0 全部成功，1 有文件处理失败，2 参数或配方错误
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        recipe = load_recipe(args.recipe)
+    except (OSError, ValueError) as e:
+        print(f"配方错误: {e}", file=sys.stderr)
+        return 2
+
+    output = recipe.get('output', {})
+    output_dir = args.output_dir or output.get('dir')
+    renditions = [tuple(target) if not isinstance(target[0], list) else
+                  (tuple(target[0]),) + tuple(target[1:])
+                  for target in output.get('renditions', [])] or None
+
+    metrics = BatchMetrics()
+    cache = OutputCache(args.cache, args.cache_size) if args.cache else None
+    sink = JsonLinesSink(args.events) if args.events else None
+    options = dict(
+        output_dir=output_dir, threads=args.jobs, executor=args.executor,
+        chunksize=args.chunksize, manifest=args.manifest, on_event=sink, metrics=metrics,
+        verbose=args.verbose, renditions=renditions, memory_budget=args.memory_budget,
+        output_format=output.get('format'), quality=output.get('quality', 85), cache=cache,
+        ops=recipe.get('ops', []))
+    file_paths = expand_inputs(args.inputs, args.recursive)
+
+    # 解码、处理和编码都在工作线程/进程中进行，每个任务单独分析后汇总
+    profiler = ProfileCollector() if args.profile else None
+
+    started = time.perf_counter()
+    try:
+        batch_process(file_paths, apply_recipe, profiler=profiler, **options)
+    finally:
+        if sink is not None:
+            sink.close()
+
+    summary = metrics.snapshot()
+    summary['wall_time'] = round(time.perf_counter() - started, 3)
+    summary['recipe'] = os.path.abspath(args.recipe)
+    summary['output_dir'] = output_dir
+    summary['jobs'] = args.jobs
+    summary['executor'] = args.executor
+    if cache is not None:
+        summary.setdefault('cache', {})['directory'] = cache.directory
+
+    if profiler is not None and profiler.stats is not None:
+        profiler.stats.dump_stats(args.profile)
+        summary['profile'] = {'path': os.path.abspath(args.profile), 'tasks': profiler.tasks}
+        profiler.stats.stream = sys.stderr
+        profiler.stats.sort_stats('cumulative').print_stats(25)
+
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.summary == '-':
+        print(text)
+    else:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+    return 1 if summary['counts'].get('error') else 0
@@ -0,0 +1,129 @@
+"""
+直方图与统计工具
+"""
+
+from collections import Counter
+
+
+class ImageStatistics:
+    """
+    单次遍历得到的各通道统计信息
+
+    属性:
+        color_mode: 颜色模式
+        histograms: 每个通道一个长度为256的计数列表
+        count: 参与统计的像素数量
+        minimum, maximum, mean: 每个通道的最小值、最大值和平均值
+    """
+
+    def __init__(self, color_mode, histograms):
+        self.color_mode = color_mode
+        self.histograms = histograms
+        self.count = sum(histograms[0]) if histograms else 0
+
+        self.minimum = []
+        self.maximum = []
+        self.mean = []
+        for hist in histograms:
+            values = [v for v in range(256) if hist[v]]
+            self.minimum.append(values[0] if values else 0)
+            self.maximum.append(values[-1] if values else 0)
+            total = sum(v * n for v, n in enumerate(hist))
+            self.mean.append(total / self.count if self.count else 0.0)
+
+    def channel_index(self, channel):
+        """将通道名 ('R'、'A' 等) 或序号转换为序号"""
+        if isinstance(channel, str):
+            return self.color_mode.index(channel)
+        return channel
+
+    def percentile(self, channel, percent):
+        """
+        返回通道的百分位数
+
+        参数:
+            channel: 通道名或序号
+            percent: 0-100 的百分比
+
+        返回:
+            最小的值 v，使得不大于 v 的像素占比达到 percent
+        """
+        hist = self.histograms[self.channel_index(channel)]
+        target = self.count * percent / 100
+        running = 0
+        for value, n in enumerate(hist):
+            running += n
+            if running >= target and running:
+                return value
+        return 255
+
+    def clip_points(self, low=0.5, high=None):
+        """
+        计算每个通道裁剪掉两端指定比例后的范围
+
+        参数:
+            low: 暗部裁剪的百分比
+            high: 亮部裁剪的百分比 (默认与low相同)
+
+        返回:
+            每个通道一个 (下限, 上限) 元组
+        """
+        if high is None:
+            high = low
+        return [(self.percentile(c, low), self.percentile(c, 100 - high))
+                for c in range(len(self.histograms))]
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'channels': {
+                channel: {
+                    'min': self.minimum[c],
+                    'max': self.maximum[c],
+                    'mean': round(self.mean[c], 3),
+                }
+                for c, channel in enumerate(self.color_mode)
+            },
+        }
+
+
+def compute_statistics(pixel_data, color_mode, step=1):
+    """
+    统计交错像素数据的各通道直方图
+
+    参数:
+        pixel_data: 像素数据
+        color_mode: 颜色模式
+        step: 采样步长，每隔step个像素取一个
+
+    返回:
+        ImageStatistics实例
+    """
+    channels = len(color_mode)
+    stride = channels * max(1, int(step))
+    histograms = []
+    for c in range(channels):
+        counts = Counter(pixel_data[c::stride])
+        histograms.append([counts.get(v, 0) for v in range(256)])
+    return ImageStatistics(color_mode, histograms)
+
+
+def get_statistics(image, step=1):
+    """
+    获取图像的统计信息，结果缓存在图像上，像素缓冲区改变后自动失效
+
+    参数:
+        image: WallowImage实例
+        step: 采样步长
+
+    返回:
+        ImageStatistics实例
+    """
+    data = image._pixel_data
+    key = (id(data), len(data), image._data_version, image.color_mode, step)
+    cache = image._stats_cache
+    if key not in cache:
+        for stale in [k for k in cache if k[:4] != key[:4]]:
+            del cache[stale]
+        cache[key] = compute_statistics(data, image.color_mode, step)
+    return cache[key]
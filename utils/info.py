@@ -4,14 +4,17 @@
 
 import os
 from ..core import WallowImage
+from .histogram import get_statistics
 
 
-def get_image_info(image_path_or_instance):
+def get_image_info(image_path_or_instance, statistics=False, step=1):
     """
     获取图像的详细信息
 
     参数:
         image_path_or_instance: 文件路径或WallowImage实例
+        statistics: 是否包含各通道的最小值、最大值和平均值
+        step: 统计时的采样步长
 
     返回:
         包含图像信息的字典
@@ -33,6 +36,9 @@ def get_image_info(image_path_or_instance):
         'memory_size': len(img._pixel_data),
     }
 
+    if statistics:
+        info['statistics'] = get_statistics(img, step).as_dict()
+
     if file_path:
         info.update({
             'file_name': os.path.basename(file_path),
@@ -0,0 +1,246 @@
+"""
+批处理清单 - 记录每个输入文件在某个处理配方下的输出，用于增量和断点续跑
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import partial
+from types import MethodType
+
+_HASH_BLOCK = 1024 * 1024
+
+
+def recipe_fingerprint(process_func, kwargs=None, extra=None):
+    """
+    计算处理函数及其参数的稳定指纹
+
+    指纹包含函数的模块名、限定名和字节码 (含常量及嵌套函数)，
+    因此修改函数实现或参数都会得到不同的指纹。
+
+    参数:
+        process_func: 处理函数 (支持 functools.partial)
+        kwargs: 传递给处理函数的参数
+        extra: 其他影响输出的设置 (如输出格式)
+
+    返回:
+        十六进制字符串
+    """
+    digest = hashlib.sha256()
+    _hash_callable(digest, process_func)
+    digest.update(_canonical_json(kwargs or {}).encode())
+    digest.update(_canonical_json(extra).encode())
+    return digest.hexdigest()
+
+
+def _hash_callable(digest, func, seen=None):
+    # seen 记录已经展开的函数，避免递归引用自身的闭包无限展开
+    seen = set() if seen is None else seen
+    if id(func) in seen:
+        digest.update(b'<recursive>')
+        return
+    seen.add(id(func))
+
+    if isinstance(func, partial):
+        _hash_callable(digest, func.func, seen)
+        digest.update(_canonical_json([func.args, func.keywords]).encode())
+        return
+    if isinstance(func, MethodType):
+        _hash_callable(digest, func.__func__, seen)
+        digest.update(_canonical_json(func.__self__).encode())
+        return
+    if not hasattr(func, '__qualname__'):
+        # 定义了 __call__ 的对象：按类的实现和实例属性描述
+        digest.update(f"{type(func).__module__}.{type(func).__qualname__}".encode())
+        digest.update(_canonical_json(getattr(func, '__dict__', None)).encode())
+        _hash_callable(digest, type(func).__call__, seen)
+        return
+
+    digest.update(f"{getattr(func, '__module__', '')}.{func.__qualname__}".encode())
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return
+    _hash_code(digest, code)
+
+    # 默认参数和闭包捕获的值同样决定函数的行为 (如工厂函数生成的滤镜使用的查找表)
+    digest.update(_canonical_json([getattr(func, '__defaults__', None),
+                                   getattr(func, '__kwdefaults__', None)]).encode())
+    for cell in getattr(func, '__closure__', None) or ():
+        try:
+            contents = cell.cell_contents
+        except ValueError:  # 尚未赋值的单元
+            digest.update(b'<empty>')
+            continue
+        if callable(contents):
+            _hash_callable(digest, contents, seen)
+        else:
+            digest.update(_canonical_json(contents).encode())
+
+
+def _hash_code(digest, code):
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            _hash_code(digest, const)
+        else:
+            digest.update(_const_repr(const).encode())
+
+
+def _const_repr(const):
+    """常量的稳定表示：frozenset 按元素排序，不受 PYTHONHASHSEED 影响"""
+    if isinstance(const, frozenset):
+        return 'frozenset({' + ', '.join(sorted(map(_const_repr, const))) + '})'
+    if isinstance(const, tuple):
+        return '(' + ', '.join(map(_const_repr, const)) + ',)'
+    return repr(const)
+
+
+def _canonical_json(value):
+    return json.dumps(value, sort_keys=True, default=_describe)
+
+
+def _describe(value):
+    """
+    不能直接序列化为JSON的值 (函数、图像等) 的稳定描述
+
+    无法按值描述的对象抛出TypeError，不使用包含内存地址的repr
+    """
+    if callable(value):
+        digest = hashlib.sha256()
+        _hash_callable(digest, value)
+        return f"callable:{digest.hexdigest()}"
+    if hasattr(value, '_pixel_data'):
+        return f"image:{hashlib.sha256(value._pixel_data).hexdigest()}"
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=_canonical_json)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"bytes:{hashlib.sha256(value).hexdigest()}"
+    if type(value).__repr__ is object.__repr__:
+        # 默认的repr包含内存地址，每次运行都不同：按实例属性描述，没有属性时拒绝
+        state = getattr(value, '__dict__', None)
+        if state is None:
+            raise TypeError(f"Cannot describe {type(value).__qualname__} value for a fingerprint")
+        return {'type': f"{type(value).__module__}.{type(value).__qualname__}", 'state': state}
+    return repr(value)
+
+
+def file_digest(file_path):
+    """计算文件内容的哈希值"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BatchManifest:
+    """
+    基于SQLite的批处理清单
+
+    每条记录对应 (输入路径, 配方指纹)，保存输入文件的大小、修改时间、
+    可选的内容哈希以及生成的输出路径。
+
+    参数:
+        path: 清单文件路径
+        hash_content: 大小相同但修改时间变化时，是否比较内容哈希后再决定是否重新处理
+        commit_every: 每记录多少个文件提交一次
+    """
+
+    def __init__(self, path, hash_content=False, commit_every=100):
+        self.path = path
+        self.hash_content = hash_content
+        self.commit_every = commit_every
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                input_path TEXT NOT NULL,
+                recipe TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT,
+                output_path TEXT NOT NULL,
+                completed_at REAL NOT NULL,
+                PRIMARY KEY (input_path, recipe)
+            )
+        ''')
+        self._conn.commit()
+
+    def is_current(self, file_path, recipe, output_path=None, stat_result=None):
+        """
+        判断文件在该配方下是否已处理且未改变
+
+        参数:
+            file_path: 输入文件路径
+            recipe: 配方指纹 (recipe_fingerprint 的结果)
+            output_path: 期望的输出路径，不一致或不存在时视为需要重新处理
+            stat_result: 可选，已有的 os.stat 结果
+
+        返回:
+            True 表示可以跳过
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT size, mtime_ns, content_hash, output_path FROM entries '
+                'WHERE input_path = ? AND recipe = ?',
+                (os.path.abspath(file_path), recipe)).fetchone()
+        if row is None:
+            return False
+
+        size, mtime_ns, content_hash, recorded_output = row
+        if output_path is not None and os.path.abspath(output_path) != recorded_output:
+            return False
+        if not os.path.exists(recorded_output):
+            return False
+
+        st = stat_result or os.stat(file_path)
+        if st.st_size != size:
+            return False
+        if st.st_mtime_ns == mtime_ns:
+            return True
+        if self.hash_content and content_hash and file_digest(file_path) == content_hash:
+            self.record(file_path, recipe, recorded_output, st, content_hash)
+            return True
+        return False
+
+    def record(self, file_path, recipe, output_path, stat_result=None, content_hash=None):
+        """记录一个已成功处理的文件"""
+        st = stat_result or os.stat(file_path)
+        if self.hash_content and content_hash is None:
+            content_hash = file_digest(file_path)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (os.path.abspath(file_path), recipe, st.st_size, st.st_mtime_ns,
+                 content_hash, os.path.abspath(output_path), time.time()))
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self._conn.commit()
+                self._pending = 0
+
+    def forget(self, file_path, recipe=None):
+        """删除文件的记录 (recipe为None时删除所有配方下的记录)"""
+        with self._lock:
+            if recipe is None:
+                self._conn.execute('DELETE FROM entries WHERE input_path = ?',
+                                   (os.path.abspath(file_path),))
+            else:
+                self._conn.execute('DELETE FROM entries WHERE input_path = ? AND recipe = ?',
+                                   (os.path.abspath(file_path), recipe))
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,248 @@
+"""
+批处理指标 - 每个文件的处理事件、滚动吞吐量和延迟统计
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+STAGES = ('decode', 'process', 'encode', 'write')
+
+
+class FileEvent:
+    """
+    单个文件的处理事件
+
+    属性:
+        path: 输入文件路径
+        status: 'ok'、'error' 或 'skipped'
+        output_path: 输出文件路径
+        timings: 各阶段耗时 (秒)，键为 decode、process、encode、write
+        bytes_read, bytes_written: 读取和写入的字节数
+        error: 错误信息
+        traceback: 错误的完整堆栈
+        worker: 处理该文件的进程号
+        cache_hit: 是否命中输出缓存 (未使用缓存时为None)
+        exception: 原始异常对象 (不写入JSON)
+    """
+
+    def __init__(self, path, status='ok', output_path=None):
+        self.path = path
+        self.status = status
+        self.output_path = output_path
+        self.timings = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.error = None
+        self.traceback = None
+        self.worker = os.getpid()
+        self.finished_at = None
+        self.exception = None
+        self.cache_hit = None
+
+    @property
+    def latency(self):
+        """各阶段耗时之和"""
+        return sum(self.timings.values())
+
+    def as_dict(self):
+        return {
+            'type': 'file',
+            'path': os.fspath(self.path),
+            'status': self.status,
+            'output_path': self.output_path,
+            'timings': {stage: round(t, 6) for stage, t in self.timings.items()},
+            'latency': round(self.latency, 6),
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'error': self.error,
+            'traceback': self.traceback,
+            'worker': self.worker,
+            'cache_hit': self.cache_hit,
+            'finished_at': self.finished_at,
+        }
+
+
+class StageTimer:
+    """记录各阶段耗时到FileEvent
+
+        with timer('decode'):
+            ...
+    """
+
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, stage):
+        return _Stage(self.event, stage)
+
+
+class _Stage:
+    def __init__(self, event, stage):
+        self.event = event
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        self.event.timings[self.stage] = self.event.timings.get(self.stage, 0.0) + elapsed
+
+
+class BatchMetrics:
+    """
+    汇总批处理事件
+
+    参数:
+        window: 计算滚动吞吐量和延迟百分位数时使用的最近事件数
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.started_at = time.time()
+        self.counts = {'ok': 0, 'error': 0, 'skipped': 0}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.stage_totals = dict.fromkeys(STAGES, 0.0)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def update(self, event):
+        with self._lock:
+            self.counts[event.status] = self.counts.get(event.status, 0) + 1
+            self.bytes_read += event.bytes_read
+            self.bytes_written += event.bytes_written
+            for stage, elapsed in event.timings.items():
+                self.stage_totals[stage] = self.stage_totals.get(stage, 0.0) + elapsed
+            if event.cache_hit is not None:
+                if event.cache_hit:
+                    self.cache_hits += 1
+                else:
+                    self.cache_misses += 1
+            if event.status == 'ok':
+                self._recent.append((event.finished_at or time.time(), event.latency))
+
+    def snapshot(self):
+        """
+        返回当前指标
+
+        返回:
+            包含计数、字节数、各阶段总耗时、整体与滚动吞吐量 (文件/秒)
+            以及最近 window 个文件延迟的 p50/p90/p99 的字典，使用输出缓存时还包含命中次数
+        """
+        with self._lock:
+            now = time.time()
+            elapsed = max(now - self.started_at, 1e-9)
+            recent = list(self._recent)
+            snapshot = {
+                'type': 'summary',
+                'elapsed': round(elapsed, 3),
+                'counts': dict(self.counts),
+                'bytes_read': self.bytes_read,
+                'bytes_written': self.bytes_written,
+                'stage_totals': {k: round(v, 6) for k, v in self.stage_totals.items()},
+                'throughput': round(self.counts['ok'] / elapsed, 3),
+            }
+            if self.cache_hits or self.cache_misses:
+                snapshot['cache'] = {'hits': self.cache_hits, 'misses': self.cache_misses}
+
+        if len(recent) >= 2:
+            span = max(recent[-1][0] - recent[0][0], 1e-9)
+            snapshot['rolling_throughput'] = round((len(recent) - 1) / span, 3)
+        latencies = sorted(latency for _, latency in recent)
+        snapshot['latency'] = {
+            name: round(_percentile(latencies, p), 6) for name, p in
+            (('p50', 50), ('p90', 90), ('p99', 99))
+        } if latencies else {}
+        return snapshot
+
+
+def _percentile(sorted_values, percent):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))
+    return sorted_values[index]
+
+
+class JsonLinesSink:
+    """
+    将事件以JSON Lines格式写入文件，可作为 on_event 回调使用
+
+    参数:
+        path: 输出文件路径或已打开的文本文件对象
+        metrics: 可选的BatchMetrics，每 summary_every 个事件及关闭时写入一行汇总
+        summary_every: 写入汇总的间隔
+    """
+
+    def __init__(self, path, metrics=None, summary_every=1000):
+        self._owns_file = isinstance(path, (str, os.PathLike))
+        self._file = open(path, 'a', encoding='utf-8') if self._owns_file else path
+        self.metrics = metrics
+        self.summary_every = summary_every
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        lines = [event.as_dict()]
+        with self._lock:
+            self._count += 1
+            if self.metrics is not None and self._count % self.summary_every == 0:
+                lines.append(self.metrics.snapshot())
+            for line in lines:
+                self._file.write(json.dumps(line, ensure_ascii=False) + '\n')
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self.metrics is not None:
+                self._file.write(json.dumps(self.metrics.snapshot(), ensure_ascii=False) + '\n')
+            if self._owns_file:
+                self._file.close()
+            else:
+                self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ProfileCollector:
+    """
+    汇总批处理各任务的cProfile统计，可作为 batch_process 的 profiler 参数
+
+    属性:
+        stats: 合并后的pstats.Stats，还没有统计时为None
+        tasks: 已汇总的任务数
+    """
+
+    def __init__(self):
+        self.stats = None
+        self.tasks = 0
+        self._lock = threading.Lock()
+
+    def add(self, raw_stats):
+        """合并一个任务的统计数据 (cProfile.Profile.stats)，None表示该任务未分析"""
+        import pstats
+
+        if raw_stats is None:
+            return
+        with self._lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(_RawStats(raw_stats))
+            else:
+                self.stats.add(_RawStats(raw_stats))
+            self.tasks += 1
+
+
+class _RawStats:
+    # pstats.Stats 可以从带有 create_stats() 和 stats 属性的对象加载统计数据
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
@@ -0,0 +1,160 @@
+"""
+颜色模式转换 - 基于整通道切片和查找表的批量实现
+
+支持的模式:
+    L     灰度
+    LA    灰度 + Alpha
+    RGB   彩色
+    RGBA  彩色 + Alpha
+    RGBa  预乘Alpha的RGBA
+"""
+
+from .pool import get_buffer_pool
+
+SUPPORTED_MODES = ('L', 'LA', 'RGB', 'RGBA', 'RGBa')
+
+_ALPHA_MODES = ('LA', 'RGBA', 'RGBa')
+_GRAY_MODES = ('L', 'LA')
+
+# _MULTIPLY[a][c] = round(c * a / 255)
+_MULTIPLY = [bytes((c * a + 127) // 255 for c in range(256)) for a in range(256)]
+# _UNMULTIPLY[a][c] = min(255, round(c * 255 / a))，a == 0 时为0
+_UNMULTIPLY = [bytes(256)] + [
+    bytes(min(255, (c * 255 + a // 2) // a) for c in range(256)) for a in range(1, 256)
+]
+
+# 亮度系数 (0.299, 0.587, 0.114) 的16位定点乘积表，舍入项并入红色表
+_LUMA_R = [v * 19595 + 32768 for v in range(256)]
+_LUMA_G = [v * 38470 for v in range(256)]
+_LUMA_B = [v * 7471 for v in range(256)]
+
+
+def has_alpha(color_mode):
+    return color_mode in _ALPHA_MODES
+
+
+def is_lossless_conversion(src_mode, dst_mode):
+    """从src_mode转换到dst_mode是否不丢失任何信息 (只增加通道)"""
+    if src_mode == dst_mode:
+        return True
+    if src_mode == 'L':
+        return dst_mode in ('LA', 'RGB', 'RGBA')
+    if src_mode == 'LA':
+        return dst_mode == 'RGBA'
+    if src_mode == 'RGB':
+        return dst_mode == 'RGBA'
+    return False
+
+
+def convert_pixels(pixel_data, src_mode, dst_mode, background=None, src_luts=None, luts=None):
+    """
+    转换交错像素数据的颜色模式
+
+    参数:
+        pixel_data: 像素数据
+        src_mode: 源颜色模式
+        dst_mode: 目标颜色模式
+        background: 去掉Alpha通道时合成到的背景色，灰度值或 (r, g, b)；
+                    None 表示直接丢弃Alpha
+        src_luts: 可选，每个源通道一张256字节查找表，拆分通道时应用
+                  (合并转换之前的逐通道查找表滤镜)
+        luts: 可选，每个目标通道一张256字节查找表，写入输出前应用
+              (合并转换之后的逐通道查找表滤镜)
+
+    返回:
+        从缓冲池借出的新bytearray
+    """
+    for mode in (src_mode, dst_mode):
+        if mode not in SUPPORTED_MODES:
+            raise ValueError(f"Unsupported color mode: {mode}")
+
+    pool = get_buffer_pool()
+    src_channels = len(src_mode)
+    if src_mode == dst_mode:
+        out = pool.copy(pixel_data)
+        for tables in (src_luts, luts):
+            for c, lut in enumerate(tables or ()):
+                out[c::src_channels] = out[c::src_channels].translate(lut)
+        return out
+
+    count = len(pixel_data) // src_channels
+
+    # 拆分通道
+    def source_plane(c):
+        plane = pixel_data[c::src_channels]
+        return plane if src_luts is None else plane.translate(src_luts[c])
+
+    if src_mode in _GRAY_MODES:
+        color = [source_plane(0)]
+    else:
+        color = [source_plane(c) for c in range(3)]
+    alpha = source_plane(src_channels - 1) if has_alpha(src_mode) else None
+    if src_mode == 'RGBa':
+        color = [_unpremultiply(plane, alpha) for plane in color]
+
+    # 去掉Alpha时合成到背景色
+    dst_gray = dst_mode in _GRAY_MODES
+    if alpha is not None and not has_alpha(dst_mode) and background is not None:
+        background = _normalize_background(background)
+        if len(color) == 1 and len(set(background)) > 1:
+            color = color * 3
+        if len(color) == 1:
+            background = background[:1]
+        color = [_flatten(plane, alpha, bg) for plane, bg in zip(color, background)]
+
+    # 颜色通道数变换
+    if dst_gray and len(color) == 3:
+        color = [_luma(*color)]
+    elif not dst_gray and len(color) == 1:
+        color = color * 3
+
+    planes = color
+    if has_alpha(dst_mode):
+        if alpha is None:
+            alpha = b'\xff' * count
+        elif dst_mode == 'RGBa':
+            planes = [_premultiply(plane, alpha) for plane in color]
+        planes = planes + [alpha]
+    if luts is not None:
+        planes = [plane.translate(lut) for plane, lut in zip(planes, luts)]
+
+    dst_channels = len(dst_mode)
+    out = pool.acquire(count * dst_channels)
+    if dst_channels == 1:
+        out[:] = planes[0]
+    else:
+        for c, plane in enumerate(planes):
+            out[c::dst_channels] = plane
+    return out
+
+
+def _normalize_background(background):
+    if isinstance(background, int):
+        return (background, background, background)
+    background = tuple(background)
+    if len(background) == 1:
+        return background * 3
+    return background[:3]
+
+
+def _luma(r, g, b):
+    tr, tg, tb = _LUMA_R, _LUMA_G, _LUMA_B
+    return bytes(map(lambda r, g, b: (tr[r] + tg[g] + tb[b]) >> 16, r, g, b))
+
+
+def _premultiply(plane, alpha):
+    table = _MULTIPLY
+    return bytes(map(lambda c, a: table[a][c], plane, alpha))
+
+
+def _unpremultiply(plane, alpha):
+    table = _UNMULTIPLY
+    return bytes(map(lambda c, a: table[a][c], plane, alpha))
+
+
+def _flatten(plane, alpha, background):
+    """c * a + bg * (1 - a)"""
+    table = _MULTIPLY
+    bg = table[background]
+    bg_part = bytes(bg[255 - a] for a in range(256))
+    return bytes(map(lambda c, a: table[a][c] + bg_part[a], plane, alpha))
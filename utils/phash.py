@@ -0,0 +1,232 @@
+"""
+感知哈希 - 用于识别内容相同或相近的图像
+"""
+
+import json
+import math
+import os
+
+from core import WallowImage
+from .modes import convert_pixels
+
+HASH_METHODS = ('ahash', 'dhash', 'phash')
+
+# 先用最近邻缩放到目标尺寸的这个倍数，再按块取平均，近似面积平均缩放
+_SAMPLES_PER_CELL = 4
+_PHASH_SIZE = 32
+
+
+def load_for_hash(file_path, min_size=64):
+    """
+    以尽量低的开销解码图像用于计算哈希
+
+    JPEG按DCT缩放比例直接解码为小图，其他格式完整解码。
+    """
+    from formats import JPEGAIc, get_codec
+
+    codec = get_codec(file_path)
+    if isinstance(codec, JPEGAIc):
+        return codec.decode(file_path, draft_size=(min_size, min_size))
+    return WallowImage.open(file_path)
+
+
+def hash_file(file_path, method='dhash', keep=False):
+    """
+    计算文件的感知哈希
+
+    参数:
+        file_path: 文件路径
+        method: 'ahash'、'dhash' 或 'phash'
+        keep: 是否返回为计算哈希而完整解码的图像，供后续处理复用
+
+    返回:
+        (哈希值, 图像)；JPEG等按缩小比例解码的文件或 keep 为False时图像为None
+    """
+    from formats import JPEGAIc, get_codec
+
+    image = load_for_hash(file_path)
+    hash_value = image_hash(image, method)
+    if keep and not isinstance(get_codec(file_path), JPEGAIc):
+        return hash_value, image
+    image.close()
+    return hash_value, None
+
+
+def image_hash(image, method='dhash', hash_size=8):
+    """
+    计算图像的感知哈希
+
+    参数:
+        image: WallowImage实例或文件路径
+        method: 'ahash'、'dhash' 或 'phash'
+        hash_size: 哈希边长，结果为 hash_size * hash_size 位
+
+    返回:
+        整数哈希值
+    """
+    if method not in HASH_METHODS:
+        raise ValueError(f"Unsupported hash method: {method}")
+    if isinstance(image, (str, os.PathLike)):
+        image = load_for_hash(image)
+
+    if method == 'ahash':
+        pixels = _gray_thumbnail(image, hash_size, hash_size)
+        mean = sum(pixels) / len(pixels)
+        return _bits(p > mean for p in pixels)
+
+    if method == 'dhash':
+        width = hash_size + 1
+        pixels = _gray_thumbnail(image, width, hash_size)
+        return _bits(pixels[y * width + x] < pixels[y * width + x + 1]
+                     for y in range(hash_size) for x in range(hash_size))
+
+    pixels = _gray_thumbnail(image, _PHASH_SIZE, _PHASH_SIZE)
+    coefficients = _dct_low_frequencies(pixels, hash_size)
+    # 去掉直流分量后取中位数
+    ac = sorted(coefficients[1:])
+    median = ac[len(ac) // 2]
+    return _bits(c > median for c in coefficients)
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def _bits(flags):
+    value = 0
+    for flag in flags:
+        value = (value << 1) | bool(flag)
+    return value
+
+
+def _gray_thumbnail(image, width, height):
+    """缩放为 width x height 的灰度图，返回像素值列表"""
+    data = image._pixel_data
+    if image.color_mode != 'L':
+        data = convert_pixels(data, image.color_mode, 'L')
+
+    n = _SAMPLES_PER_CELL
+    sample_w = min(image.width, width * n)
+    sample_h = min(image.height, height * n)
+    sampled, _ = image._resize_impl(data, sample_w, sample_h,
+                                    size=(image.width, image.height), color_mode='L')
+
+    cells = []
+    for y in range(height):
+        y0 = y * sample_h // height
+        y1 = max((y + 1) * sample_h // height, y0 + 1)
+        for x in range(width):
+            x0 = x * sample_w // width
+            x1 = max((x + 1) * sample_w // width, x0 + 1)
+            total = 0
+            for sy in range(y0, y1):
+                row = sy * sample_w
+                total += sum(sampled[row + x0:row + x1])
+            cells.append(total / ((y1 - y0) * (x1 - x0)))
+    return cells
+
+
+_DCT_COS = {}
+
+
+def _dct_low_frequencies(pixels, count):
+    """二维DCT-II，只计算左上角 count x count 个系数"""
+    size = _PHASH_SIZE
+    cos = _DCT_COS.get(count)
+    if cos is None:
+        cos = [[math.cos(math.pi * (2 * i + 1) * u / (2 * size)) for i in range(size)]
+               for u in range(count)]
+        _DCT_COS[count] = cos
+
+    # 先对每行变换，再对列变换
+    rows = [[sum(c * p for c, p in zip(cos[u], pixels[y * size:(y + 1) * size]))
+             for u in range(count)] for y in range(size)]
+    return [sum(cos[v][y] * rows[y][u] for y in range(size))
+            for v in range(count) for u in range(count)]
+
+
+class HashIndex:
+    """
+    支持按汉明距离查找的哈希索引 (BK树)，可保存到磁盘
+
+    参数:
+        path: 可选的索引文件路径 (JSON Lines)，存在时自动加载，add时追加写入
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._root = None
+        self._size = 0
+        self._file = None
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._insert(int(entry['hash'], 16), entry['value'])
+        if path:
+            self._file = open(path, 'a', encoding='utf-8')
+
+    def __len__(self):
+        return self._size
+
+    def add(self, hash_value, value=None):
+        """添加一个哈希及其关联的值"""
+        self._insert(hash_value, value)
+        if self._file is not None:
+            self._file.write(json.dumps({'hash': f"{hash_value:x}", 'value': value},
+                                        ensure_ascii=False) + '\n')
+            self._file.flush()
+
+    def _insert(self, hash_value, value):
+        self._size += 1
+        node = [hash_value, value, {}]
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming_distance(hash_value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, hash_value, radius):
+        """
+        查找距离不超过radius的所有条目
+
+        返回:
+            按距离排序的 (距离, 哈希, 值) 列表
+        """
+        results = []
+        if self._root is None:
+            return results
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= radius:
+                results.append((distance, node[0], node[1]))
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        results.sort(key=lambda item: item[0])
+        return results
+
+    def nearest(self, hash_value, radius):
+        """返回距离最近的条目，没有则返回None"""
+        results = self.search(hash_value, radius)
+        return results[0] if results else None
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
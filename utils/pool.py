@@ -0,0 +1,125 @@
+"""
+像素缓冲池 - 复用同尺寸的bytearray，减少批量处理中的内存分配
+"""
+
+import threading
+from contextlib import contextmanager
+
+
+class BufferPool:
+    """
+    按字节数分桶的缓冲池
+
+    批量处理的图像通常尺寸相同，每一步的输出缓冲区大小也相同，
+    因此按精确字节数分桶即可获得很高的命中率。
+
+    参数:
+        max_bytes: 池中最多缓存的空闲字节数
+        max_per_bucket: 每个尺寸最多缓存的空闲缓冲区数量
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, max_per_bucket=4):
+        self.max_bytes = max_bytes
+        self.max_per_bucket = max_per_bucket
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._pooled_bytes = 0
+        self._peak_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._releases = 0
+        self._discards = 0
+
+    def acquire(self, size):
+        """
+        借出一个长度为size的缓冲区
+
+        返回的缓冲区内容未定义，调用方需要完整写入。
+        """
+        with self._lock:
+            bucket = self._buckets.get(size)
+            if bucket:
+                buf = bucket.pop()
+                self._pooled_bytes -= size
+                self._hits += 1
+            else:
+                buf = None
+                self._misses += 1
+
+        # 借出的缓冲区不做记录：未归还的缓冲区会被回收，id也会被复用
+        if buf is None:
+            buf = bytearray(size)
+        return buf
+
+    def copy(self, data):
+        """借出一个缓冲区并填入data的副本"""
+        buf = self.acquire(len(data))
+        buf[:] = data
+        return buf
+
+    def release(self, buf):
+        """归还缓冲区，归还后调用方不得再使用它"""
+        if not isinstance(buf, bytearray):
+            return
+        size = len(buf)
+        with self._lock:
+            self._releases += 1
+
+            bucket = self._buckets.setdefault(size, [])
+            if any(pooled is buf for pooled in bucket):
+                return
+            if (size == 0 or len(bucket) >= self.max_per_bucket
+                    or self._pooled_bytes + size > self.max_bytes):
+                self._discards += 1
+                return
+            bucket.append(buf)
+            self._pooled_bytes += size
+            self._peak_bytes = max(self._peak_bytes, self._pooled_bytes)
+
+    @contextmanager
+    def borrow(self, size):
+        """在with块内借用缓冲区，退出时自动归还"""
+        buf = self.acquire(size)
+        try:
+            yield buf
+        finally:
+            self.release(buf)
+
+    def clear(self):
+        """丢弃所有空闲缓冲区"""
+        with self._lock:
+            self._buckets.clear()
+            self._pooled_bytes = 0
+
+    def stats(self):
+        """
+        返回缓冲池统计信息
+
+        返回:
+            包含 hits、misses、releases、discards、pooled_bytes 和
+            peak_bytes (池中空闲字节数的峰值) 的字典
+        """
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'releases': self._releases,
+                'discards': self._discards,
+                'pooled_bytes': self._pooled_bytes,
+                'peak_bytes': self._peak_bytes,
+            }
+
+
+_default_pool = BufferPool()
+
+
+def get_buffer_pool():
+    """获取全局缓冲池"""
+    return _default_pool
+
+
+def set_buffer_pool(pool):
+    """替换全局缓冲池，返回之前的缓冲池"""
+    global _default_pool
+    previous, _default_pool = _default_pool, pool
+    return previous
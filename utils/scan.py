@@ -0,0 +1,181 @@
+"""
+目录扫描 - 基于os.scandir的并行、流式图像文件扫描
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+_HEADER_SIZE = 16
+
+# 扫描线程与调用方之间最多缓冲的结果数
+_QUEUE_SIZE = 1024
+# 单个目录扫描结束的标记
+_DONE = object()
+
+
+class ScanEntry(str):
+    """
+    扫描得到的文件路径
+
+    是str的子类，可以直接当作路径使用，同时携带扫描时得到的信息，
+    后续阶段无需再次stat。
+
+    属性:
+        stat_result: os.stat_result，未获取时为None
+        codec: 按文件头确认的编解码器类名，未检查时为None
+        error: 无法读取的子目录的OSError (此时路径为该子目录)，其他情况为None
+    """
+
+    def __new__(cls, path, stat_result=None, codec=None, error=None):
+        entry = super().__new__(cls, path)
+        entry.stat_result = stat_result
+        entry.codec = codec
+        entry.error = error
+        return entry
+
+    @property
+    def size(self):
+        return self.stat_result.st_size if self.stat_result is not None else os.path.getsize(self)
+
+
+def file_stat(path):
+    """优先使用扫描时缓存的stat结果"""
+    cached = getattr(path, 'stat_result', None)
+    return cached if cached is not None else os.stat(path)
+
+
+def scan_images(folder_path, extensions=None, recursive=False, workers=8,
+                verify_magic=False, with_stat=True, follow_symlinks=False, report_errors=False):
+    """
+    扫描文件夹中的图像文件，返回逐个生成文件的迭代器
+
+    每个子目录作为一个任务在线程池中扫描，读取到的目录项立即返回，
+    不需要先建立整个目录或整棵目录树的文件列表；在网络文件系统上多个目录可以同时等待I/O。
+    folder_path 本身无法读取时在调用时立即抛出OSError。
+
+    参数:
+        folder_path: 要扫描的文件夹
+        extensions: 文件扩展名列表 (如 ['.jpg', '.png'])
+        recursive: 是否递归扫描子文件夹
+        workers: 并行扫描的线程数
+        verify_magic: 是否读取文件头确认格式，不匹配任何编解码器的文件会被跳过
+        with_stat: 是否获取并缓存文件的stat结果
+        follow_symlinks: 是否进入符号链接指向的目录
+        report_errors: 是否返回无法读取的子目录 (error 属性不为None的ScanEntry)，
+                       为False时跳过这些子目录
+
+    返回:
+        生成ScanEntry实例的迭代器
+    """
+    if extensions is None:
+        extensions = DEFAULT_EXTENSIONS
+    extensions = frozenset(ext.lower() if ext.startswith('.') else f'.{ext.lower()}'
+                           for ext in extensions)
+    options = (extensions, verify_magic, with_stat, follow_symlinks)
+    root = os.scandir(folder_path)
+    return _walk(folder_path, root, recursive, workers, options, report_errors)
+
+
+def _walk(folder_path, root, recursive, workers, options, report_errors):
+    results = queue.Queue(_QUEUE_SIZE)
+    stop = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(directory, iterator=None):
+            pool.submit(_scan_task, directory, iterator, options, results, stop)
+
+        submit(folder_path, root)
+        active = 1
+        try:
+            while active:
+                item = results.get()
+                if item is _DONE:
+                    active -= 1
+                elif isinstance(item, BaseException):
+                    raise item
+                elif item[0]:
+                    if recursive:
+                        submit(item[1])
+                        active += 1
+                elif item[1].error is None or report_errors:
+                    yield item[1]
+        finally:
+            root.close()
+            stop.set()
+            pool.shutdown(cancel_futures=True)
+
+
+def _scan_task(directory, iterator, options, results, stop):
+    """在工作线程中扫描一个目录，结果逐项放入results，最后放入_DONE"""
+    try:
+        for item in _scan_directory(directory, iterator, *options):
+            if not _put(results, item, stop):
+                return
+    except BaseException as e:
+        _put(results, e, stop)
+    _put(results, _DONE, stop)
+
+
+def _put(results, item, stop):
+    """队列满时等待，调用方已停止读取时放弃并返回False"""
+    while not stop.is_set():
+        try:
+            results.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _scan_directory(directory, iterator, extensions, verify_magic, with_stat, follow_symlinks):
+    """
+    扫描单个目录，边读取目录项边生成结果
+
+    参数:
+        iterator: 已打开的os.scandir迭代器，None表示在此打开
+
+    生成:
+        (是否为子目录, 路径)，文件的路径为ScanEntry实例；
+        目录无法打开时生成 (False, 带error的ScanEntry)
+    """
+    if iterator is None:
+        try:
+            iterator = os.scandir(directory)
+        except OSError as e:
+            yield False, ScanEntry(directory, error=e)
+            return
+
+    with iterator:
+        for dir_entry in iterator:
+            try:
+                if dir_entry.is_dir(follow_symlinks=follow_symlinks):
+                    yield True, dir_entry.path
+                    continue
+                if not dir_entry.is_file():
+                    continue
+                if os.path.splitext(dir_entry.name)[1].lower() not in extensions:
+                    continue
+
+                codec = None
+                if verify_magic:
+                    codec = _detect_codec(dir_entry.path)
+                    if codec is None:
+                        continue
+                stat_result = dir_entry.stat() if with_stat else None
+            except OSError:
+                continue
+            yield False, ScanEntry(dir_entry.path, stat_result, codec)
+
+
+def _detect_codec(path):
+    from formats import get_codec
+
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER_SIZE)
+    try:
+        return type(get_codec(header=header)).__name__
+    except ValueError:
+        return None
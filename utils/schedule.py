@@ -0,0 +1,102 @@
+"""
+内存调度 - 根据文件头估算解码后的内存占用，在内存预算内安排批处理任务
+"""
+
+import heapq
+import itertools
+
+from .scan import file_stat
+
+# 处理期间同时存在的完整像素缓冲区数量：解码结果、流水线的两个工作缓冲区
+DEFAULT_PIPELINE_FACTOR = 3.0
+
+# 无法读取文件头时，按文件大小的倍数粗略估算解码后的大小
+_UNKNOWN_EXPANSION = 10
+
+
+def estimate_memory(file_path, pipeline_factor=DEFAULT_PIPELINE_FACTOR):
+    """
+    估算处理一个文件时的峰值内存 (字节)
+
+    只读取文件头中的尺寸和颜色模式，不解码像素。
+
+    参数:
+        file_path: 文件路径
+        pipeline_factor: 峰值内存相对于解码后像素数据大小的倍数
+
+    返回:
+        估算的字节数
+    """
+    from formats import probe_image
+
+    try:
+        width, height, color_mode = probe_image(file_path)
+        decoded = width * height * len(color_mode)
+    except (OSError, ValueError, NotImplementedError):
+        try:
+            decoded = file_stat(file_path).st_size * _UNKNOWN_EXPANSION
+        except OSError:
+            decoded = 0
+    return int(decoded * pipeline_factor)
+
+
+class MemoryScheduler:
+    """
+    在内存预算内决定下一个提交的文件
+
+    候选文件按估算的内存从大到小排序，大图像优先提交，不会集中在队列末尾
+    导致最后只剩一个大任务在运行。最大的候选放不进剩余预算时不提交任何任务，
+    等待已有任务释放内存，而不是让小图像一直插队。
+
+    参数:
+        budget: 内存预算 (字节)
+        lookahead: 参与排序的候选文件数
+        pipeline_factor: 传给 estimate_memory 的倍数
+    """
+
+    def __init__(self, budget, lookahead=64, pipeline_factor=DEFAULT_PIPELINE_FACTOR):
+        if budget <= 0:
+            raise ValueError("内存预算必须大于0")
+        self.budget = budget
+        self.lookahead = lookahead
+        self.pipeline_factor = pipeline_factor
+        self.in_use = 0
+        self._heap = []
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    @property
+    def wants_more(self):
+        """候选数是否少于 lookahead"""
+        return len(self._heap) < self.lookahead
+
+    def push(self, file_path):
+        """加入一个候选文件"""
+        cost = estimate_memory(file_path, self.pipeline_factor)
+        # 计数器保证估算相同的文件按输入顺序出队
+        heapq.heappush(self._heap, (-cost, next(self._counter), file_path))
+
+    def pop(self, force=False):
+        """
+        取出估算最大的候选文件
+
+        参数:
+            force: 即使超出预算也取出 (没有任务在运行时使用，保证单个超大文件也能处理)
+
+        返回:
+            (文件路径, 估算字节数)；没有候选或预算不足时返回None
+        """
+        if not self._heap:
+            return None
+        cost = -self._heap[0][0]
+        if not force and self.in_use + cost > self.budget:
+            return None
+        _, _, file_path = heapq.heappop(self._heap)
+        self.in_use += cost
+        return file_path, cost
+
+    def release(self, cost):
+        """任务完成后归还其估算的内存"""
+        self.in_use -= cost